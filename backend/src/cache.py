@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import asyncpg
+from prometheus_client import Counter, Gauge
+
+CACHE_REQUESTS = Counter('response_cache_requests_total', 'Response cache lookups', ['endpoint', 'result'])
+CACHE_EVICTIONS = Counter('response_cache_evictions_total', 'Response cache entries dropped', ['reason'])
+CACHE_ENTRIES = Gauge('response_cache_entries', 'Entries held by the response cache')
+
+WATERMARK_CHANNEL = 'ingestion_watermark'
+# Changes whenever a watermark row is added or removed or a day's content is
+# written, even one that changed no raw rows, but not when a day is skipped
+WATERMARK_VERSION_SQL = """
+    SELECT COUNT(*) || ':' || COALESCE(SUM(rows_ingested), 0) || ':' || COALESCE(SUM(revision), 0)
+    FROM ingestion_watermark
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore(object):
+    """LRU of (version, expires_at, value) in this process"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version or entry[1] <= now:
+                del self._entries[key]
+                CACHE_EVICTIONS.labels(reason='stale' if entry[0] != version else 'ttl').inc()
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, version, expires_at, value):
+        with self._lock:
+            self._entries[key] = (version, expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(reason='lru').inc()
+
+    def drop_stale(self, version):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[0] != version]
+            for key in stale:
+                del self._entries[key]
+        CACHE_EVICTIONS.labels(reason='stale').inc(len(stale))
+
+    def clear(self):
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+        CACHE_EVICTIONS.labels(reason='invalidated').inc(dropped)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore(object):
+    """
+    The same LRU in a local SQLite file, shared by every worker process on
+    the host. Values are pickled, so a page computed by one worker serves
+    the others.
+    """
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                value BLOB NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+
+    def get(self, key, version, now):
+        with self._lock:
+            row = self._db.execute("SELECT version, expires_at, value FROM response_cache WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] != version or row[1] <= now:
+                self._db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                CACHE_EVICTIONS.labels(reason='stale' if row[0] != version else 'ttl').inc()
+                return None
+            self._db.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[2])
+
+    def set(self, key, version, expires_at, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                             (key, version, expires_at, time.time(), blob))
+            evicted = self._db.execute("""
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+        CACHE_EVICTIONS.labels(reason='lru').inc(max(0, evicted))
+
+    def drop_stale(self, version):
+        with self._lock:
+            dropped = self._db.execute("DELETE FROM response_cache WHERE version <> ?", (version,)).rowcount
+        CACHE_EVICTIONS.labels(reason='stale').inc(max(0, dropped))
+
+    def clear(self):
+        with self._lock:
+            dropped = self._db.execute("DELETE FROM response_cache").rowcount
+        CACHE_EVICTIONS.labels(reason='invalidated').inc(max(0, dropped))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache(object):
+    """
+    Results of read endpoints keyed by endpoint and normalized request
+    parameters. Every entry is tagged with the ingestion watermark version
+    it was computed under, and a new version makes all older entries
+    misses, so cached data is dropped when ingestion commits rather than
+    on a timer. The TTL only bounds results that depend on the clock,
+    e.g. "no data in the last 48 hours".
+    """
+    def __init__(self, max_entries=1024, ttl=300.0, sqlite_path=None):
+        self.ttl = ttl
+        self.store = SQLiteStore(sqlite_path, max_entries) if sqlite_path else MemoryStore(max_entries)
+        self.version = None
+
+    @staticmethod
+    def key(endpoint, **params):
+        """Parameter order, list order and duplicates in lists don't change the key"""
+        normalized = {name: sorted(set(value)) if isinstance(value, (list, tuple, set)) else value
+                      for name, value in params.items()}
+        return endpoint + json.dumps(normalized, sort_keys=True, default=str)
+
+    async def get_or_compute(self, endpoint, compute, **params):
+        """The cached result for `params`, or the result of awaiting `compute()` which is then cached"""
+        key = self.key(endpoint, **params)
+        version = self.version
+        if version is not None:
+            value = self.store.get(key, version, time.time())
+            if value is not None:
+                CACHE_REQUESTS.labels(endpoint=endpoint, result='hit').inc()
+                return value
+        CACHE_REQUESTS.labels(endpoint=endpoint, result='miss').inc()
+        value = await compute()
+        # Only cache under a known version that didn't move while computing
+        if version is not None and version == self.version:
+            self.store.set(key, version, time.time() + self.ttl, value)
+            CACHE_ENTRIES.set(len(self.store))
+        return value
+
+    def set_version(self, version):
+        if version != self.version:
+            self.version = version
+            self.store.drop_stale(version)
+            CACHE_ENTRIES.set(len(self.store))
+
+    def invalidate(self):
+        """Drop everything, for writes that don't go through the ingestion watermark"""
+        self.store.clear()
+        CACHE_ENTRIES.set(0)
+
+
+class WatermarkWatcher(object):
+    """
+    Keeps the cache version in step with ingestion_watermark. A dedicated
+    connection LISTENs on the channel the watermark trigger notifies, and
+    the version is also re-read every `poll_interval` seconds in case a
+    notification is lost while reconnecting. Until the first version is
+    read the cache is bypassed.
+    """
+    def __init__(self, connect_kwargs, cache, poll_interval=30.0):
+        self.connect_kwargs = connect_kwargs
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notified(self, connection, pid, channel, payload):
+        self._changed.set()
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**self.connect_kwargs)
+                await conn.add_listener(WATERMARK_CHANNEL, self._notified)
+                while True:
+                    self._changed.clear()
+                    self.cache.set_version(await conn.fetchval(WATERMARK_VERSION_SQL))
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+                logger.warning(f"Watermark watcher lost its connection, cache bypassed until it is back: {str(e)}")
+                self.cache.version = None
+                await asyncio.sleep(self.poll_interval)
+            finally:
+                if conn is not None:
+                    await conn.close()
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from .pool import ACTIVE_CONNECTIONS, POOL_RECYCLED, POOL_TIMEOUTS, POOL_WAIT, PoolTimeout
+
+
+class AsyncDatabase(object):
+    """
+    asyncpg counterpart of ConnectionPool for the async endpoints. Every
+    query borrows its own connection, so independent queries of one
+    request can run concurrently with gather(). asyncpg prepares each
+    statement once per connection and keeps it in the statement cache,
+    later executions only send the parameters. Like ConnectionPool, a
+    connection older than `max_lifetime` is closed when it is returned and
+    the pool opens a fresh one in its place.
+    """
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0, max_lifetime=1800.0,
+                 statement_cache_size=256, name='async'):
+        self.connect_kwargs = connect_kwargs
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.statement_cache_size = statement_cache_size
+        # Backend pid -> when its connection was opened, by the pool's init hook
+        self._created = {}
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    **self.connect_kwargs,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    statement_cache_size=self.statement_cache_size,
+                    init=self._init_connection,
+                )
+                self._update_gauges()
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _init_connection(self, conn):
+        pid = conn.get_server_pid()
+        self._created[pid] = time.monotonic()
+        conn.add_termination_listener(lambda _: self._created.pop(pid, None))
+
+    def _expired(self, conn):
+        try:
+            created = self._created.get(conn.get_server_pid())
+        except asyncpg.InterfaceError:
+            # Closed by the caller and already handed back
+            return False
+        return created is not None and time.monotonic() - created > self.max_lifetime
+
+    def _update_gauges(self):
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        ACTIVE_CONNECTIONS.labels(pool=self.name, state='in_use').set(size - idle)
+        ACTIVE_CONNECTIONS.labels(pool=self.name, state='idle').set(idle)
+
+    @asynccontextmanager
+    async def connection(self):
+        pool = self._pool or await self.open()
+        start = time.monotonic()
+        try:
+            conn = await pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            POOL_TIMEOUTS.labels(pool=self.name).inc()
+            raise PoolTimeout(f"No database connection available within {self.timeout:.1f} seconds")
+        POOL_WAIT.labels(pool=self.name).observe(time.monotonic() - start)
+        self._update_gauges()
+        try:
+            yield conn
+        finally:
+            if self._expired(conn):
+                # Closing hands the slot back, the pool reconnects it on a later acquire
+                await conn.close()
+                POOL_RECYCLED.labels(pool=self.name, reason='max_lifetime').inc()
+            else:
+                await pool.release(conn)
+            self._update_gauges()
+
+    async def fetch(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def execute(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.execute(query, *args)
+
+    def stats(self):
+        if self._pool is None:
+            return {'in_use': 0, 'idle': 0, 'max_size': self.max_size}
+        idle = self._pool.get_idle_size()
+        return {'in_use': self._pool.get_size() - idle, 'idle': idle, 'max_size': self.max_size}
@@ -0,0 +1,60 @@
+"""
+Downsampling of time series for charts.
+
+m4_points expands the rows of queries.m4_query into the points of each
+series, lttb then picks the `threshold` points that keep the largest
+triangle areas (Largest-Triangle-Three-Buckets, Steinarsson 2013).
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def m4_points(rows) -> Dict[int, List[Tuple[datetime, float]]]:
+    """Per participant, the time-ordered first/min/max/last points of every M4 bucket, without duplicates"""
+    series = defaultdict(list)
+    for row in rows:
+        bucket_points = {}
+        for time_index, value_index in ((2, 3), (6, 7), (8, 9), (4, 5)):
+            if row[time_index] is not None and row[value_index] is not None:
+                bucket_points.setdefault(row[time_index], float(row[value_index]))
+        series[row[0]].extend(sorted(bucket_points.items()))
+    return series
+
+
+def lttb(times: np.ndarray, values: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the `threshold` points LTTB keeps, first and last point always included"""
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = times.astype(np.float64)
+    y = values.astype(np.float64)
+    # Points between the fixed first and last go into threshold - 2 buckets
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket, the last point for the final bucket
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_series(points: List[Tuple[datetime, float]], threshold: int) -> List[Tuple[datetime, float]]:
+    if len(points) <= threshold:
+        return points
+    times = np.array([t.timestamp() for t, _ in points])
+    values = np.array([v for _, v in points])
+    return [points[i] for i in lttb(times, values, threshold)]
@@ -0,0 +1,172 @@
+"""
+Encoders that build responses straight from database rows, without a
+dict or model object per row. The chunk encoders serve the streaming
+export and turn batches of rows into bytes as they come off the
+server-side cursor, so nothing but the current batch is held in memory.
+columnar_json and arrow_ipc are the compact page formats of /data.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Sequence
+
+from .queries import Relation
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.metrics.columnar+json"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Same field names as the items of /data
+EXPORT_FIELD_NAMES = {"bucket": "timestamp"}
+# Constant within a page, so the compact formats carry it in the metadata only
+SHARED_COLUMNS = ("metric_type",)
+
+
+def export_columns(relation: Relation) -> List[str]:
+    return [EXPORT_FIELD_NAMES.get(column, column) for column in relation.columns]
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class NDJSONEncoder(object):
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        return "".join(json.dumps(dict(zip(self.columns, row)), default=_json_default) + "\n" for row in rows).encode()
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class CSVEncoder(NDJSONEncoder):
+    media_type = "text/csv"
+    extension = "csv"
+
+    def _write(self, rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def header(self) -> bytes:
+        return self._write([self.columns])
+
+    def encode(self, rows) -> bytes:
+        return self._write([value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows)
+
+
+def arrow_schema(columns: Sequence[str], metadata=None):
+    types = {"participant_id": pa.int32(), "timestamp": pa.timestamp("us", tz="UTC"), "metric_type": pa.string(),
+             "imputed": pa.bool_()}
+    return pa.schema([(column, types.get(column, pa.float64())) for column in columns], metadata=metadata)
+
+
+def arrow_table(column_values, schema):
+    """A table from one sequence of values per schema field"""
+    arrays = [pa.array(values, type=field.type) for values, field in zip(column_values, schema)]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _compact_columns(columns: Sequence[str], rows):
+    """Names and transposed values of the columns that vary between rows"""
+    transposed = list(zip(*rows)) if rows else [()] * len(columns)
+    kept = [i for i, column in enumerate(columns) if column not in SHARED_COLUMNS]
+    return [columns[i] for i in kept], [transposed[i] for i in kept]
+
+
+def columnar_json(columns: Sequence[str], rows, metadata: dict) -> bytes:
+    """
+    {"columns": {name: [values]}, "metadata": {...}}, with timestamps as
+    epoch milliseconds. Parallel arrays repeat no keys per point.
+    """
+    names, values = _compact_columns(columns, rows)
+    payload = {}
+    for name, column in zip(names, values):
+        if name == "timestamp":
+            payload[name] = [round(ts.timestamp() * 1000) for ts in column]
+        else:
+            payload[name] = list(column)
+    body = {"columns": payload, "metadata": dict(metadata, timestamp_unit="ms")}
+    return json.dumps(body, default=_json_default, separators=(",", ":")).encode()
+
+
+def arrow_ipc(columns: Sequence[str], rows, metadata: dict) -> bytes:
+    """An Arrow IPC stream of one record batch, the page metadata is JSON in the schema metadata"""
+    if pa is None:
+        raise RuntimeError("Arrow responses require pyarrow")
+    names, values = _compact_columns(columns, rows)
+    schema = arrow_schema(names, metadata={"metadata": json.dumps(metadata, default=_json_default)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(arrow_table(values, schema))
+    return sink.getvalue().to_pybytes()
+
+
+class _ChunkSink(object):
+    """Write-only file that hands out what was written since the last drain, pyarrow only needs write and tell"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class ParquetEncoder(NDJSONEncoder):
+    """One row group per batch, the footer is written once the cursor is exhausted"""
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self, columns: Sequence[str]):
+        if pa is None:
+            raise RuntimeError("Parquet export requires pyarrow")
+        super().__init__(columns)
+        self.schema = arrow_schema(self.columns)
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+
+    def encode(self, rows) -> bytes:
+        self.writer.write_table(arrow_table(list(zip(*rows)), self.schema))
+        return self.sink.drain()
+
+    def footer(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+
+ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "parquet": ParquetEncoder}
@@ -0,0 +1,207 @@
+"""
+Gap filling for raw_data.
+
+A series is processed one day at a time, so a year at 1 Hz never holds
+more than a day of points (plus `max_gap` of context on either side) in
+memory. Within a day, a gap is a pair of consecutive measured points
+further apart than `min_gap` and at most `max_gap`; the points on the
+`resolution` grid strictly inside it are filled with one of the
+vectorized methods below and written back flagged `imputed`. Longer gaps
+are left alone, nothing sensible can be interpolated across hours of
+missing data. Re-running a day first deletes what an earlier run imputed
+there, so jobs can be repeated with other methods or parameters.
+
+Imputed points only ever live in raw_data. participant_metric_stats,
+daily_coverage and coverage_interval describe measurements, so writing or
+deleting imputed points leaves them alone, and a measurement ingested over
+an imputed point is counted there as a new one.
+
+Timestamps are float epoch seconds throughout.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from .queries import time_range
+
+SECONDS_PER_DAY = 86400
+
+
+class ImputationMethod(str, Enum):
+    LINEAR = "linear"
+    LOCF = "locf"
+    SPLINE = "spline"
+    SEASONAL_MEAN = "seasonal_mean"
+
+
+@dataclass(frozen=True)
+class GapPolicy:
+    resolution: float = 1.0
+    min_gap: float = 60.0
+    max_gap: float = 3600.0
+    # Width of the time-of-day slots averaged by seasonal_mean
+    slot_seconds: int = 300
+    # Days before the range that feed the seasonal profile
+    profile_days: int = 14
+
+
+def gap_grid(times: np.ndarray, start: float, end: float, policy: GapPolicy) -> np.ndarray:
+    """The grid points in [start, end) strictly inside the gaps of the sorted `times`"""
+    if len(times) < 2:
+        return np.empty(0)
+    spans = np.diff(times)
+    gaps = np.flatnonzero((spans > policy.min_gap) & (spans <= policy.max_gap))
+    if len(gaps) == 0:
+        return np.empty(0)
+    step = policy.resolution
+    first = (np.floor(times[gaps] / step) + 1) * step
+    last = times[gaps + 1]
+    counts = np.maximum(0, np.ceil((last - first) / step)).astype(np.int64)
+    # One arange over all gaps: the offset of each point within its own gap
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    grid = np.repeat(first, counts) + offsets * step
+    return grid[(grid >= start) & (grid < end)]
+
+
+def linear(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    return np.interp(grid, times, values)
+
+
+def locf(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Last observation carried forward"""
+    return values[np.searchsorted(times, grid, side="right") - 1]
+
+
+def spline(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """
+    Monotone piecewise cubic (PCHIP, Fritsch-Carlson slopes). Unlike a
+    natural spline it never overshoots the neighbouring measurements, so a
+    heart rate can't be invented above or below what was recorded around
+    the gap, and it needs no tridiagonal solve over the whole day.
+    """
+    if len(times) < 3:
+        return linear(times, values, grid)
+    h = np.diff(times)
+    delta = np.diff(values) / h
+    slopes = np.zeros_like(values)
+    same_sign = delta[:-1] * delta[1:] > 0
+    w1, w2 = 2 * h[1:] + h[:-1], h[1:] + 2 * h[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+    slopes[0], slopes[-1] = delta[0], delta[-1]
+
+    i = np.clip(np.searchsorted(times, grid, side="right") - 1, 0, len(times) - 2)
+    s = (grid - times[i]) / h[i]
+    h00, h10 = (1 + 2 * s) * (1 - s) ** 2, s * (1 - s) ** 2
+    h01, h11 = s ** 2 * (3 - 2 * s), s ** 2 * (s - 1)
+    return h00 * values[i] + h10 * h[i] * slopes[i] + h01 * values[i + 1] + h11 * h[i] * slopes[i + 1]
+
+
+def seasonal_mean(times: np.ndarray, values: np.ndarray, grid: np.ndarray, profile: np.ndarray,
+                  slot_seconds: int) -> np.ndarray:
+    """The participant's mean for the grid point's UTC time-of-day slot, linear where the slot was never measured"""
+    slots = ((grid % SECONDS_PER_DAY) // slot_seconds).astype(np.int64)
+    filled = profile[slots]
+    missing = np.isnan(filled)
+    if missing.any():
+        filled[missing] = linear(times, values, grid[missing])
+    return filled
+
+
+def impute(times: np.ndarray, values: np.ndarray, grid: np.ndarray, method: ImputationMethod,
+           profile: Optional[np.ndarray] = None, slot_seconds: int = 300) -> np.ndarray:
+    if method == ImputationMethod.LINEAR:
+        return linear(times, values, grid)
+    if method == ImputationMethod.LOCF:
+        return locf(times, values, grid)
+    if method == ImputationMethod.SPLINE:
+        return spline(times, values, grid)
+    if method == ImputationMethod.SEASONAL_MEAN:
+        return seasonal_mean(times, values, grid, profile, slot_seconds)
+    raise ValueError(f"Unknown imputation method '{method}'")
+
+
+MEASURED_SERIES_SQL = """
+    SELECT COALESCE(array_agg(EXTRACT(EPOCH FROM timestamp)::float8 ORDER BY timestamp), '{}'),
+           COALESCE(array_agg(value ORDER BY timestamp), '{}')
+    FROM raw_data
+    WHERE participant_id = $1 AND metric_type = $2 AND timestamp >= $3 AND timestamp < $4 AND NOT imputed
+"""
+
+SEASONAL_PROFILE_SQL = """
+    SELECT (EXTRACT(EPOCH FROM timestamp)::bigint % 86400) / $5 AS slot, AVG(value)
+    FROM raw_data
+    WHERE participant_id = $1 AND metric_type = $2 AND timestamp >= $3 AND timestamp < $4 AND NOT imputed
+    GROUP BY slot
+"""
+
+DELETE_IMPUTED_SQL = """
+    DELETE FROM raw_data
+    WHERE participant_id = $1 AND metric_type = $2 AND timestamp >= $3 AND timestamp < $4 AND imputed
+"""
+
+# A measurement ingested meanwhile wins over the imputed point, only the
+# points actually written are counted
+INSERT_IMPUTED_SQL = """
+    WITH inserted AS (
+        INSERT INTO raw_data (participant_id, timestamp, metric_type, value, imputed)
+        SELECT $1, to_timestamp(t), $2, v, TRUE
+        FROM unnest($3::float8[], $4::float8[]) AS u(t, v)
+        ON CONFLICT (participant_id, timestamp, metric_type) DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM inserted
+"""
+
+
+async def seasonal_profile(db, participant_id: int, metric: str, start, end, policy: GapPolicy) -> np.ndarray:
+    """Mean per time-of-day slot over the range and `profile_days` before it, NaN for slots without data"""
+    rows = await db.fetch(SEASONAL_PROFILE_SQL, participant_id, metric,
+                          start - timedelta(days=policy.profile_days), end, policy.slot_seconds)
+    profile = np.full(SECONDS_PER_DAY // policy.slot_seconds + 1, np.nan)
+    for slot, mean in rows:
+        profile[slot] = mean
+    return profile
+
+
+async def impute_day(db, participant_id: int, metric: str, day: date, method: ImputationMethod,
+                     policy: GapPolicy, tz: str = "UTC", profile: Optional[np.ndarray] = None) -> int:
+    """Replace the imputed points of one day, returns how many were written"""
+    start, end = time_range(day, day, tz)
+    context = timedelta(seconds=policy.max_gap)
+    async with db.connection() as conn:
+        async with conn.transaction():
+            times, values = await conn.fetchrow(MEASURED_SERIES_SQL, participant_id, metric,
+                                                start - context, end + context)
+            await conn.execute(DELETE_IMPUTED_SQL, participant_id, metric, start, end)
+            times, values = np.array(times, dtype=np.float64), np.array(values, dtype=np.float64)
+            grid = gap_grid(times, start.timestamp(), end.timestamp(), policy)
+            if len(grid) == 0:
+                return 0
+            filled = impute(times, values, grid, method, profile, policy.slot_seconds)
+            return await conn.fetchval(INSERT_IMPUTED_SQL, participant_id, metric, grid.tolist(), filled.tolist())
+
+
+async def impute_range(db, participant_id: int, metric: str, start_date: date, end_date: date,
+                       method: ImputationMethod, policy: GapPolicy, tz: str = "UTC",
+                       progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+    """
+    Impute every day of [start_date, end_date], returns the points written.
+    `progress(days_done, points)` is awaited after each day.
+    """
+    profile = None
+    if method == ImputationMethod.SEASONAL_MEAN:
+        start, end = time_range(start_date, end_date, tz)
+        profile = await seasonal_profile(db, participant_id, metric, start, end, policy)
+
+    total = 0
+    for offset in range((end_date - start_date).days + 1):
+        total += await impute_day(db, participant_id, metric, start_date + timedelta(days=offset),
+                                  method, policy, tz, profile)
+        if progress is not None:
+            await progress(offset + 1, total)
+    return total
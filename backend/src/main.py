@@ -1,22 +1,36 @@
-from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 import os
+import asyncpg
 import psycopg2
 from dotenv import load_dotenv
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 import logging
 from contextlib import contextmanager
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import asyncio
 import time
 from enum import Enum
+from zoneinfo import ZoneInfo
 from typing import Dict, Any
+from .cache import ResponseCache, WatermarkWatcher
+from .db import AsyncDatabase
+from .downsample import downsample_series, m4_points
+from .export import (ARROW_STREAM_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, ENCODERS, arrow_ipc, columnar_json,
+                     export_columns)
+from .imputation import GapPolicy, ImputationMethod, impute_range
+from .pagination import merged_page, parse_cursor
+from .pool import ConnectionPool, PoolTimeout
+from .queries import (ADHERENCE_SQL, ADHERENCE_WINDOW_DAYS, COVERAGE_GAPS_SQL, COVERAGE_SQL, METRIC_CATALOG_SQL, NUMERIC,
+                      RELATIONS, ROLLUP_LEVELS_SQL, coarsest_relation, count_query, determine_aggregation_level,
+                      load_rollup_levels, m4_query, select_relation, series_query, time_range)
 
 REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
 REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency')
-ACTIVE_CONNECTIONS = Gauge('active_database_connections', 'Active database connections')
 DATA_POINTS_PROCESSED = Counter('data_points_processed_total', 'Total data points processed')
 
 class Config(BaseSettings):
@@ -26,6 +40,18 @@ class Config(BaseSettings):
     DB_USER: str = Field(..., env="DB_USER")
     DB_PASSWORD: str = Field(..., env="DB_PASSWORD")
     DEFAULT_PAGE_LIMIT: int = Field(100, env="DEFAULT_PAGE_LIMIT")
+    EXPORT_CHUNK_SIZE: int = Field(10000, env="EXPORT_CHUNK_SIZE")
+    TIMEZONE: str = Field("UTC", env="TIMEZONE")
+    DB_POOL_MIN_SIZE: int = Field(1, env="DB_POOL_MIN_SIZE")
+    DB_POOL_MAX_SIZE: int = Field(10, env="DB_POOL_MAX_SIZE")
+    DB_POOL_TIMEOUT: float = Field(5.0, env="DB_POOL_TIMEOUT")
+    DB_POOL_MAX_LIFETIME: float = Field(1800.0, env="DB_POOL_MAX_LIFETIME")
+    DB_POOL_HEALTH_CHECK_INTERVAL: float = Field(30.0, env="DB_POOL_HEALTH_CHECK_INTERVAL")
+    CACHE_MAX_ENTRIES: int = Field(1024, env="CACHE_MAX_ENTRIES")
+    CACHE_TTL: float = Field(300.0, env="CACHE_TTL")
+    CACHE_SQLITE_PATH: Optional[str] = Field(None, env="CACHE_SQLITE_PATH")
+    CACHE_WATERMARK_POLL_INTERVAL: float = Field(30.0, env="CACHE_WATERMARK_POLL_INTERVAL")
+    IMPUTATION_SYNC_MAX_DAYS: int = Field(7, env="IMPUTATION_SYNC_MAX_DAYS")
 
     class Config:
         env_file = ".env"
@@ -37,27 +63,65 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 file_handler = logging.FileHandler('app.log')
 
+db_pool = ConnectionPool(
+    {
+        "host": config.DB_HOST,
+        "port": config.DB_PORT,
+        "database": config.DB_NAME,
+        "user": config.DB_USER,
+        "password": config.DB_PASSWORD,
+    },
+    min_size=config.DB_POOL_MIN_SIZE,
+    max_size=config.DB_POOL_MAX_SIZE,
+    timeout=config.DB_POOL_TIMEOUT,
+    max_lifetime=config.DB_POOL_MAX_LIFETIME,
+    health_check_interval=config.DB_POOL_HEALTH_CHECK_INTERVAL,
+)
+
+async_db = AsyncDatabase(
+    {
+        "host": config.DB_HOST,
+        "port": config.DB_PORT,
+        "database": config.DB_NAME,
+        "user": config.DB_USER,
+        "password": config.DB_PASSWORD,
+    },
+    min_size=config.DB_POOL_MIN_SIZE,
+    max_size=config.DB_POOL_MAX_SIZE,
+    timeout=config.DB_POOL_TIMEOUT,
+    max_lifetime=config.DB_POOL_MAX_LIFETIME,
+)
+
+response_cache = ResponseCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl=config.CACHE_TTL,
+    sqlite_path=config.CACHE_SQLITE_PATH,
+)
+
+watermark_watcher = WatermarkWatcher(
+    {
+        "host": config.DB_HOST,
+        "port": config.DB_PORT,
+        "database": config.DB_NAME,
+        "user": config.DB_USER,
+        "password": config.DB_PASSWORD,
+    },
+    response_cache,
+    poll_interval=config.CACHE_WATERMARK_POLL_INTERVAL,
+)
+
 @contextmanager
 def db_cursor():
-    ACTIVE_CONNECTIONS.inc()
-    conn = psycopg2.connect(
-        host=config.DB_HOST,
-        port=config.DB_PORT,
-        database=config.DB_NAME,
-        user=config.DB_USER,
-        password=config.DB_PASSWORD
-    )
-    try:
-        yield conn.cursor()
-    finally:
-        ACTIVE_CONNECTIONS.dec()
-        conn.close()
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
 
 class RawDataItem(BaseModel):
     participant_id: int
     timestamp: datetime
     metric_type: str
     value: float
+    imputed: bool = False
     aggregation_level: str
 
 class AggregatedDataItem(BaseModel):
@@ -75,12 +139,58 @@ class MetadataModel(BaseModel):
     participant_ids: List[int]
     start_date: date
     end_date: date
-    next_cursor: Optional[datetime]
+    next_cursor: Optional[str]
 
 class DataResponse(BaseModel):
     data: List[Union[RawDataItem, AggregatedDataItem]]
     metadata: MetadataModel
 
+class DownsampleMethod(str, Enum):
+    M4 = "m4"
+    LTTB = "lttb"
+
+class DownsampledPoint(BaseModel):
+    participant_id: int
+    timestamp: datetime
+    value: float
+
+class DownsampledMetadata(BaseModel):
+    method: DownsampleMethod
+    source: str
+    bucket_seconds: float
+    target_points: int
+    total_points: int
+    participant_ids: List[int]
+    start_date: date
+    end_date: date
+
+class DownsampledResponse(BaseModel):
+    data: List[DownsampledPoint]
+    metadata: DownsampledMetadata
+
+class CoverageGap(BaseModel):
+    start: datetime
+    end: datetime
+    duration_seconds: float
+
+class CoverageResponse(BaseModel):
+    participant_id: int
+    metric_type: str
+    start_date: date
+    end_date: date
+    range_seconds: float
+    covered_seconds: float
+    coverage_percentage: float
+    runs: int
+    gaps: List[CoverageGap]
+    last_timestamp: Optional[datetime]
+    last_ingested: Optional[datetime]
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
 class AdherenceStatus(str, Enum):
     NO_TOKEN = "no_token"
     NO_DATA_48H = "no_data_48h"
@@ -111,7 +221,11 @@ class ImputationRequest(BaseModel):
     participant_id: int
     start_date: date
     end_date: date
-    method: str = "linear"
+    method: ImputationMethod = ImputationMethod.LINEAR
+    metric: str = "heart_rate"
+    resolution_seconds: float = Field(1.0, gt=0, description="Spacing of the imputed points")
+    min_gap_seconds: float = Field(60.0, gt=0, description="Shorter spacing between measurements isn't a gap")
+    max_gap_seconds: float = Field(3600.0, gt=0, description="Longer gaps are left unfilled")
 
 class ImputationResponse(BaseModel):
     participant_id: int
@@ -119,6 +233,12 @@ class ImputationResponse(BaseModel):
     method_used: str
     start_date: date
     end_date: date
+    metric_type: str
+    status: str
+    days_done: int
+    days_total: int
+    job_id: Optional[int] = None
+    error: Optional[str] = None
 
 class EmailRequest(BaseModel):
     participant_ids: List[int]
@@ -136,6 +256,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def open_db_pools():
+    try:
+        await asyncio.to_thread(db_pool.open)
+        await async_db.open()
+        load_rollup_levels(await async_db.fetch(ROLLUP_LEVELS_SQL))
+    except (psycopg2.Error, OSError, asyncpg.PostgresError, ValueError) as e:
+        logger.warning(f"Could not pre-open database connections or read the rollup catalog: {str(e)}")
+    watermark_watcher.start()
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    for task in imputation_tasks:
+        task.cancel()
+    await asyncio.gather(*imputation_tasks, return_exceptions=True)
+    await watermark_watcher.stop()
+    db_pool.close()
+    await async_db.close()
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 @app.middleware("http")
 async def metrics_middleware(request, call_next):
     start_time = time.time()
@@ -152,160 +295,231 @@ async def metrics_middleware(request, call_next):
     
     return response
 
-def determine_aggregation_level(start_date: date, end_date: date) -> str:
-    time_span = (end_date - start_date).days
-    if time_span <= 7:
-        return "raw"
-    elif time_span <= 30:
-        return "1m"
-    elif time_span <= 365:
-        return "1h"
-    else:
-        return "1d"
-
-def execute_optimized_query(
+async def fetch_page(
     participant_ids: List[int],
     start_date: date,
     end_date: date,
     agg_level: str,
-    cursor: Optional[datetime],
-    limit: int
-) -> tuple[List[Union[RawDataItem, AggregatedDataItem]], Optional[datetime]]:
-    """
-    Query data for given participants, aggregation level, and paginate by timestamp.
-    Returns a tuple of (records, next_cursor).
+    cursor: Optional[Tuple[datetime, Optional[int]]],
+    limit: int,
+    metric: str = "heart_rate",
+    include_imputed: bool = True
+) -> tuple[list, Optional[str]]:
     """
-    table_map = {
-        "raw": ("raw_data", "timestamp", ['participant_id', 'timestamp', 'metric_type', 'value']),
-        "1m": ("hr_1m", "bucket", ['participant_id', 'bucket', 'avg_hr', 'min_hr', 'max_hr']),
-        "1h": ("hr_1h", "bucket", ['participant_id', 'bucket', 'avg_hr', 'min_hr', 'max_hr']),
-        "1d": ("hr_1d", "bucket", ['participant_id', 'bucket', 'avg_hr', 'min_hr', 'max_hr']),
-    }
-    table, time_col, cols = table_map[agg_level]
-    select_cols = ", ".join(cols)
-
-    params = [participant_ids, start_date, end_date]
-    where_clause = f"participant_id = ANY(%s) AND {time_col}::date BETWEEN %s AND %s"
-    if cursor:
-        params.append(cursor)
-        where_clause += f" AND {time_col} > %s"
-
-    params.append(limit + 1)
-    sql = f"""
-        SELECT {select_cols}
-        FROM {table}
-        WHERE {where_clause}
-        ORDER BY {time_col} ASC
-        LIMIT %s
+    Query one page of rows for given participants and aggregation level, paginated by (timestamp, participant).
+    Returns a tuple of (rows in RELATIONS[agg_level].columns order, next_cursor).
     """
+    relation = RELATIONS[agg_level]
+    start, end = time_range(start_date, end_date, config.TIMEZONE)
 
-    with db_cursor() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
-    has_more = len(rows) == limit + 1
-    if has_more:
-        next_rec = rows[-1]
-        next_cursor = next_rec[cols.index(time_col)]
-        rows = rows[:-1]
-    else:
-        next_cursor = None
+    async with async_db.connection() as conn:
+        async with conn.transaction(readonly=True):
+            return await merged_page(conn, relation, participant_ids, start, end, limit, after=cursor,
+                                     metric=metric, include_imputed=include_imputed)
 
+def page_items(rows, agg_level: str) -> List[dict]:
+    """One RawDataItem or AggregatedDataItem dict per row"""
+    cols = list(RELATIONS[agg_level].columns)
     result = []
     for row in rows:
-        base = {"participant_id": row[0], "timestamp": row[cols.index(time_col)], "aggregation_level": agg_level}
+        base = {"participant_id": row[0], "timestamp": row[1], "aggregation_level": agg_level}
         if agg_level == "raw":
-            base.update({"metric_type": row[cols.index('metric_type')], "value": row[cols.index('value')]})
+            base.update({"metric_type": row[cols.index('metric_type')], "value": row[cols.index('value')],
+                         "imputed": row[cols.index('imputed')]})
         else:
             base.update({
-                "avg_value": row[cols.index('avg_hr')],
-                "min_value": row[cols.index('min_hr')],
-                "max_value": row[cols.index('max_hr')]
+                "avg_value": row[cols.index('avg_value')],
+                "min_value": row[cols.index('min_value')],
+                "max_value": row[cols.index('max_value')]
             })
         result.append(base)
-
-    return result, next_cursor
+    return result
 
 @app.get("/data", response_model=DataResponse)
-def get_data(
+async def get_data(
+    request: Request,
     metric: str = Query("heart_rate", description="Metric type to filter by"),
     start_date: date = Query(..., description="Start date (inclusive)"),
     end_date: date = Query(..., description="End date (inclusive)"),
     user_ids: Union[List[int], int] = Query(1, description="Participant ID(s)"),
     aggregation: Optional[str] = Query(None, description="Force specific aggregation level (raw, 1m, 1h, 1d)"),
-    cursor: Optional[datetime] = Query(None, description="Timestamp cursor for pagination"),
-    limit: int = Query(config.DEFAULT_PAGE_LIMIT, description="Max number of items per page")
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(config.DEFAULT_PAGE_LIMIT, ge=1, description="Max number of items per page"),
+    include_imputed: bool = Query(True, description="Include imputed points (raw level only, aggregates always include them)")
 ):
-    if metric != "heart_rate":
-        raise HTTPException(status_code=400, detail="Unsupported metric type. Only 'heart_rate' is supported.")
+    await check_metric(metric)
     if start_date > end_date:
         raise HTTPException(status_code=400, detail="Start date must be before end date.")
     if isinstance(user_ids, int):
         user_ids = [user_ids]
 
-    agg_level = aggregation if aggregation in ["raw", "1m", "1h", "1d"] else determine_aggregation_level(start_date, end_date)
+    try:
+        after = parse_cursor(cursor, config.TIMEZONE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected next_cursor of a previous page.")
+
+    agg_level, _ = select_relation(start_date, end_date, aggregation)
     logger.info(f"Using aggregation level: {agg_level} for span: {(end_date - start_date).days} days")
 
-    data, next_cursor = execute_optimized_query(user_ids, start_date, end_date, agg_level, cursor, limit)
+    if end_date < datetime.now(ZoneInfo(config.TIMEZONE)).date():
+        # Historical pages only change when ingestion backfills, which moves the watermark
+        async def compute_page():
+            rows, next_cursor = await fetch_page(user_ids, start_date, end_date, agg_level, after, limit, metric,
+                                                 include_imputed)
+            return [tuple(row) for row in rows], next_cursor
+
+        rows, next_cursor = await response_cache.get_or_compute(
+            "data", compute_page, metric=metric, participant_ids=user_ids, start_date=start_date,
+            end_date=end_date, aggregation=agg_level, cursor=cursor, limit=limit, include_imputed=include_imputed)
+    else:
+        rows, next_cursor = await fetch_page(user_ids, start_date, end_date, agg_level, after, limit, metric,
+                                             include_imputed)
+    metadata = {
+        "aggregation_level": agg_level,
+        "query_span_days": (end_date - start_date).days,
+        "total_points": len(rows),
+        "participant_ids": user_ids,
+        "start_date": start_date,
+        "end_date": end_date,
+        "next_cursor": next_cursor
+    }
+
+    # Compact formats are built straight from the rows, skipping the per-point models
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM_MEDIA_TYPE in accept or COLUMNAR_MEDIA_TYPE in accept:
+        columns = export_columns(RELATIONS[agg_level])
+        metadata["metric_type"] = metric
+        if ARROW_STREAM_MEDIA_TYPE in accept:
+            try:
+                return Response(arrow_ipc(columns, rows, metadata), media_type=ARROW_STREAM_MEDIA_TYPE)
+            except RuntimeError as e:
+                raise HTTPException(status_code=406, detail=str(e))
+        return Response(columnar_json(columns, rows, metadata), media_type=COLUMNAR_MEDIA_TYPE)
+
+    return {"data": page_items(rows, agg_level), "metadata": metadata}
+
+@app.get("/data/export")
+async def export_data(
+    metric: str = Query("heart_rate", description="Metric type to filter by"),
+    start_date: date = Query(..., description="Start date (inclusive)"),
+    end_date: date = Query(..., description="End date (inclusive)"),
+    user_ids: Union[List[int], int] = Query(1, description="Participant ID(s)"),
+    aggregation: Optional[str] = Query(None, description="Force specific aggregation level (raw, 1m, 1h, 1d)"),
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="ndjson, csv or parquet"),
+    include_imputed: bool = Query(True, description="Include imputed points (raw level only, aggregates always include them)")
+):
+    """
+    Stream the whole range in one response. Rows come off a server-side
+    cursor in chunks of EXPORT_CHUNK_SIZE and are encoded as they arrive,
+    so memory use doesn't grow with the range and the query is planned once.
+    """
+    await check_metric(metric)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date.")
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    agg_level, relation = select_relation(start_date, end_date, aggregation)
+    start, end = time_range(start_date, end_date, config.TIMEZONE)
+    sql, params = series_query(relation, user_ids, start, end, metric=metric, include_imputed=include_imputed,
+                               style=NUMERIC)
+    try:
+        encoder = ENCODERS[format.value](export_columns(relation))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    async def stream():
+        yield encoder.header()
+        async with async_db.connection() as conn:
+            # asyncpg cursors are server-side portals and only live inside a transaction
+            async with conn.transaction(readonly=True):
+                cur = await conn.cursor(sql, *params)
+                while True:
+                    rows = await cur.fetch(config.EXPORT_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    DATA_POINTS_PROCESSED.inc(len(rows))
+                    yield encoder.encode(rows)
+        yield encoder.footer()
+
+    filename = f"{metric}_{agg_level}_{start_date}_{end_date}.{encoder.extension}"
+    return StreamingResponse(stream(), media_type=encoder.media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/data/downsampled", response_model=DownsampledResponse)
+async def get_downsampled_data(
+    metric: str = Query("heart_rate", description="Metric type to filter by"),
+    start_date: date = Query(..., description="Start date (inclusive)"),
+    end_date: date = Query(..., description="End date (inclusive)"),
+    user_ids: Union[List[int], int] = Query(1, description="Participant ID(s)"),
+    points: int = Query(1000, ge=4, le=20000, description="Target number of points per participant"),
+    method: DownsampleMethod = Query(DownsampleMethod.LTTB, description="m4 (min/max per pixel) or lttb"),
+):
+    """
+    A chart-ready series of at most `points` points per participant. The
+    range is cut into pixel-wide buckets and reduced to first/min/max/last
+    per bucket (M4) in SQL, over the coarsest aggregate that still has a
+    row per bucket, so the cost depends on `points` and not on the span.
+    LTTB then picks `points` of these candidates.
+    """
+    await check_metric(metric)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date.")
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    start, end = time_range(start_date, end_date, config.TIMEZONE)
+    # M4 yields up to 4 points per bucket, LTTB gets a candidate per target point
+    buckets = points // 4 if method == DownsampleMethod.M4 else points
+    bucket_width = max(timedelta(seconds=1), timedelta(seconds=(end - start).total_seconds() // buckets))
+    level, relation = coarsest_relation(bucket_width)
+
+    sql, params = m4_query(relation, user_ids, start, end, bucket_width, metric=metric, style=NUMERIC)
+    rows = await async_db.fetch(sql, *params)
+
+    data = []
+    for participant_id, series in m4_points(rows).items():
+        if method == DownsampleMethod.LTTB:
+            series = downsample_series(series, points)
+        data.extend({"participant_id": participant_id, "timestamp": ts, "value": value} for ts, value in series)
 
     return {
         "data": data,
         "metadata": {
-            "aggregation_level": agg_level,
-            "query_span_days": (end_date - start_date).days,
+            "method": method,
+            "source": level,
+            "bucket_seconds": bucket_width.total_seconds(),
+            "target_points": points,
             "total_points": len(data),
             "participant_ids": user_ids,
             "start_date": start_date,
-            "end_date": end_date,
-            "next_cursor": next_cursor
+            "end_date": end_date
         }
     }
 
+def count_query_args(relation, participant_ids, start, end, metric="heart_rate"):
+    sql, params = count_query(relation, participant_ids, start, end, metric=metric, style=NUMERIC)
+    return (sql, *params)
+
 @app.get("/data/stats")
-def get_data_stats(
+async def get_data_stats(
     start_date: date = Query(..., description="Start date (inclusive)"),
     end_date: date = Query(..., description="End date (inclusive)"),
-    participant_ids: List[int] = Query([1], description="Participant ID(s) to get stats for")
+    participant_ids: List[int] = Query([1], description="Participant ID(s) to get stats for"),
+    metric: str = Query("heart_rate", description="Metric type to count")
 ):
-    with db_cursor() as cur:
-        cur.execute(
-            '''
-            SELECT COUNT(*)
-            FROM raw_data
-            WHERE participant_id = ANY(%s)
-              AND timestamp::date BETWEEN %s AND %s
-              AND metric_type = 'heart_rate'
-            ''',
-            (participant_ids, start_date, end_date)
-        )
-        raw_count = cur.fetchone()[0]
-
-        cur.execute(
-            '''
-            SELECT COUNT(*) FROM hr_1m
-            WHERE participant_id = ANY(%s) AND bucket::date BETWEEN %s AND %s
-            ''',
-            (participant_ids, start_date, end_date)
-        )
-        min_count = cur.fetchone()[0]
-
-        cur.execute(
-            '''
-            SELECT COUNT(*) FROM hr_1h
-            WHERE participant_id = ANY(%s) AND bucket::date BETWEEN %s AND %s
-            ''',
-            (participant_ids, start_date, end_date)
-        )
-        hour_count = cur.fetchone()[0]
-
-        cur.execute(
-            '''
-            SELECT COUNT(*) FROM hr_1d
-            WHERE participant_id = ANY(%s) AND bucket::date BETWEEN %s AND %s
-            ''',
-            (participant_ids, start_date, end_date)
-        )
-        day_count = cur.fetchone()[0]
+    await check_metric(metric)
+    return await response_cache.get_or_compute(
+        "data_stats", lambda: compute_data_stats(start_date, end_date, participant_ids, metric),
+        start_date=start_date, end_date=end_date, participant_ids=participant_ids, metric=metric)
+
+async def compute_data_stats(start_date: date, end_date: date, participant_ids: List[int], metric: str):
+    start, end = time_range(start_date, end_date, config.TIMEZONE)
+    levels = list(RELATIONS)
+    counts = await asyncio.gather(*[
+        async_db.fetchval(*count_query_args(RELATIONS[level], participant_ids, start, end, metric))
+        for level in levels
+    ])
 
     query_span_days = (end_date - start_date).days
     recommended_level = determine_aggregation_level(start_date, end_date)
@@ -313,7 +527,7 @@ def get_data_stats(
     return {
         "query_span_days": query_span_days,
         "recommended_aggregation": recommended_level,
-        "data_counts": {"raw": raw_count, "1m": min_count, "1h": hour_count, "1d": day_count},
+        "data_counts": dict(zip(levels, counts)),
         "participant_ids": participant_ids,
         "start_date": start_date,
         "end_date": end_date
@@ -325,7 +539,7 @@ def health_check():
     try:
         with db_cursor() as cur:
             cur.execute("SELECT 1")
-        return {"status": "ok", "database": "connected"}
+        return {"status": "ok", "database": "connected", "pool": db_pool.stats(), "async_pool": async_db.stats()}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
 
@@ -333,16 +547,29 @@ def health_check():
 def get_metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+async def available_metrics() -> dict:
+    """Metric type -> participant and point counts, for every metric with data"""
+    async def compute():
+        rows = await async_db.fetch(METRIC_CATALOG_SQL)
+        return {row[0]: {"participants": row[1], "points": int(row[2] or 0), "first_timestamp": row[3],
+                         "last_timestamp": row[4]} for row in rows}
+
+    return await response_cache.get_or_compute("metric_catalog", compute)
+
+async def check_metric(metric: str):
+    """400 for a metric without data, any metric is accepted while nothing has been ingested"""
+    metrics = await available_metrics()
+    if metrics and metric not in metrics:
+        raise HTTPException(status_code=400, detail=f"Unsupported metric type '{metric}'. "
+                                                    f"Available: {', '.join(sorted(metrics))}")
+
 @app.get("/metrics/summary")
-def get_metrics_summary():
+async def get_metrics_summary():
+    metrics = await available_metrics()
     return {
-        "supported_metrics": ["heart_rate"],
-        "aggregation_levels": {
-            "raw": "Raw data points (<= 7 days)",
-            "1m": "1-minute aggregates (8-30 days)",
-            "1h": "1-hour aggregates (31-365 days)",
-            "1d": "1-day aggregates (> 365 days)"
-        },
+        "supported_metrics": list(metrics),
+        "metrics": metrics,
+        "aggregation_levels": {level: relation.description for level, relation in RELATIONS.items()},
         "auto_selection": "Aggregation automatically selected based on time span"
     }
     
@@ -365,6 +592,7 @@ def create_participant(participant: ParticipantModel):
                 (participant.participant_id, participant.name, participant.token)
             )
             cur.connection.commit()
+            response_cache.invalidate()
             return participant
         except psycopg2.IntegrityError:
             raise HTTPException(status_code=400, detail="Participant already exists")
@@ -384,106 +612,209 @@ def get_participant(participant_id: int):
         
     return {"participant_id": row[0], "name": row[1], "token": row[2]}
 
+@app.get("/participants/{participant_id}/coverage", response_model=CoverageResponse)
+async def get_participant_coverage(
+    participant_id: int,
+    start_date: date = Query(..., description="Start date (inclusive)"),
+    end_date: date = Query(..., description="End date (inclusive)"),
+    metric: str = Query("heart_rate", description="Metric type"),
+    min_gap_minutes: float = Query(60.0, gt=0, description="Only list gaps at least this long"),
+    max_gaps: int = Query(1000, ge=1, le=10000, description="Max number of gaps listed")
+):
+    """
+    Coverage percentage, gaps and last-seen of one series, answered from
+    coverage_interval and participant_metric_stats without reading
+    raw_data. The range ends now at the latest, the future isn't a gap.
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date.")
+    await check_metric(metric)
+
+    async def compute():
+        start, end = time_range(start_date, end_date, config.TIMEZONE)
+        end = max(start, min(end, datetime.now(timezone.utc)))
+        (covered_seconds, runs), gaps, last = await asyncio.gather(
+            async_db.fetchrow(COVERAGE_SQL, participant_id, metric, start, end),
+            async_db.fetch(COVERAGE_GAPS_SQL, participant_id, metric, start, end,
+                           timedelta(minutes=min_gap_minutes), max_gaps),
+            async_db.fetchrow("""
+                SELECT last_timestamp, last_seen FROM participant_metric_stats
+                WHERE participant_id = $1 AND metric_type = $2
+            """, participant_id, metric)
+        )
+        range_seconds = (end - start).total_seconds()
+        return {
+            "participant_id": participant_id,
+            "metric_type": metric,
+            "start_date": start_date,
+            "end_date": end_date,
+            "range_seconds": range_seconds,
+            "covered_seconds": covered_seconds,
+            "coverage_percentage": min(100.0, covered_seconds / range_seconds * 100) if range_seconds else 0.0,
+            "runs": runs,
+            "gaps": [
+                {"start": gap_start, "end": gap_end, "duration_seconds": (gap_end - gap_start).total_seconds()}
+                for gap_start, gap_end in gaps
+            ],
+            "last_timestamp": last[0] if last else None,
+            "last_ingested": last[1] if last else None
+        }
+
+    return await response_cache.get_or_compute(
+        "coverage", compute, participant_id=participant_id, start_date=start_date, end_date=end_date,
+        metric=metric, min_gap_minutes=min_gap_minutes, max_gaps=max_gaps)
+
 @app.get("/adherence", response_model=AdherenceResponse)
-def get_adherence_overview():
+async def get_adherence_overview():
     """Get adherence overview for all participants"""
-    with db_cursor() as cur:
-        cur.execute("SELECT participant_id, name, token FROM participant ORDER BY participant_id")
-        participants = cur.fetchall()
-        
-        adherence_items = []
-        issues_count = 0
+    return await response_cache.get_or_compute("adherence", compute_adherence_overview)
+
+async def compute_adherence_overview():
+    rows = await async_db.fetch(ADHERENCE_SQL)
+    now = datetime.now(timezone.utc)
+    
+    adherence_items = []
+    issues_count = 0
+    
+    for participant_id, name, token, last_data, heart_rate_points, sleep_days in rows:
+        adherence_percentage = min(100.0, heart_rate_points / (ADHERENCE_WINDOW_DAYS * 86400) * 100)
+        sleep_upload_percentage = sleep_days / ADHERENCE_WINDOW_DAYS * 100
+        if not token:
+            status = AdherenceStatus.NO_TOKEN
+            details = "Participant has no authentication token"
+            issues_count += 1
+        elif not last_data or (now - last_data).total_seconds() > 172800:  # 48 hours
+            status = AdherenceStatus.NO_DATA_48H
+            details = "No data uploaded in the last 48 hours"
+            issues_count += 1
+        elif sleep_upload_percentage < 50:
+            status = AdherenceStatus.LOW_SLEEP
+            details = f"Low sleep upload percentage: {sleep_upload_percentage:.1f}%"
+            issues_count += 1
+        elif adherence_percentage < 70:
+            status = AdherenceStatus.LOW_ADHERENCE
+            details = f"Low adherence: {adherence_percentage:.1f}%"
+            issues_count += 1
+        else:
+            status = AdherenceStatus.GOOD
+            details = "All metrics within acceptable range"
         
-        for participant_id, name, token in participants:
-            cur.execute(
-                """
-                SELECT MAX(timestamp) 
-                FROM raw_data 
-                WHERE participant_id = %s AND metric_type = 'heart_rate'
-                """,
-                (participant_id,)
-            )
-            last_data = cur.fetchone()[0]
-            if participant_id == 1:
-                cur.execute(
-                    """
-                    SELECT COUNT(*) 
-                    FROM raw_data 
-                    WHERE participant_id = %s AND metric_type = 'heart_rate'
-                    AND timestamp >= NOW() - INTERVAL '7 days'
-                    """,
-                    (participant_id,)
-                )
-                recent_points = cur.fetchone()[0]
-                adherence_percentage = min(100.0, (recent_points / 604800) * 100)
-                sleep_upload_percentage = 85.0
-            else:
-                adherence_percentage = 0.0
-                sleep_upload_percentage = 0.0
-            
-            if not token:
-                status = AdherenceStatus.NO_TOKEN
-                details = "Participant has no authentication token"
-                issues_count += 1
-            elif not last_data or (datetime.now().replace(tzinfo=last_data.tzinfo) - last_data).total_seconds() > 172800:  # 48 hours
-                status = AdherenceStatus.NO_DATA_48H
-                details = "No data uploaded in the last 48 hours"
-                issues_count += 1
-            elif sleep_upload_percentage < 50:
-                status = AdherenceStatus.LOW_SLEEP
-                details = f"Low sleep upload percentage: {sleep_upload_percentage:.1f}%"
-                issues_count += 1
-            elif adherence_percentage < 70:
-                status = AdherenceStatus.LOW_ADHERENCE
-                details = f"Low adherence: {adherence_percentage:.1f}%"
-                issues_count += 1
-            else:
-                status = AdherenceStatus.GOOD
-                details = "All metrics within acceptable range"
-            
-            adherence_items.append({
-                "participant_id": participant_id,
-                "name": name,
-                "status": status,
-                "last_data_timestamp": last_data,
-                "adherence_percentage": adherence_percentage,
-                "sleep_upload_percentage": sleep_upload_percentage,
-                "details": details
-            })
+        adherence_items.append({
+            "participant_id": participant_id,
+            "name": name,
+            "status": status,
+            "last_data_timestamp": last_data,
+            "adherence_percentage": adherence_percentage,
+            "sleep_upload_percentage": sleep_upload_percentage,
+            "details": details
+        })
     
     return {
         "participants": adherence_items,
-        "total_participants": len(participants),
+        "total_participants": len(rows),
         "issues_count": issues_count
     }
 
+IMPUTATION_JOB_COLUMNS = """
+    job_id, participant_id, metric_type, method, start_date, end_date, status,
+    days_total, days_done, imputed_points, error
+"""
+
+imputation_tasks = set()
+
+def imputation_job_item(row) -> dict:
+    return {
+        "job_id": row["job_id"],
+        "participant_id": row["participant_id"],
+        "metric_type": row["metric_type"],
+        "method_used": row["method"],
+        "start_date": row["start_date"],
+        "end_date": row["end_date"],
+        "status": row["status"],
+        "days_total": row["days_total"],
+        "days_done": row["days_done"],
+        "imputed_points": row["imputed_points"],
+        "error": row["error"]
+    }
+
+async def run_imputation_job(job_id: int, request: ImputationRequest, policy: GapPolicy):
+    async def progress(days_done, points):
+        await async_db.execute("""
+            UPDATE imputation_job SET days_done = $2, imputed_points = $3, updated_at = NOW() WHERE job_id = $1
+        """, job_id, days_done, points)
+
+    async def finish(status, error=None):
+        await async_db.execute("""
+            UPDATE imputation_job SET status = $2, error = $3, updated_at = NOW() WHERE job_id = $1
+        """, job_id, status, error)
+
+    await finish("running")
+    try:
+        await impute_range(async_db, request.participant_id, request.metric, request.start_date, request.end_date,
+                           request.method, policy, config.TIMEZONE, progress)
+    except asyncio.CancelledError:
+        await finish("failed", "Interrupted by shutdown, days already done are kept")
+        raise
+    except Exception as e:
+        logger.exception(f"Imputation job {job_id} failed")
+        await finish("failed", str(e))
+    else:
+        await finish("completed")
+    finally:
+        response_cache.invalidate()
+
 @app.post("/imputation", response_model=ImputationResponse)
-def impute_missing_data(request: ImputationRequest):
-    """Impute missing data for a participant"""
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT COUNT(*) 
-            FROM raw_data 
-            WHERE participant_id = %s 
-            AND metric_type = 'heart_rate'
-            AND timestamp::date BETWEEN %s AND %s
-            """,
-            (request.participant_id, request.start_date, request.end_date)
-        )
-        existing_points = cur.fetchone()[0]
-        
-        expected_points = (request.end_date - request.start_date).days * 86400
-        missing_points = max(0, expected_points - existing_points)
-        
+async def impute_missing_data(request: ImputationRequest, response: Response):
+    """
+    Fill the gaps of a participant's series with imputed points, flagged
+    as such in raw_data. Ranges of up to IMPUTATION_SYNC_MAX_DAYS days are
+    imputed within the request; longer ones are queued as a background
+    job and answered with 202, poll GET /imputation/jobs/{job_id}.
+    """
+    if request.start_date > request.end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date.")
+    if request.min_gap_seconds >= request.max_gap_seconds:
+        raise HTTPException(status_code=400, detail="min_gap_seconds must be below max_gap_seconds.")
+    await check_metric(request.metric)
+
+    policy = GapPolicy(request.resolution_seconds, request.min_gap_seconds, request.max_gap_seconds)
+    days_total = (request.end_date - request.start_date).days + 1
+    if days_total <= config.IMPUTATION_SYNC_MAX_DAYS:
+        imputed_points = await impute_range(async_db, request.participant_id, request.metric, request.start_date,
+                                            request.end_date, request.method, policy, config.TIMEZONE)
+        response_cache.invalidate()
         return {
             "participant_id": request.participant_id,
-            "imputed_points": missing_points,
-            "method_used": request.method,
+            "imputed_points": imputed_points,
+            "method_used": request.method.value,
             "start_date": request.start_date,
-            "end_date": request.end_date
+            "end_date": request.end_date,
+            "metric_type": request.metric,
+            "status": "completed",
+            "days_done": days_total,
+            "days_total": days_total
         }
 
+    row = await async_db.fetchrow(f"""
+        INSERT INTO imputation_job (participant_id, metric_type, method, start_date, end_date, days_total)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING {IMPUTATION_JOB_COLUMNS}
+    """, request.participant_id, request.metric, request.method.value, request.start_date, request.end_date,
+        days_total)
+    task = asyncio.create_task(run_imputation_job(row["job_id"], request, policy))
+    imputation_tasks.add(task)
+    task.add_done_callback(imputation_tasks.discard)
+    response.status_code = 202
+    return imputation_job_item(row)
+
+@app.get("/imputation/jobs/{job_id}", response_model=ImputationResponse)
+async def get_imputation_job(job_id: int):
+    """Progress of a background imputation job"""
+    row = await async_db.fetchrow(f"SELECT {IMPUTATION_JOB_COLUMNS} FROM imputation_job WHERE job_id = $1", job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Imputation job not found")
+    return imputation_job_item(row)
+
 @app.post("/email/send")
 def send_email_to_participants(request: EmailRequest):
     """Send email to participants (mock implementation)"""
@@ -509,23 +840,19 @@ def send_email_to_participants(request: EmailRequest):
     }
 
 @app.get("/participants/{participant_id}/metrics")
-def get_participant_metrics(
+async def get_participant_metrics(
     participant_id: int,
     start_date: date = Query(..., description="Start date for metrics"),
     end_date: date = Query(..., description="End date for metrics")
 ):
     """Get comprehensive metrics for a specific participant"""
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT name FROM participant WHERE participant_id = %s",
-            (participant_id,)
-        )
-        participant = cur.fetchone()
-        
-        if not participant:
-            raise HTTPException(status_code=404, detail="Participant not found")
-        
-        cur.execute(
+    start, end = time_range(start_date, end_date, config.TIMEZONE)
+    participant, hr_stats, daily_summaries, hr_zones = await asyncio.gather(
+        async_db.fetchrow(
+            "SELECT name FROM participant WHERE participant_id = $1",
+            participant_id
+        ),
+        async_db.fetchrow(
             """
             SELECT 
                 AVG(value) as avg_hr,
@@ -533,37 +860,36 @@ def get_participant_metrics(
                 MAX(value) as max_hr,
                 COUNT(*) as total_points
             FROM raw_data 
-            WHERE participant_id = %s 
+            WHERE participant_id = $1 
             AND metric_type = 'heart_rate'
-            AND timestamp::date BETWEEN %s AND %s
+            AND timestamp >= $2 AND timestamp < $3
             """,
-            (participant_id, start_date, end_date)
-        )
-        hr_stats = cur.fetchone()
-        
-        cur.execute(
+            participant_id, start, end
+        ),
+        async_db.fetch(
             """
             SELECT date, resting_heart_rate 
             FROM daily_summaries 
-            WHERE participant_id = %s 
-            AND date BETWEEN %s AND %s
+            WHERE participant_id = $1 
+            AND date BETWEEN $2 AND $3
             ORDER BY date
             """,
-            (participant_id, start_date, end_date)
-        )
-        daily_summaries = cur.fetchall()
-        
-        cur.execute(
+            participant_id, start_date, end_date
+        ),
+        async_db.fetch(
             """
             SELECT zone_name, AVG(minutes) as avg_minutes, AVG(calories_out) as avg_calories
             FROM heart_rate_zones 
-            WHERE participant_id = %s 
-            AND date BETWEEN %s AND %s
+            WHERE participant_id = $1 
+            AND date BETWEEN $2 AND $3
             GROUP BY zone_name
             """,
-            (participant_id, start_date, end_date)
-        )
-        hr_zones = cur.fetchall()
+            participant_id, start_date, end_date
+        ),
+    )
+    
+    if not participant:
+        raise HTTPException(status_code=404, detail="Participant not found")
     
     return {
         "participant_id": participant_id,
@@ -586,40 +912,30 @@ def get_participant_metrics(
     }
 
 @app.get("/dashboard/summary")
-def get_dashboard_summary():
+async def get_dashboard_summary():
     """Get overall dashboard summary statistics"""
-    with db_cursor() as cur:
-        cur.execute("SELECT COUNT(*) FROM participant")
-        total_participants = cur.fetchone()[0]
-        
-        cur.execute("""
-            SELECT COUNT(DISTINCT participant_id) 
-            FROM raw_data 
-            WHERE metric_type = 'heart_rate'
-        """)
-        active_participants = cur.fetchone()[0]
-        
-        cur.execute("""
-            SELECT COUNT(*) 
-            FROM raw_data 
-            WHERE metric_type = 'heart_rate'
-        """)
-        total_data_points = cur.fetchone()[0]
-        
-        cur.execute("""
-            SELECT MIN(timestamp::date), MAX(timestamp::date) 
-            FROM raw_data 
-            WHERE metric_type = 'heart_rate'
-        """)
-        date_range = cur.fetchone()
+    return await response_cache.get_or_compute("dashboard_summary", compute_dashboard_summary)
+
+async def compute_dashboard_summary():
+    # participant_metric_stats holds one row per participant and series, so this never touches raw_data
+    total_participants, active_participants, total_data_points, first_date, last_date = await async_db.fetchrow("""
+        SELECT
+            (SELECT COUNT(*) FROM participant),
+            COUNT(*) FILTER (WHERE row_count > 0),
+            COALESCE(SUM(row_count), 0),
+            MIN(first_timestamp)::date,
+            MAX(last_timestamp)::date
+        FROM participant_metric_stats
+        WHERE metric_type = 'heart_rate'
+    """)
     
     return {
         "total_participants": total_participants,
         "active_participants": active_participants,
         "total_data_points": total_data_points,
         "data_date_range": {
-            "start_date": date_range[0],
-            "end_date": date_range[1]
-        } if date_range[0] else None,
+            "start_date": first_date,
+            "end_date": last_date
+        } if first_date else None,
         "system_status": "operational"
     }
@@ -0,0 +1,93 @@
+"""
+Keyset pagination over several participants' series at once.
+
+Pages are ordered by (timestamp, participant_id) and continue after a
+composite cursor "<ISO timestamp>|<participant_id>", so rows sharing a
+timestamp are never skipped at a page boundary. Each participant is read
+through its own server-side cursor over an index-ordered range scan, and
+the series are k-way merged with a heap. A page fetches at most
+`limit + 1` rows plus one chunk of read-ahead per participant, and costs
+O(limit * log k) to merge however long the range is.
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from .queries import NUMERIC, Relation, aware, participant_series_query
+
+CURSOR_SEPARATOR = "|"
+# Rows fetched from a participant's cursor at a time, at least
+MIN_CHUNK_SIZE = 32
+
+
+def encode_cursor(timestamp: datetime, participant_id: int) -> str:
+    """In UTC with a Z suffix, a "+" would turn into a space in an unencoded query string"""
+    utc = timestamp.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+    return f"{utc}{CURSOR_SEPARATOR}{participant_id}"
+
+
+def parse_cursor(cursor: Optional[str], tz: str = "UTC") -> Optional[Tuple[datetime, Optional[int]]]:
+    """
+    (timestamp, participant_id) of a cursor. A bare timestamp, the format
+    before composite cursors, parses with participant_id None and resumes
+    after every row at that timestamp as it used to. Raises ValueError.
+    """
+    if not cursor:
+        return None
+    timestamp, _, participant_id = cursor.partition(CURSOR_SEPARATOR)
+    return aware(datetime.fromisoformat(timestamp), tz), int(participant_id) if participant_id else None
+
+
+async def merged_page(conn, relation: Relation, participant_ids: List[int], start: datetime, end: datetime,
+                      limit: int, after: Optional[Tuple[datetime, Optional[int]]] = None,
+                      metric: Optional[str] = None, include_imputed: bool = True) -> Tuple[list, Optional[str]]:
+    """
+    Up to `limit` rows of `relation` after `after` in (time, participant_id)
+    order and the cursor of the next page, None on the last one. `conn`
+    must be inside a transaction, which server-side cursors live in.
+    """
+    if limit < 1:
+        return [], None
+    time_index = relation.columns.index(relation.time_column)
+    participant_ids = sorted(set(participant_ids))
+    chunk_size = max(MIN_CHUNK_SIZE, -(-(limit + 1) // max(1, len(participant_ids))))
+
+    streams = {}
+    heap = []
+
+    async def refill(participant_id):
+        """Next chunk of a participant's rows, queued behind the first one in the heap"""
+        cursor, _, _ = streams[participant_id]
+        rows = await cursor.fetch(chunk_size)
+        streams[participant_id] = (cursor, rows, 0)
+        if rows:
+            heapq.heappush(heap, (rows[0][time_index], participant_id))
+        return rows
+
+    for participant_id in participant_ids:
+        after_time, after_participant = after if after is not None else (None, None)
+        # (t, p) > (after_time, after_participant) is t >= after_time for higher ids, t > after_time otherwise
+        inclusive = after_participant is not None and participant_id > after_participant
+        sql, params = participant_series_query(relation, participant_id, start, end, after=after_time,
+                                               inclusive=inclusive, metric=metric,
+                                               include_imputed=include_imputed, style=NUMERIC)
+        streams[participant_id] = (await conn.cursor(sql, *params), [], 0)
+        await refill(participant_id)
+
+    page = []
+    while heap and len(page) <= limit:
+        _, participant_id = heapq.heappop(heap)
+        cursor, rows, position = streams[participant_id]
+        page.append(rows[position])
+        position += 1
+        if position < len(rows):
+            streams[participant_id] = (cursor, rows, position)
+            heapq.heappush(heap, (rows[position][time_index], participant_id))
+        elif len(rows) == chunk_size:
+            await refill(participant_id)
+
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        return page, encode_cursor(last[time_index], last[0])
+    return page, None
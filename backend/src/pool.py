@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from prometheus_client import Counter, Gauge, Histogram
+
+ACTIVE_CONNECTIONS = Gauge('active_database_connections', 'Database connections held by the pool', ['pool', 'state'])
+POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled database connection', ['pool'],
+                      buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+POOL_TIMEOUTS = Counter('db_pool_timeouts_total', 'Requests that gave up waiting for a pooled connection', ['pool'])
+POOL_RECYCLED = Counter('db_pool_recycled_total', 'Pooled connections closed and replaced', ['pool', 'reason'])
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the pool timeout"""
+
+
+class _PooledConnection(object):
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool(object):
+    """
+    A bounded, thread-safe pool of psycopg2 connections. At most `max_size`
+    connections exist at once, callers beyond that wait up to `timeout`
+    seconds for one to be returned. A connection that sat idle longer than
+    `health_check_interval` is pinged before it is handed out, and one
+    older than `max_lifetime` is closed and replaced, so server restarts
+    and failovers heal without restarting the API.
+    """
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0, max_lifetime=1800.0,
+                 health_check_interval=30.0, name='sync'):
+        if max_size <= 0 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size > 0")
+        self.connect_kwargs = connect_kwargs
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._update_gauges()
+
+    def _update_gauges(self):
+        ACTIVE_CONNECTIONS.labels(pool=self.name, state='in_use').set(self._in_use)
+        ACTIVE_CONNECTIONS.labels(pool=self.name, state='idle').set(len(self._idle))
+
+    def _connect(self):
+        return _PooledConnection(psycopg2.connect(**self.connect_kwargs))
+
+    def _expired(self, entry, now):
+        return now - entry.created_at > self.max_lifetime
+
+    @staticmethod
+    def _close(entry):
+        try:
+            entry.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _healthy(self, entry):
+        try:
+            with entry.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            entry.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _prepare(self, entry):
+        """Turn a reserved slot into a usable connection, outside the lock"""
+        now = time.monotonic()
+        if entry is not None and self._expired(entry, now):
+            self._close(entry)
+            POOL_RECYCLED.labels(pool=self.name, reason='max_lifetime').inc()
+            entry = None
+        if entry is not None and now - entry.last_used > self.health_check_interval and not self._healthy(entry):
+            self._close(entry)
+            POOL_RECYCLED.labels(pool=self.name, reason='health_check').inc()
+            entry = None
+        return entry or self._connect()
+
+    def _acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    # Most recently used first, so surplus connections age out instead of all staying warm
+                    entry = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    POOL_TIMEOUTS.labels(pool=self.name).inc()
+                    raise PoolTimeout(f"No database connection available within {timeout:.1f} seconds")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._update_gauges()
+        POOL_WAIT.labels(pool=self.name).observe(time.monotonic() - start)
+
+        try:
+            return self._prepare(entry)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._update_gauges()
+                self._cond.notify()
+            raise
+
+    def _release(self, entry, discard=False):
+        conn = entry.conn
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        now = time.monotonic()
+        if discard or conn.closed or self._expired(entry, now):
+            self._close(entry)
+            POOL_RECYCLED.labels(pool=self.name, reason='broken' if discard or conn.closed else 'max_lifetime').inc()
+            entry = None
+        else:
+            entry.last_used = now
+
+        with self._cond:
+            self._in_use -= 1
+            if entry is not None:
+                if self._closed:
+                    self._close(entry)
+                else:
+                    self._idle.append(entry)
+            self._update_gauges()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection, any transaction left open is rolled back on return"""
+        entry = self._acquire(timeout)
+        discard = False
+        try:
+            yield entry.conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self._release(entry, discard)
+
+    def open(self):
+        """Open `min_size` connections up front so the first requests don't pay for connecting"""
+        opened = []
+        with self._cond:
+            missing = max(0, self.min_size - len(self._idle) - self._in_use)
+            self._in_use += missing
+        try:
+            for _ in range(missing):
+                opened.append(self._connect())
+        finally:
+            with self._cond:
+                self._in_use -= missing
+                self._idle.extend(opened)
+                self._update_gauges()
+                self._cond.notify_all()
+
+    def close(self):
+        """Close idle connections now and borrowed ones as they come back"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop())
+            self._update_gauges()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'in_use': self._in_use, 'idle': len(self._idle), 'max_size': self.max_size}
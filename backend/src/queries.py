@@ -0,0 +1,318 @@
+"""
+Shared SQL building for time-range queries.
+
+Every filter on a time column is emitted as a half-open range on the
+bare column (`col >= start AND col < end`) with timezone-aware bounds,
+never as `col::date BETWEEN ...`. Casting the column hides it from the
+planner, which then can neither exclude hypertable chunks nor use
+raw_data_pid_time_idx. Queries can be built with psycopg2 (%s) or
+asyncpg ($1) placeholders from the same code.
+"""
+import re
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+PYFORMAT = "pyformat"
+NUMERIC = "numeric"
+
+
+@dataclass(frozen=True)
+class Relation:
+    name: str
+    time_column: str
+    columns: Tuple[str, ...]
+    metric_column: Optional[str] = None
+    resolution: timedelta = timedelta(seconds=1)
+    value_column: str = "value"
+    min_column: str = "value"
+    max_column: str = "value"
+    # Output columns computed from stored ones, (column, expression) pairs
+    expressions: Tuple[Tuple[str, str], ...] = ()
+    # Widest span in days served from this level, None for any span
+    max_span_days: Optional[int] = None
+    description: str = ""
+    # Flag of points filled in by imputation, None where they can't be told apart
+    imputed_column: Optional[str] = None
+
+    def select_list(self) -> str:
+        computed = dict(self.expressions)
+        return ", ".join(f"{computed[column]} AS {column}" if column in computed else column
+                         for column in self.columns)
+
+
+def aggregate_relation(name: str, resolution: timedelta, max_span_days: Optional[int] = None,
+                       description: str = "") -> Relation:
+    """A level of the metric_* rollups, which store sums and counts so the average is computed on read"""
+    average = "sum_value / count_value"
+    return Relation(name, "bucket", ("participant_id", "bucket", "avg_value", "min_value", "max_value"), "metric_type",
+                    resolution=resolution, value_column=average, min_column="min_value", max_column="max_value",
+                    expressions=(("avg_value", average),), max_span_days=max_span_days, description=description)
+
+
+RAW_RELATION = Relation("raw_data", "timestamp", ("participant_id", "timestamp", "metric_type", "value", "imputed"),
+                        "metric_type", max_span_days=7, description="Raw data points (<= 7 days)",
+                        imputed_column="imputed")
+
+# Finest first. Replaced by the rollup_level catalog once it has been read.
+RELATIONS = {
+    "raw": RAW_RELATION,
+    "1m": aggregate_relation("metric_1m", timedelta(minutes=1), 30, "1-minute aggregates (8-30 days)"),
+    "1h": aggregate_relation("metric_1h", timedelta(hours=1), 365, "1-hour aggregates (31-365 days)"),
+    "1d": aggregate_relation("metric_1d", timedelta(days=1), None, "1-day aggregates (> 365 days)"),
+}
+
+ROLLUP_LEVELS_SQL = """
+    SELECT level, relation, bucket_width, max_span_days, description
+    FROM rollup_level
+    ORDER BY bucket_width
+"""
+
+# Metrics with data, from the per-participant statistics kept at merge time
+METRIC_CATALOG_SQL = """
+    SELECT metric_type, COUNT(*) AS participants, SUM(row_count) AS points,
+           MIN(first_timestamp) AS first_timestamp, MAX(last_timestamp) AS last_timestamp
+    FROM participant_metric_stats
+    GROUP BY metric_type
+    ORDER BY metric_type
+"""
+
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def load_rollup_levels(rows) -> None:
+    """Replace RELATIONS with the rows of ROLLUP_LEVELS_SQL"""
+    levels = {}
+    for level, name, bucket_width, max_span_days, description in rows:
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"Invalid relation name '{name}' for level '{level}'")
+        if name == RAW_RELATION.name:
+            levels[level] = replace(RAW_RELATION, max_span_days=max_span_days, description=description)
+        else:
+            levels[level] = aggregate_relation(name, bucket_width, max_span_days, description)
+    if "raw" not in levels:
+        raise ValueError("The rollup catalog has no 'raw' level")
+    RELATIONS.clear()
+    RELATIONS.update(levels)
+
+
+def determine_aggregation_level(start_date: date, end_date: date) -> str:
+    """The finest level whose max_span_days covers the span"""
+    time_span = (end_date - start_date).days
+    level = None
+    for level, relation in RELATIONS.items():
+        if relation.max_span_days is None or time_span <= relation.max_span_days:
+            return level
+    return level
+
+
+def select_relation(start_date: date, end_date: date, aggregation: Optional[str] = None) -> Tuple[str, Relation]:
+    """The forced aggregation level if it is a known one, otherwise the one fitting the span"""
+    level = aggregation if aggregation in RELATIONS else determine_aggregation_level(start_date, end_date)
+    return level, RELATIONS[level]
+
+
+def coarsest_relation(bucket_width: timedelta) -> Tuple[str, Relation]:
+    """The coarsest relation that still has at least one row per `bucket_width`, raw_data as the fallback"""
+    level = "raw"
+    for candidate, relation in RELATIONS.items():
+        if relation.resolution <= bucket_width:
+            level = candidate
+    return level, RELATIONS[level]
+
+
+def time_range(start_date: date, end_date: date, tz: str = "UTC") -> Tuple[datetime, datetime]:
+    """[start_date 00:00, end_date + 1 day 00:00) in `tz`, i.e. both dates inclusive"""
+    zone = ZoneInfo(tz)
+    start = datetime.combine(start_date, time.min, tzinfo=zone)
+    end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=zone)
+    return start, end
+
+
+def aware(value: Optional[datetime], tz: str = "UTC") -> Optional[datetime]:
+    """Attach `tz` to a naive datetime, e.g. a pagination cursor from the query string"""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=ZoneInfo(tz))
+
+
+class QueryBuilder(object):
+    """Collects parameters and hands out the matching placeholder for the chosen driver"""
+    def __init__(self, style: str = PYFORMAT):
+        if style not in (PYFORMAT, NUMERIC):
+            raise ValueError(f"Unknown placeholder style '{style}'")
+        self.style = style
+        self.params: List = []
+
+    def param(self, value) -> str:
+        self.params.append(value)
+        return "%s" if self.style == PYFORMAT else f"${len(self.params)}"
+
+    def time_filter(self, column: str, start: datetime, end: datetime) -> str:
+        return f"{column} >= {self.param(start)} AND {column} < {self.param(end)}"
+
+    def participant_filter(self, participant_ids: List[int], column: str = "participant_id") -> str:
+        return f"{column} = ANY({self.param(list(participant_ids))})"
+
+    def series_filters(self, relation: Relation, participant_ids: List[int], start: datetime, end: datetime,
+                       metric: Optional[str], include_imputed: bool) -> List[str]:
+        where = [self.participant_filter(participant_ids), self.time_filter(relation.time_column, start, end)]
+        if metric and relation.metric_column:
+            where.append(f"{relation.metric_column} = {self.param(metric)}")
+        if not include_imputed and relation.imputed_column:
+            where.append(f"NOT {relation.imputed_column}")
+        return where
+
+
+def series_query(relation: Relation, participant_ids: List[int], start: datetime, end: datetime,
+                 cursor: Optional[datetime] = None, limit: Optional[int] = None, metric: Optional[str] = None,
+                 include_imputed: bool = True, style: str = PYFORMAT) -> Tuple[str, List]:
+    """Rows of `relation` in [start, end) ordered by time, optionally after `cursor` and capped at `limit`"""
+    builder = QueryBuilder(style)
+    where = builder.series_filters(relation, participant_ids, start, end, metric, include_imputed)
+    if cursor:
+        where.append(f"{relation.time_column} > {builder.param(cursor)}")
+    sql = f"""
+        SELECT {relation.select_list()}
+        FROM {relation.name}
+        WHERE {" AND ".join(where)}
+        ORDER BY {relation.time_column} ASC
+    """
+    if limit is not None:
+        sql += f"LIMIT {builder.param(limit)}\n"
+    return sql, builder.params
+
+
+def participant_series_query(relation: Relation, participant_id: int, start: datetime, end: datetime,
+                             after: Optional[datetime] = None, inclusive: bool = False, metric: Optional[str] = None,
+                             include_imputed: bool = True, style: str = PYFORMAT) -> Tuple[str, List]:
+    """
+    One participant's rows in [start, end) ordered by time, from `after`
+    on (or strictly after it). An equality on participant_id, unlike ANY,
+    lets the planner walk the (participant_id, timestamp) index in order
+    and stop as soon as the reader stops fetching.
+    """
+    builder = QueryBuilder(style)
+    where = [f"participant_id = {builder.param(participant_id)}",
+             builder.time_filter(relation.time_column, start, end)]
+    if metric and relation.metric_column:
+        where.append(f"{relation.metric_column} = {builder.param(metric)}")
+    if not include_imputed and relation.imputed_column:
+        where.append(f"NOT {relation.imputed_column}")
+    if after is not None:
+        where.append(f"{relation.time_column} {'>=' if inclusive else '>'} {builder.param(after)}")
+    sql = f"""
+        SELECT {relation.select_list()}
+        FROM {relation.name}
+        WHERE {" AND ".join(where)}
+        ORDER BY {relation.time_column} ASC
+    """
+    return sql, builder.params
+
+
+def count_query(relation: Relation, participant_ids: List[int], start: datetime, end: datetime,
+                metric: Optional[str] = None, include_imputed: bool = True, style: str = PYFORMAT) -> Tuple[str, List]:
+    builder = QueryBuilder(style)
+    where = builder.series_filters(relation, participant_ids, start, end, metric, include_imputed)
+    sql = f"""
+        SELECT COUNT(*) FROM {relation.name}
+        WHERE {" AND ".join(where)}
+    """
+    return sql, builder.params
+
+
+def m4_query(relation: Relation, participant_ids: List[int], start: datetime, end: datetime, bucket_width: timedelta,
+             metric: Optional[str] = None, include_imputed: bool = True, style: str = PYFORMAT) -> Tuple[str, List]:
+    """
+    M4 aggregation: per participant and `bucket_width` column, the first,
+    last, minimum and maximum point with their timestamps. A line drawn
+    through these is pixel-identical to one drawn through every row.
+    Columns: participant_id, bucket, first_time, first_value, last_time,
+    last_value, min_time, min_value, max_time, max_value.
+    """
+    builder = QueryBuilder(style)
+    t, value = relation.time_column, relation.value_column
+    # Select-list parameters come first so %s placeholders stay in order
+    bucket = f"time_bucket({builder.param(bucket_width)}, {t}, {builder.param(start)})"
+    where = builder.series_filters(relation, participant_ids, start, end, metric, include_imputed)
+    sql = f"""
+        SELECT participant_id, {bucket} AS px,
+               MIN({t}) AS first_time, first({value}, {t}) AS first_value,
+               MAX({t}) AS last_time, last({value}, {t}) AS last_value,
+               first({t}, {relation.min_column}) AS min_time, MIN({relation.min_column}) AS min_value,
+               last({t}, {relation.max_column}) AS max_time, MAX({relation.max_column}) AS max_value
+        FROM {relation.name}
+        WHERE {" AND ".join(where)}
+        GROUP BY participant_id, px
+        ORDER BY participant_id, px
+    """
+    return sql, builder.params
+
+
+ADHERENCE_WINDOW_DAYS = 7
+
+# Cohort-wide adherence from daily_coverage in one statement: the latest
+# heart rate timestamp per participant is an index lookup on the primary
+# key, the window totals one range scan of (metric_type, date).
+# Sleep days are nights with a breathing rate, which only comes from sleep.
+ADHERENCE_SQL = f"""
+    SELECT p.participant_id, p.name, p.token, latest.last_timestamp,
+           COALESCE(recent.heart_rate_points, 0) AS heart_rate_points,
+           COALESCE(recent.sleep_days, 0) AS sleep_days
+    FROM participant p
+    LEFT JOIN LATERAL (
+        SELECT c.last_timestamp
+        FROM daily_coverage c
+        WHERE c.participant_id = p.participant_id AND c.metric_type = 'heart_rate'
+        ORDER BY c.date DESC
+        LIMIT 1
+    ) latest ON TRUE
+    LEFT JOIN (
+        SELECT participant_id,
+               SUM(points) FILTER (WHERE metric_type = 'heart_rate') AS heart_rate_points,
+               COUNT(*) FILTER (WHERE metric_type = 'breathing_rate') AS sleep_days
+        FROM daily_coverage
+        WHERE metric_type IN ('heart_rate', 'breathing_rate') AND date > CURRENT_DATE - {ADHERENCE_WINDOW_DAYS}
+        GROUP BY participant_id
+    ) recent ON recent.participant_id = p.participant_id
+    ORDER BY p.participant_id
+"""
+
+# coverage_interval runs are cut at midnight UTC, so none starts more than
+# this long before the end of a range that it overlaps
+COVERAGE_RUN_MAX_LENGTH = "INTERVAL '2 days'"
+
+COVERAGE_RUNS = f"""
+    SELECT GREATEST(start_time, $3) AS start_time, LEAST(end_time, $4) AS end_time, points
+    FROM coverage_interval
+    WHERE participant_id = $1 AND metric_type = $2
+    AND start_time >= $3 - {COVERAGE_RUN_MAX_LENGTH} AND start_time < $4 AND end_time > $3
+"""
+
+# Covered seconds and runs of [$3, $4)
+COVERAGE_SQL = f"""
+    SELECT COALESCE(SUM(EXTRACT(EPOCH FROM end_time - start_time)), 0)::float8 AS covered_seconds,
+           COUNT(*) AS runs
+    FROM ({COVERAGE_RUNS}) runs
+"""
+
+# Uncovered stretches of [$3, $4) of at least $5. Zero-length runs at both
+# ends of the range turn leading and trailing gaps into ordinary ones, and
+# the running maximum of end_time bridges runs that overlap.
+COVERAGE_GAPS_SQL = f"""
+    SELECT gap_start, gap_end
+    FROM (
+        SELECT MAX(end_time) OVER (
+                   ORDER BY start_time, end_time ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ) AS gap_start,
+               start_time AS gap_end
+        FROM (
+            SELECT start_time, end_time FROM ({COVERAGE_RUNS}) runs
+            UNION ALL VALUES ($3::timestamptz, $3::timestamptz), ($4::timestamptz, $4::timestamptz)
+        ) bounded
+    ) gaps
+    WHERE gap_end - gap_start >= $5
+    ORDER BY gap_start
+    LIMIT $6
+"""
@@ -4,13 +4,25 @@ import argparse
 import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import asyncio
+import hashlib
+import asyncpg
 import psycopg2
-from utils import Logger
+from utils import (Logger, BulkWriter, AsyncBulkWriter, SyntheticDataReader, DEFAULT_BATCH_SIZE,
+                   decode_intraday, encode_copy_payload, FitbitClient, FitbitDayReader, TokenBucket,
+                   FITBIT_API_URL)
 import json
-from datetime import datetime, timedelta
+import multiprocessing
+import threading
+from collections import deque
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
-from prometheus_client import Counter, Histogram, Gauge, start_http_server
+from prometheus_client import (REGISTRY, Counter, Histogram, Gauge, push_to_gateway, start_http_server,
+                               write_to_textfile)
 
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path, override=True)
@@ -23,10 +35,155 @@ RECORDS_PROCESSED = Counter('records_processed_total', 'Total records processed'
 INGESTION_ERRORS = Counter('ingestion_errors_total', 'Total ingestion errors', ['error_type'])
 DATA_POINTS_PROCESSED = Counter('data_points_processed_total', 'Total data points processed')
 ACTIVE_DATABASE_CONNECTIONS = Gauge('active_database_connections', 'Active database connections')
+METRIC_ROWS_INGESTED = Counter('metric_rows_ingested_total', 'Raw data rows ingested per metric', ['metric'])
+METRIC_INGESTION_ERRORS = Counter('metric_ingestion_errors_total', 'Ingestion errors per metric', ['metric'])
+METRIC_DAYS_SKIPPED = Counter('metric_days_skipped_total', 'Participant-days skipped because their content digest was unchanged', ['metric'])
+INGESTION_STAGE_DURATION = Histogram('ingestion_stage_duration_seconds', 'Time spent per metric-day in each ingestion stage',
+                                     ['stage', 'metric'],
+                                     buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+INGESTION_ROWS_PER_SECOND = Gauge('ingestion_rows_per_second', 'Raw data rows written per second in the last run', ['participant_id'])
+INGESTION_BYTES_PER_SECOND = Gauge('ingestion_bytes_per_second', 'Source bytes read per second in the last run', ['participant_id'])
+INGESTION_LAG_DAYS = Gauge('ingestion_participant_lag_days', 'Days of available data not yet ingested for a participant', ['participant_id'])
+INGESTION_LAST_SUCCESS = Gauge('ingestion_last_success_timestamp_seconds', 'Unix time of the last ingestion run that finished without errors')
+FITBIT_API_RESPONSES = Counter('fitbit_api_responses_total', 'Fitbit Web API responses by HTTP status, "error" for network failures', ['status'])
+
+INGESTION_MODES = ('sync', 'async')
+INGESTION_STAGES = ('read', 'parse', 'transform', 'write', 'commit')
+DEFAULT_QUEUE_SIZE = 4
+# Concurrent Web API requests per participant in live mode
+DEFAULT_FETCH_CONCURRENCY = 4
+# Days fetched for a metric that was never ingested live
+LIVE_BACKFILL_DAYS = 7
+
+METRIC_LOADERS = {}
+
+def register_metric(name, file_name, endpoint, metric_types, response_key=None):
+    """
+    Register a loader mapping one day of a wearipedia payload onto raw_data
+    series and summary rows. `endpoint` is the Web API path serving the
+    same payload for a {date}, `response_key` the list it is wrapped in
+    when the API returns it as a one-element list. `metric_types` are the
+    raw_data series the loader can produce, a re-ingested day replaces all
+    of them even when some are missing from the new payload.
+    """
+    def decorator(loader):
+        METRIC_LOADERS[name] = {'file_name': file_name, 'endpoint': endpoint, 'response_key': response_key,
+                                'metric_types': tuple(metric_types), 'load': loader}
+        return loader
+    return decorator
+
+def observe_fitbit_response(status):
+    FITBIT_API_RESPONSES.labels(status=str(status) if status is not None else 'error').inc()
+
+def _daily_series(metric_type, date_str, value):
+    """A single value for the whole day, stored at midnight"""
+    return (metric_type, np.array([np.datetime64(date_str, 's')]), np.array([value], dtype=np.float64))
+
+@register_metric('hr', 'hr.json', '/1/user/-/activities/heart/date/{date}/1d/1sec.json', ['heart_rate'])
+def load_heart_rate(day_data, date_str):
+    heart_rate_day = day_data['heart_rate_day'][0] if 'heart_rate_day' in day_data else day_data
+    activities_heart = heart_rate_day['activities-heart'][0]
+    activities_heart_intraday = heart_rate_day['activities-heart-intraday']
+    value = activities_heart['value']
+    
+    timestamps, values = decode_intraday(activities_heart_intraday['dataset'], date_str)
+    return {
+        'series': [('heart_rate', timestamps, values)],
+        'daily_summary': {
+            'resting_heart_rate': value.get('restingHeartRate', None),
+            'dataset_interval': activities_heart_intraday['datasetInterval'],
+            'dataset_type': activities_heart_intraday['datasetType'],
+        },
+        'heart_rate_zones': value.get('heartRateZones', []),
+    }
+
+@register_metric('br', 'br.json', '/1/user/-/br/date/{date}/all.json',
+                 ['breathing_rate', 'breathing_rate_deep', 'breathing_rate_rem', 'breathing_rate_light'])
+def load_breathing_rate(day_data, date_str):
+    series = []
+    stages = {
+        'fullSleepSummary': 'breathing_rate',
+        'deepSleepSummary': 'breathing_rate_deep',
+        'remSleepSummary': 'breathing_rate_rem',
+        'lightSleepSummary': 'breathing_rate_light',
+    }
+    for entry in day_data['br']:
+        for stage, metric_type in stages.items():
+            summary = entry['value'].get(stage)
+            if summary and summary.get('breathingRate') is not None:
+                series.append(_daily_series(metric_type, entry.get('dateTime', date_str), summary['breathingRate']))
+    return {'series': series}
+
+@register_metric('azm', 'azm.json', '/1/user/-/activities/active-zone-minutes/date/{date}/1d/1min.json',
+                 ['active_zone_minutes'])
+def load_active_zone_minutes(day_data, date_str):
+    series = []
+    for entry in day_data['activities-active-zone-minutes-intraday']:
+        timestamps, values = decode_intraday(entry['minutes'], entry.get('dateTime', date_str),
+                                             time_key='minute', value_key='activeZoneMinutes')
+        series.append(('active_zone_minutes', timestamps, values))
+    return {'series': series}
+
+@register_metric('activity', 'activity.json', '/1/user/-/activities/steps/date/{date}/1d.json', ['steps'],
+                 response_key='activities-steps')
+def load_activity(day_data, date_str):
+    return {'series': [_daily_series('steps', day_data.get('dateTime', date_str), day_data['value'])]}
+
+@register_metric('hrv', 'hrv.json', '/1/user/-/hrv/date/{date}/all.json',
+                 ['hrv_rmssd', 'hrv_coverage', 'hrv_hf', 'hrv_lf'])
+def load_hrv(day_data, date_str):
+    series = []
+    for entry in day_data['hrv']:
+        minutes = entry.get('minutes', [])
+        for field in ('rmssd', 'coverage', 'hf', 'lf'):
+            timestamps, values = decode_intraday(minutes, entry.get('dateTime', date_str),
+                                                 time_key='minute', value_key=field)
+            series.append((f'hrv_{field}', timestamps, values))
+    return {'series': series}
+
+@register_metric('spo2', 'spo2.json', '/1/user/-/spo2/date/{date}/all.json', ['spo2'])
+def load_spo2(day_data, date_str):
+    timestamps, values = decode_intraday(day_data['minutes'], day_data.get('dateTime', date_str), time_key='minute')
+    return {'series': [('spo2', timestamps, values)]}
+
+def batch_digest(batch):
+    """Content digest of a loaded metric-day, stable across runs for identical payloads"""
+    digest = hashlib.blake2b(digest_size=16)
+    for metric_type, timestamps, values in batch['series']:
+        digest.update(metric_type.encode('utf-8'))
+        digest.update(timestamps.astype('datetime64[s]').astype('<i8').tobytes())
+        digest.update(np.asarray(values, dtype='<f8').tobytes())
+    summaries = {key: batch.get(key) for key in ('daily_summary', 'heart_rate_zones')}
+    digest.update(json.dumps(summaries, sort_keys=True, default=str).encode('utf-8'))
+    return digest.digest()
 
 class DataIngestion:
-    def __init__(self, synthetic=True):
+    def __init__(self, synthetic=True, batch_size=DEFAULT_BATCH_SIZE, metrics=None, participant_id=1, serve_metrics=True,
+                 mode='sync', queue_size=DEFAULT_QUEUE_SIZE, api_url=None, fetch_concurrency=DEFAULT_FETCH_CONCURRENCY,
+                 pool=None, conn_pool=None, fitbit_client=None, token_bucket=None, stop_event=None):
         self.synthetic = synthetic
+        # Owned by a long-running caller such as the ingestion daemon and
+        # shared between runs, a run opens and closes its own otherwise:
+        # an asyncpg pool for the async pipeline, a psycopg2 pool for
+        # everything else, an open FitbitClient and the participant's bucket
+        self.pool = pool
+        self.conn_pool = conn_pool
+        self.fitbit_client = fitbit_client
+        self.token_bucket = token_bucket
+        # Once set, the async pipeline reads no further days and finishes those already read
+        self.stop_event = stop_event
+        self.api_url = api_url or os.getenv('FITBIT_API_URL', FITBIT_API_URL)
+        self.fetch_concurrency = fetch_concurrency
+        self.participant_id = participant_id
+        self.batch_size = batch_size
+        if mode not in INGESTION_MODES:
+            raise ValueError(f"Unknown ingestion mode '{mode}', expected one of {', '.join(INGESTION_MODES)}")
+        self.mode = mode
+        self.queue_size = queue_size
+        self.metrics = list(metrics or METRIC_LOADERS)
+        unknown = set(self.metrics) - set(METRIC_LOADERS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
         self.db_config = {
             'host': os.getenv('DB_HOST'),
             'port': os.getenv('DB_PORT'),
@@ -35,215 +192,799 @@ class DataIngestion:
             'password': os.getenv('DB_PASSWORD')
         }
         
-        self.last_run_file = Path(__file__).parent / "last_run.json"
-        self.data_dir = Path(__file__).parent / "data"
+        self.data_dir = self._participant_data_dir(Path(__file__).parent / "data")
         self.simulation_start = datetime(2024, 1, 1)
+        self._readers = {}
+        self._stats_lock = threading.Lock()
+        self.run_stats = self._empty_run_stats()
         
+        if serve_metrics:
+            try:
+                start_http_server(8001)
+                print("Prometheus metrics server started on port 8001")
+            except Exception as e:
+                print(f"Server already running")
+
+    def _participant_data_dir(self, base_dir):
+        """Synthetic data lives in data/participants/<id>, participant 1 may also use data/ directly"""
+        participant_dir = base_dir / "participants" / str(self.participant_id)
+        if participant_dir.exists() or self.participant_id != 1:
+            return participant_dir
+        return base_dir
+
+    def _empty_run_stats(self):
+        return {'participant_id': self.participant_id, 'days': 0, 'records': 0, 'metrics': {}, 'errors': {}, 'skipped': {},
+                'bytes': 0, 'stages': {}, 'lag_days': None}
+
+    @contextmanager
+    def _stage(self, stage, metric):
+        """
+        Time one ingestion stage of a metric-day. Samples are kept in
+        run_stats as well so a parent process can re-export them.
+        """
+        start = time.perf_counter()
         try:
-            start_http_server(8001)
-            print("Prometheus metrics server started on port 8001")
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            INGESTION_STAGE_DURATION.labels(stage=stage, metric=metric).observe(elapsed)
+            with self._stats_lock:
+                self.run_stats['stages'].setdefault(stage, {}).setdefault(metric, []).append(elapsed)
+
+    def _read_day(self, metric, reader, day_index):
+        with self._stage('read', metric):
+            raw = reader.read_day(day_index)
+        with self._stats_lock:
+            self.run_stats['bytes'] += len(raw)
+        return raw
+
+    async def _read_day_async(self, loop, metric, reader, day_index):
+        """Fetch a day from the Web API, or read a synthetic one off the event loop"""
+        if not isinstance(reader, FitbitDayReader):
+            return await loop.run_in_executor(None, self._read_day, metric, reader, day_index)
+        with self._stage('read', metric):
+            raw = await reader.fetch_day(day_index)
+        with self._stats_lock:
+            self.run_stats['bytes'] += len(raw)
+        return raw
+
+    def _record_run_gauges(self, readers, duration):
+        """Throughput of this run and how far the participant's slowest metric trails its data"""
+        label = str(self.participant_id)
+        if duration > 0:
+            INGESTION_ROWS_PER_SECOND.labels(participant_id=label).set(self.run_stats['records'] / duration)
+            INGESTION_BYTES_PER_SECOND.labels(participant_id=label).set(self.run_stats['bytes'] / duration)
+        try:
+            watermarks = self._get_watermarks()
         except Exception as e:
-            print(f"Server already running")
+            print(f"Could not read watermarks for lag ({str(e)})")
+            return
+        self.run_stats['lag_days'] = max(
+            len(reader) - min(len(reader), self._next_day_index(watermarks.get(metric)))
+            for metric, reader in readers.items()
+        )
+        INGESTION_LAG_DAYS.labels(participant_id=label).set(self.run_stats['lag_days'])
 
     @property
     def get_db_conn(self):
         """Get database connection with connection tracking"""
         ACTIVE_DATABASE_CONNECTIONS.inc()
+        if self.conn_pool is not None:
+            return self.conn_pool.getconn()
         return psycopg2.connect(**self.db_config)
 
     def close_db_conn(self, conn):
         """Close database connection with connection tracking"""
         if conn:
-            conn.close()
+            if self.conn_pool is not None:
+                # Reads leave a transaction open, it must not follow the connection back into the pool
+                if not conn.closed:
+                    conn.rollback()
+                self.conn_pool.putconn(conn, close=bool(conn.closed))
+            else:
+                conn.close()
             ACTIVE_DATABASE_CONNECTIONS.dec()
 
-    def _get_simulation_day(self):
-        """Get the current simulation day (0-based index from start date)"""
-        if self.last_run_file.exists():
+    def _get_watermarks(self):
+        """Last ingested date per metric for this participant, read from the ingestion ledger"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT metric, last_date
+                FROM ingestion_watermark
+                WHERE participant_id = %s AND metric = ANY(%s)
+            """, (self.participant_id, self.metrics))
+            watermarks = dict(cursor.fetchall())
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        return watermarks
+
+    def _next_day_index(self, last_date):
+        """Day index following a watermark (0-based from the simulation start)"""
+        if last_date is None:
+            return 0
+        return (last_date - self.simulation_start.date()).days + 1
+
+    def _get_pending_ranges(self, readers, days):
+        """Day indexes still to ingest per metric, at most `days` of them each"""
+        watermarks = self._get_watermarks()
+        pending = {}
+        for metric, reader in readers.items():
+            start = self._next_day_index(watermarks.get(metric))
+            stop = min(len(reader), start + days)
+            if start < stop:
+                pending[metric] = range(start, stop)
+        return pending
+
+    def _advance_watermark(self, cursor, metric, date_str, records_processed, content_written=True):
+        """
+        Move the ledger forward inside the same transaction as the data it
+        describes. `content_written` bumps the revision readers cache by,
+        false only for a day skipped on an unchanged digest.
+        """
+        cursor.execute("""
+            INSERT INTO ingestion_watermark (participant_id, metric, last_date, rows_ingested, revision, updated_at)
+            VALUES (%s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (participant_id, metric) DO UPDATE SET
+                last_date = GREATEST(ingestion_watermark.last_date, EXCLUDED.last_date),
+                rows_ingested = ingestion_watermark.rows_ingested + EXCLUDED.rows_ingested,
+                revision = ingestion_watermark.revision + EXCLUDED.revision,
+                updated_at = EXCLUDED.updated_at
+        """, (self.participant_id, metric, date_str, records_processed, int(content_written)))
+
+    def _get_digests(self, pending):
+        """Stored content digests for every pending metric-day, fetched in one query"""
+        first_day = min(days_pending.start for days_pending in pending.values())
+        last_day = max(days_pending.stop for days_pending in pending.values()) - 1
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT metric, date, digest
+                FROM ingestion_digest
+                WHERE participant_id = %s AND metric = ANY(%s) AND date BETWEEN %s AND %s
+            """, (self.participant_id, list(pending),
+                  (self.simulation_start + timedelta(days=first_day)).date(),
+                  (self.simulation_start + timedelta(days=last_day)).date()))
+            digests = {(metric, date): bytes(digest) for metric, date, digest in cursor.fetchall()}
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        return digests
+
+    def _record_digest(self, cursor, metric, date_str, digest, records_processed):
+        cursor.execute("""
+            INSERT INTO ingestion_digest (participant_id, metric, date, digest, row_count, updated_at)
+            VALUES (%s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (participant_id, metric, date) DO UPDATE SET
+                digest = EXCLUDED.digest,
+                row_count = EXCLUDED.row_count,
+                updated_at = EXCLUDED.updated_at
+        """, (self.participant_id, metric, date_str, psycopg2.Binary(digest), records_processed))
+
+    def _record_skip(self, metric):
+        METRIC_DAYS_SKIPPED.labels(metric=metric).inc()
+        self.run_stats['skipped'][metric] = self.run_stats['skipped'].get(metric, 0) + 1
+
+    def _get_token(self):
+        """The participant's Web API access token"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            cursor.execute("SELECT token FROM participant WHERE participant_id = %s", (self.participant_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        if not row or not row[0]:
+            INGESTION_ERRORS.labels(error_type='missing_token').inc()
+            raise ValueError(f"Participant {self.participant_id} has no Fitbit token")
+        return row[0]
+
+    def _get_live_window(self, days):
+        """
+        First and last date to fetch per metric, from the last ingested date
+        to today and at most `days` past it. The watermark day is fetched
+        again, it may still have been filling up when it was ingested, and
+        the digest turns it into a no-op if it wasn't.
+        """
+        watermarks = self._get_watermarks()
+        today = date.today()
+        windows = {}
+        for metric in self.metrics:
+            last_date = watermarks.get(metric)
+            if last_date is None:
+                first = today - timedelta(days=LIVE_BACKFILL_DAYS - 1)
+                last = min(today, first + timedelta(days=days - 1))
+            else:
+                first = min(last_date, today)
+                last = min(today, last_date + timedelta(days=days))
+            windows[metric] = (first, last)
+        return windows
+
+    async def _ingest_live(self, days):
+        """
+        Fetch each metric's window from the Web API and feed it through the
+        async pipeline. Every request made with the participant's token
+        draws from one bucket holding Fitbit's hourly per-user quota.
+        """
+        loop = asyncio.get_running_loop()
+        token = await loop.run_in_executor(None, self._get_token)
+        windows = await loop.run_in_executor(None, self._get_live_window, days)
+        origin = min(first for first, _ in windows.values())
+        # Day indexes count from the oldest date fetched, as they do from the start of the synthetic files
+        self.simulation_start = datetime.combine(origin, datetime.min.time())
+        pending = {metric: range(self._next_day_index(first - timedelta(days=1)), self._next_day_index(last))
+                   for metric, (first, last) in windows.items()}
+        digests = await loop.run_in_executor(None, self._get_digests, pending)
+        
+        client = self.fitbit_client or FitbitClient(self.api_url, concurrency=self.fetch_concurrency,
+                                                    on_response=observe_fitbit_response)
+        bucket = self.token_bucket or TokenBucket()
+        days_available = self._next_day_index(date.today())
+        readers = {
+            metric: FitbitDayReader(client, token, bucket, METRIC_LOADERS[metric]['endpoint'], origin,
+                                    days_available, METRIC_LOADERS[metric]['response_key'])
+            for metric in pending
+        }
+        
+        start_time = time.time()
+        try:
+            # A client passed in is already open and outlives this run
+            async with (nullcontext(client) if self.fitbit_client else client):
+                return await self._ingest_async(readers, pending, digests)
+        finally:
+            await loop.run_in_executor(None, self._record_run_gauges, readers, time.time() - start_time)
+
+    def _get_synthetic_reader(self, metric='hr'):
+        """Open a metric's synthetic data file, indexing its days on first use"""
+        if metric not in self._readers:
+            reader = SyntheticDataReader(self.data_dir / METRIC_LOADERS[metric]['file_name'])
             try:
-                with open(self.last_run_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('simulation_day', 0)
-            except (json.JSONDecodeError, KeyError):
-                pass
-        return 0
-
-    def _update_simulation_day(self, day):
-        """Update the simulation day"""
-        data = {}
-        if self.last_run_file.exists():
+                len(reader)
+            except FileNotFoundError:
+                INGESTION_ERRORS.labels(error_type='file_not_found').inc()
+                raise
+            except json.JSONDecodeError:
+                INGESTION_ERRORS.labels(error_type='json_decode').inc()
+                raise
+            self._readers[metric] = reader
+        return self._readers[metric]
+
+    def _get_metric_readers(self):
+        """Readers for every selected metric, skipping metrics without a data file"""
+        readers = {}
+        for metric in self.metrics:
             try:
-                with open(self.last_run_file, 'r') as f:
-                    data = json.load(f)
-            except (json.JSONDecodeError, KeyError):
-                pass
-        
-        data.update({
-            'simulation_day': day,
-            'last_run': datetime.now().isoformat(),
-            'simulation_date': (self.simulation_start + timedelta(days=day)).isoformat()
-        })
-        
-        with open(self.last_run_file, 'w') as f:
-            json.dump(data, f, indent=2)
-
-    def _get_synthetic_data(self):
-        """Load synthetic data from JSON file"""
+                readers[metric] = self._get_synthetic_reader(metric)
+            except FileNotFoundError:
+                print(f"No data file for metric '{metric}', skipping it.")
+        if not readers:
+            raise FileNotFoundError(f"No synthetic data files found in {self.data_dir}")
+        return readers
+
+    def _ingest_metric_day(self, metric, reader, day_index, date_str, participant_id, previous_digest=None):
+        """
+        Load one metric for one day and write it in its own transaction,
+        returns raw rows written. A day whose digest matches the stored one
+        only moves the watermark, a day that was loaded before but changed
+        rewrites just the rows that differ.
+        """
+        conn = None
         try:
-            with open(self.data_dir / "hr.json", 'r') as file:
-                data = json.load(file)
-                return data
-        except FileNotFoundError:
-            INGESTION_ERRORS.labels(error_type='file_not_found').inc()
-            raise
-        except json.JSONDecodeError:
-            INGESTION_ERRORS.labels(error_type='json_decode').inc()
+            raw = self._read_day(metric, reader, day_index)
+            with self._stage('parse', metric):
+                day_data = json.loads(raw)
+            with self._stage('transform', metric):
+                batch = METRIC_LOADERS[metric]['load'](day_data, date_str)
+                digest = batch_digest(batch)
+            records_processed = sum(len(values) for _, _, values in batch['series'])
+            
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            
+            if digest == previous_digest:
+                self._advance_watermark(cursor, metric, date_str, 0, content_written=False)
+                with self._stage('commit', metric):
+                    conn.commit()
+                cursor.close()
+                self._record_skip(metric)
+                return 0
+            
+            with self._stage('write', metric):
+                writer = BulkWriter(conn, batch_size=self.batch_size)
+                
+                summary = batch.get('daily_summary')
+                if summary:
+                    writer.write_daily_summary(cursor, participant_id, date_str, **summary)
+                    RECORDS_PROCESSED.labels(data_type='daily_summary').inc()
+                
+                zones_written = writer.write_heart_rate_zones(cursor, participant_id, date_str,
+                                                              batch.get('heart_rate_zones', []))
+                RECORDS_PROCESSED.labels(data_type='heart_rate_zone').inc(zones_written)
+                
+                for metric_type, timestamps, values in batch['series']:
+                    writer.stage_columns(cursor, participant_id, metric_type, timestamps, values)
+                removed = 0
+                if previous_digest is not None:
+                    removed = writer.delete_missing_raw_data(cursor, participant_id, date_str,
+                                                             METRIC_LOADERS[metric]['metric_types'])
+                changed = writer.merge_raw_data(cursor, only_changed=previous_digest is not None) + removed
+                writer.write_daily_coverage(cursor, participant_id, date_str, batch['series'],
+                                            METRIC_LOADERS[metric]['metric_types'])
+                self._record_digest(cursor, metric, date_str, digest, records_processed)
+                self._advance_watermark(cursor, metric, date_str, changed)
+            
+            with self._stage('commit', metric):
+                conn.commit()
+            cursor.close()
+            
+            METRIC_ROWS_INGESTED.labels(metric=metric).inc(changed)
+            DATA_POINTS_PROCESSED.inc(changed)
+            RECORDS_PROCESSED.labels(data_type='raw_data').inc(changed)
+            return changed
+        except Exception:
+            METRIC_INGESTION_ERRORS.labels(metric=metric).inc()
+            self.run_stats['errors'][metric] = self.run_stats['errors'].get(metric, 0) + 1
+            if conn:
+                conn.rollback()
             raise
+        finally:
+            if conn:
+                self.close_db_conn(conn)
 
-    def _convert_to_timestamp(self, date_str, time_str):
-        """Convert date and time strings to timestamp"""
-        datetime_str = f"{date_str} {time_str}"
-        return datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
+    def _simulation_complete(self, readers):
+        total_days = max(len(reader) for reader in readers.values())
+        print(f"Simulation complete! All {total_days} days of data have been processed.")
+        self.run_stats['lag_days'] = 0
+        INGESTION_LAG_DAYS.labels(participant_id=str(self.participant_id)).set(0)
+        return self.run_stats
 
-    def _get_next_data_to_process(self):
-        """Get the next day's data to process in the simulation"""
-        current_day = self._get_simulation_day()
-        data = self._get_synthetic_data()
+    def ingest(self, days=1):
+        """Main ingestion method with monitoring"""
+        if not self.synthetic or self.mode == 'async':
+            return asyncio.run(self.ingest_async(days))
         
-        if current_day >= len(data):
-            print(f"Simulation complete! All {len(data)} days of data have been processed.")
-            return None, None
+        print(f"Starting ingestion at {datetime.now()}")
+        self.run_stats = self._empty_run_stats()
+        readers = self._get_metric_readers()
+        pending = self._get_pending_ranges(readers, days)
+        
+        if not pending:
+            return self._simulation_complete(readers)
         
-        day_data = data[current_day]
-        simulation_date = self.simulation_start + timedelta(days=current_day)
+        digests = self._get_digests(pending)
         
-        return day_data, simulation_date
+        start_time = time.time()
+        try:
+            return self._ingest_sync(readers, pending, digests)
+        finally:
+            self._record_run_gauges(readers, time.time() - start_time)
 
-    def ingest(self, days=1):
-        """Main ingestion method with monitoring"""
+    async def ingest_async(self, days=1):
+        """
+        ingest() through the async pipeline, for callers that already run an
+        event loop. Ledger reads are blocking and go to the default executor.
+        """
         print(f"Starting ingestion at {datetime.now()}")
-        
+        self.run_stats = self._empty_run_stats()
         if not self.synthetic:
-            INGESTION_ERRORS.labels(error_type='unsupported_mode').inc()
-            raise NotImplementedError("Only synthetic data ingestion is implemented.")
+            return await self._ingest_live(days)
         
-        for day_num in range(days):
-            start_time = time.time()
-            conn = None
-            
-            try:
-                with INGESTION_DURATION.time():
-                    day_data, simulation_date = self._get_next_data_to_process()
-                    
-                    if day_data is None:
-                        print(f"Stopping ingestion after {day_num} days - simulation complete.")
-                        break
-                    
-                    current_day = self._get_simulation_day()
-                    print(f"Processing simulation day {current_day + 1}: {simulation_date.strftime('%Y-%m-%d')}")
-                    
-                    conn = self.get_db_conn
-                    cursor = conn.cursor()
-                    
-                    participant_id = 1
-                    records_processed = 0
-                    
-                    heart_rate_day = day_data['heart_rate_day'][0]
-                    activities_heart = heart_rate_day['activities-heart'][0]
-                    activities_heart_intraday = heart_rate_day['activities-heart-intraday']
-                    
-                    date_str = simulation_date.strftime('%Y-%m-%d')
-                    value = activities_heart['value']
-                    resting_heart_rate = value.get('restingHeartRate', None)
-                    
-                    cursor.execute("""
-                        INSERT INTO daily_summaries (participant_id, date, resting_heart_rate, dataset_interval, dataset_type)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (participant_id, date) DO UPDATE SET
-                            resting_heart_rate = EXCLUDED.resting_heart_rate,
-                            dataset_interval = EXCLUDED.dataset_interval,
-                            dataset_type = EXCLUDED.dataset_type
-                    """, (participant_id, date_str, resting_heart_rate,
-                          activities_heart_intraday['datasetInterval'],
-                          activities_heart_intraday['datasetType']))
-                    
-                    RECORDS_PROCESSED.labels(data_type='daily_summary').inc()
-                    
-                    heart_rate_zones = value.get('heartRateZones', [])
-                    for zone in heart_rate_zones:
-                        cursor.execute("""
-                            INSERT INTO heart_rate_zones (participant_id, date, zone_name, min_heart_rate, max_heart_rate, minutes, calories_out)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (participant_id, date, zone_name) DO UPDATE SET
-                                min_heart_rate = EXCLUDED.min_heart_rate,
-                                max_heart_rate = EXCLUDED.max_heart_rate,
-                                minutes = EXCLUDED.minutes,
-                                calories_out = EXCLUDED.calories_out
-                        """, (participant_id, date_str, zone['name'], zone['min'], zone['max'], zone['minutes'], zone.get('caloriesOut')))
+        loop = asyncio.get_running_loop()
+        readers = await loop.run_in_executor(None, self._get_metric_readers)
+        pending = await loop.run_in_executor(None, self._get_pending_ranges, readers, days)
+        
+        if not pending:
+            return self._simulation_complete(readers)
+        
+        digests = await loop.run_in_executor(None, self._get_digests, pending)
+        
+        start_time = time.time()
+        try:
+            return await self._ingest_async(readers, pending, digests)
+        finally:
+            await loop.run_in_executor(None, self._record_run_gauges, readers, time.time() - start_time)
+
+    def _ingest_sync(self, readers, pending, digests):
+        """One day at a time, the due metrics of a day written concurrently in their own transactions"""
+        participant_id = self.participant_id
+        failed = set()
+        day_indexes = sorted(set().union(*pending.values()))
+        
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            for day_index in day_indexes:
+                due = [metric for metric, days_pending in pending.items()
+                       if day_index in days_pending and metric not in failed]
+                if not due:
+                    continue
+                
+                start_time = time.time()
+                
+                try:
+                    with INGESTION_DURATION.time():
+                        simulation_date = self.simulation_start + timedelta(days=day_index)
+                        date_str = simulation_date.strftime('%Y-%m-%d')
+                        print(f"Processing participant {participant_id}, simulation day {day_index + 1}: {date_str} ({', '.join(due)})")
                         
-                        RECORDS_PROCESSED.labels(data_type='heart_rate_zone').inc()
-                    
-                    dataset = activities_heart_intraday['dataset']
-                    for entry in dataset:
-                        timestamp = self._convert_to_timestamp(date_str, entry['time'])
-                        cursor.execute("""
-                            INSERT INTO raw_data (participant_id, timestamp, metric_type, value)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (participant_id, timestamp, metric_type) DO UPDATE SET
-                                value = EXCLUDED.value
-                        """, (participant_id, timestamp, 'heart_rate', entry['value']))
+                        futures = {
+                            metric: executor.submit(self._ingest_metric_day, metric, readers[metric],
+                                                    day_index, date_str, participant_id,
+                                                    digests.get((metric, simulation_date.date())))
+                            for metric in due
+                        }
                         
-                        records_processed += 1
-                        DATA_POINTS_PROCESSED.inc()
-                    
-                    RECORDS_PROCESSED.labels(data_type='raw_data').inc(records_processed)
-                    
-                    conn.commit()
-                    cursor.close()
-                    
-                    self._update_simulation_day(current_day + 1)
-                    
-                    INGESTION_COUNTER.labels(status='success').inc()
-                    
+                        records_processed = 0
+                        day_failed = []
+                        for metric, future in futures.items():
+                            try:
+                                rows = future.result()
+                                records_processed += rows
+                                self.run_stats['metrics'][metric] = self.run_stats['metrics'].get(metric, 0) + rows
+                                print(f"  {metric}: {rows} records")
+                            except Exception as e:
+                                day_failed.append(metric)
+                                print(f"  {metric}: failed - {str(e)}")
+                        
+                        self.run_stats['records'] += records_processed
+                        
+                        if day_failed:
+                            # Later days of a failed metric would leave a hole behind its watermark
+                            failed.update(day_failed)
+                            INGESTION_ERRORS.labels(error_type='general').inc()
+                            INGESTION_COUNTER.labels(status='error').inc()
+                            print(f"Error during ingestion of {date_str}: {', '.join(day_failed)} failed")
+                            continue
+                        
+                        self.run_stats['days'] += 1
+                        INGESTION_COUNTER.labels(status='success').inc()
+                        
+                        duration = time.time() - start_time
+                        rows_per_second = records_processed / duration if duration > 0 else 0
+                        print(f"Ingestion completed successfully. Processed {records_processed} records for {date_str} in {duration:.2f} seconds ({rows_per_second:.0f} rows/sec).")
+                        
+                finally:
                     duration = time.time() - start_time
-                    print(f"Ingestion completed successfully. Processed {records_processed} records for {date_str} in {duration:.2f} seconds.")
-                    
-            except Exception as e:
+                    print(f"Ingestion process completed in {duration:.2f} seconds")
+        
+        if failed:
+            raise RuntimeError(f"Ingestion failed for metrics: {', '.join(sorted(failed))}")
+        
+        return self.run_stats
+
+    def _transform_metric_day(self, metric, raw, date_str):
+        """Decode a day's payload and encode all of its series as one binary COPY stream"""
+        with self._stage('parse', metric):
+            day_data = json.loads(raw)
+        with self._stage('transform', metric):
+            batch = METRIC_LOADERS[metric]['load'](day_data, date_str)
+            payload = encode_copy_payload(self.participant_id, batch['series'])
+            digest = batch_digest(batch)
+        records = sum(len(values) for _, _, values in batch['series'])
+        return batch, payload, records, digest
+
+    async def _write_metric_day_async(self, pool, metric, simulation_date, batch, payload, records, digest,
+                                      previous_digest=None):
+        """Write one transformed metric-day, its digest and its watermark in a single asyncpg transaction"""
+        ACTIVE_DATABASE_CONNECTIONS.inc()
+        try:
+            async with pool.acquire() as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    with self._stage('write', metric):
+                        if digest == previous_digest:
+                            await self._advance_watermark_async(conn, metric, simulation_date, 0,
+                                                                content_written=False)
+                            changed = None
+                        else:
+                            changed = await self._write_rows_async(conn, metric, simulation_date, batch, payload,
+                                                                   records, digest, previous_digest)
+                except BaseException:
+                    await transaction.rollback()
+                    raise
+                with self._stage('commit', metric):
+                    await transaction.commit()
+        finally:
+            ACTIVE_DATABASE_CONNECTIONS.dec()
+        
+        if changed is None:
+            self._record_skip(metric)
+            return 0
+        
+        METRIC_ROWS_INGESTED.labels(metric=metric).inc(changed)
+        DATA_POINTS_PROCESSED.inc(changed)
+        RECORDS_PROCESSED.labels(data_type='raw_data').inc(changed)
+        return changed
+
+    async def _write_rows_async(self, conn, metric, simulation_date, batch, payload, records, digest, previous_digest):
+        writer = AsyncBulkWriter(conn)
+        
+        summary = batch.get('daily_summary')
+        if summary:
+            await writer.write_daily_summary(self.participant_id, simulation_date, **summary)
+            RECORDS_PROCESSED.labels(data_type='daily_summary').inc()
+        
+        zones_written = await writer.write_heart_rate_zones(self.participant_id, simulation_date,
+                                                            batch.get('heart_rate_zones', []))
+        RECORDS_PROCESSED.labels(data_type='heart_rate_zone').inc(zones_written)
+        
+        await writer.stage_payload(payload)
+        metric_types = METRIC_LOADERS[metric]['metric_types']
+        removed = 0
+        if previous_digest is not None:
+            removed = await writer.delete_missing_raw_data(self.participant_id, simulation_date, metric_types)
+        changed = await writer.merge_raw_data(only_changed=previous_digest is not None) + removed
+        await writer.write_daily_coverage(self.participant_id, simulation_date, batch['series'], metric_types)
+        await conn.execute("""
+            INSERT INTO ingestion_digest (participant_id, metric, date, digest, row_count, updated_at)
+            VALUES ($1, $2, $3, $4, $5, NOW())
+            ON CONFLICT (participant_id, metric, date) DO UPDATE SET
+                digest = EXCLUDED.digest,
+                row_count = EXCLUDED.row_count,
+                updated_at = EXCLUDED.updated_at
+        """, self.participant_id, metric, simulation_date, digest, records)
+        await self._advance_watermark_async(conn, metric, simulation_date, changed)
+        return changed
+
+    async def _advance_watermark_async(self, conn, metric, simulation_date, records_processed, content_written=True):
+        await conn.execute("""
+            INSERT INTO ingestion_watermark (participant_id, metric, last_date, rows_ingested, revision, updated_at)
+            VALUES ($1, $2, $3, $4, $5, NOW())
+            ON CONFLICT (participant_id, metric) DO UPDATE SET
+                last_date = GREATEST(ingestion_watermark.last_date, EXCLUDED.last_date),
+                rows_ingested = ingestion_watermark.rows_ingested + EXCLUDED.rows_ingested,
+                revision = ingestion_watermark.revision + EXCLUDED.revision,
+                updated_at = EXCLUDED.updated_at
+        """, self.participant_id, metric, simulation_date, records_processed, int(content_written))
+
+    async def create_pool(self, min_size=1, max_size=1):
+        """An asyncpg pool on the ingestion database"""
+        return await asyncpg.create_pool(
+            host=self.db_config['host'],
+            port=int(self.db_config['port']) if self.db_config['port'] else None,
+            database=self.db_config['database'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            min_size=min_size,
+            max_size=max_size,
+        )
+
+    async def _ingest_async(self, readers, pending, digests):
+        """
+        Pipelined ingestion: read, transform and write run as separate
+        stages joined by bounded queues, so parsing the next day overlaps
+        with writing the current one and at most `queue_size` days wait
+        between two stages. Each metric has a single writer so its
+        watermark only ever advances in order.
+        """
+        loop = asyncio.get_running_loop()
+        failed = set()
+        day_outcomes = {}
+        day_indexes = sorted(set().union(*pending.values()))
+        
+        parse_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queues = {metric: asyncio.Queue(maxsize=self.queue_size) for metric in pending}
+        
+        def discard(read):
+            read.cancel()
+            if read.done() and not read.cancelled():
+                read.exception()
+        
+        async def read_stage():
+            # Up to queue_size reads run ahead of the one being queued, so
+            # Web API round trips overlap while days still queue in order
+            order = iter([(day_index, metric) for day_index in day_indexes
+                          for metric, days_pending in pending.items() if day_index in days_pending])
+            reads = deque()
+            
+            def start_reads():
+                while len(reads) <= self.queue_size:
+                    item = next(order, None)
+                    if item is None:
+                        return
+                    day_index, metric = item
+                    reads.append((day_index, metric, None if metric in failed else asyncio.ensure_future(
+                        self._read_day_async(loop, metric, readers[metric], day_index))))
+            
+            start_reads()
+            try:
+                while reads:
+                    if self.stop_event is not None and self.stop_event.is_set():
+                        print(f"  Stopping, {len(reads)} reads discarded, days already read are still written")
+                        break
+                    day_index, metric, read = reads.popleft()
+                    start_reads()
+                    if metric in failed:
+                        if read is not None:
+                            discard(read)
+                        day_outcomes.setdefault(day_index, []).append(False)
+                        continue
+                    try:
+                        raw = await read
+                    except Exception as e:
+                        failed.add(metric)
+                        METRIC_INGESTION_ERRORS.labels(metric=metric).inc()
+                        self.run_stats['errors'][metric] = self.run_stats['errors'].get(metric, 0) + 1
+                        day_outcomes.setdefault(day_index, []).append(False)
+                        print(f"  {metric}: read failed for day {day_index + 1} - {str(e)}")
+                        continue
+                    await parse_queue.put((metric, day_index, raw))
+            finally:
+                for _, _, read in reads:
+                    if read is not None:
+                        discard(read)
+            await parse_queue.put(None)
+        
+        async def transform_stage():
+            while True:
+                item = await parse_queue.get()
+                if item is None:
+                    break
+                metric, day_index, raw = item
+                simulation_date = self.simulation_start + timedelta(days=day_index)
+                date_str = simulation_date.strftime('%Y-%m-%d')
+                try:
+                    transformed = await loop.run_in_executor(None, self._transform_metric_day, metric, raw, date_str)
+                except Exception as e:
+                    transformed = e
+                await write_queues[metric].put((day_index, simulation_date, transformed))
+            for queue in write_queues.values():
+                await queue.put(None)
+        
+        async def write_stage(pool, metric):
+            queue = write_queues[metric]
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                day_index, simulation_date, transformed = item
+                if metric in failed:
+                    # Keep draining so upstream stages never block on a dead writer
+                    day_outcomes.setdefault(day_index, []).append(False)
+                    continue
+                start_time = time.time()
+                try:
+                    if isinstance(transformed, Exception):
+                        raise transformed
+                    batch, payload, records, digest = transformed
+                    records = await self._write_metric_day_async(
+                        pool, metric, simulation_date.date(), batch, payload, records, digest,
+                        digests.get((metric, simulation_date.date()))
+                    )
+                except Exception as e:
+                    failed.add(metric)
+                    METRIC_INGESTION_ERRORS.labels(metric=metric).inc()
+                    self.run_stats['errors'][metric] = self.run_stats['errors'].get(metric, 0) + 1
+                    day_outcomes.setdefault(day_index, []).append(False)
+                    print(f"  {metric} {simulation_date.strftime('%Y-%m-%d')}: failed - {str(e)}")
+                    continue
+                self.run_stats['metrics'][metric] = self.run_stats['metrics'].get(metric, 0) + records
+                self.run_stats['records'] += records
+                day_outcomes.setdefault(day_index, []).append(True)
+                print(f"  {metric} {simulation_date.strftime('%Y-%m-%d')}: {records} records in {time.time() - start_time:.2f} seconds")
+        
+        start_time = time.time()
+        pool = self.pool or await self.create_pool(max_size=len(pending))
+        try:
+            with INGESTION_DURATION.time():
+                await asyncio.gather(read_stage(), transform_stage(),
+                                     *[write_stage(pool, metric) for metric in pending])
+        finally:
+            if pool is not self.pool:
+                await pool.close()
+        
+        for outcomes in day_outcomes.values():
+            if all(outcomes):
+                self.run_stats['days'] += 1
+                INGESTION_COUNTER.labels(status='success').inc()
+            else:
                 INGESTION_ERRORS.labels(error_type='general').inc()
                 INGESTION_COUNTER.labels(status='error').inc()
-                print(f"Error during ingestion: {str(e)}")
-                
-                if conn:
-                    conn.rollback()
-                
-                raise
-            finally:
-                if conn:
-                    self.close_db_conn(conn)
-                
-                duration = time.time() - start_time
-                print(f"Ingestion process completed in {duration:.2f} seconds")
+        
+        duration = time.time() - start_time
+        rows_per_second = self.run_stats['records'] / duration if duration > 0 else 0
+        print(f"Async ingestion processed {self.run_stats['records']} records in {duration:.2f} seconds ({rows_per_second:.0f} rows/sec).")
+        
+        if failed:
+            raise RuntimeError(f"Ingestion failed for metrics: {', '.join(sorted(failed))}")
+        
+        return self.run_stats
 
     def reset_simulation(self):
-        """Reset the simulation to start from day 0"""
-        if self.last_run_file.exists():
-            self.last_run_file.unlink()
-        print("Simulation reset to start from January 1, 2024")
+        """Reset the simulation to start from day 0 by clearing this participant's ledger entries"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM ingestion_watermark
+                WHERE participant_id = %s AND metric = ANY(%s)
+            """, (self.participant_id, self.metrics))
+            conn.commit()
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        print(f"Simulation for participant {self.participant_id} reset to start from {self.simulation_start.strftime('%Y-%m-%d')}")
+
+    def reconcile_stats(self):
+        """Re-derive participant_metric_stats from this participant's raw_data, returns metric types found"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            found = BulkWriter(conn).reconcile_metric_stats(cursor, self.participant_id)
+            conn.commit()
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        print(f"Participant {self.participant_id}: statistics reconciled for {found} metric types")
+        return found
+
+    def backfill_coverage(self):
+        """Fill daily_coverage and coverage_interval from this participant's raw_data, returns daily rows written"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            written = BulkWriter(conn).backfill_daily_coverage(cursor, self.participant_id)
+            conn.commit()
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        print(f"Participant {self.participant_id}: {written} coverage rows rebuilt")
+        return written
 
     def get_simulation_status(self):
-        """Get current simulation status"""
-        current_day = self._get_simulation_day()
-        data = self._get_synthetic_data()
-        total_days = len(data)
+        """Get current simulation status from the ingestion ledger"""
+        readers = self._get_metric_readers()
+        watermarks = self._get_watermarks()
+        
+        metrics = {}
+        for metric, reader in readers.items():
+            days_done = min(len(reader), self._next_day_index(watermarks.get(metric)))
+            metrics[metric] = f"{days_done}/{len(reader)}"
+        
+        current_day = min(
+            min(len(reader), self._next_day_index(watermarks.get(metric)))
+            for metric, reader in readers.items()
+        )
+        total_days = max(len(reader) for reader in readers.values())
         current_date = self.simulation_start + timedelta(days=current_day)
         
         return {
             'current_day': current_day,
             'total_days': total_days,
             'current_date': current_date.strftime('%Y-%m-%d'),
-            'progress': f"{current_day}/{total_days} days processed"
+            'progress': f"{current_day}/{total_days} days processed",
+            'metrics': metrics
         }
 
+    def get_participant_ids(self):
+        """All participants known to the database, falling back to participant 1"""
+        conn = None
+        try:
+            conn = self.get_db_conn
+            cursor = conn.cursor()
+            cursor.execute("SELECT participant_id FROM participant ORDER BY participant_id")
+            participant_ids = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+        finally:
+            if conn:
+                self.close_db_conn(conn)
+        return participant_ids or [1]
+
     def health_check(self):
         """Health check endpoint for monitoring"""
         try:
@@ -257,6 +998,116 @@ class DataIngestion:
             INGESTION_ERRORS.labels(error_type='health_check').inc()
             return {"status": "unhealthy", "error": str(e)}
 
+def ingest_participant(participant_id, days, options):
+    """Ingest one participant with its own connection and checkpoint, never raises"""
+    start_time = time.time()
+    ingestion = None
+    result = {'participant_id': participant_id, 'days': 0, 'records': 0, 'metrics': {}, 'errors': {},
+              'skipped': {}, 'status': 'success', 'error': None}
+    try:
+        ingestion = DataIngestion(participant_id=participant_id, serve_metrics=False, **options)
+        result.update(ingestion.ingest(days=days))
+    except FileNotFoundError as e:
+        result.update(status='skipped', error=str(e))
+    except Exception as e:
+        if ingestion:
+            result.update(ingestion.run_stats)
+        result.update(status='error', error=str(e))
+    result['duration'] = time.time() - start_time
+    return result
+
+def export_metrics():
+    """
+    Persist this run's metrics past process exit: push them to a Pushgateway
+    when PUSHGATEWAY_URL is set and/or write them in the textfile collector
+    format to INGESTION_METRICS_TEXTFILE.
+    """
+    pushgateway = os.getenv('PUSHGATEWAY_URL')
+    if pushgateway:
+        try:
+            push_to_gateway(pushgateway, job='fitbit-ingestion', registry=REGISTRY)
+            print(f"Metrics pushed to {pushgateway}")
+        except Exception as e:
+            print(f"Could not push metrics to {pushgateway} ({str(e)})")
+    
+    textfile = os.getenv('INGESTION_METRICS_TEXTFILE')
+    if textfile:
+        try:
+            write_to_textfile(textfile, REGISTRY)
+            print(f"Metrics written to {textfile}")
+        except Exception as e:
+            print(f"Could not write metrics to {textfile} ({str(e)})")
+
+class IngestionScheduler:
+    """Shards participants across a process pool so a slow or failing participant doesn't hold up the rest"""
+    def __init__(self, participant_ids, workers=1, **options):
+        self.participant_ids = list(participant_ids)
+        self.workers = max(1, workers)
+        self.options = options
+
+    def _record_result(self, result):
+        """Export counters for work done in a child process, whose own registry is discarded"""
+        for metric, rows in result['metrics'].items():
+            METRIC_ROWS_INGESTED.labels(metric=metric).inc(rows)
+        for metric, errors in result['errors'].items():
+            METRIC_INGESTION_ERRORS.labels(metric=metric).inc(errors)
+        for metric, skipped in result.get('skipped', {}).items():
+            METRIC_DAYS_SKIPPED.labels(metric=metric).inc(skipped)
+        for stage, metrics in result.get('stages', {}).items():
+            for metric, samples in metrics.items():
+                histogram = INGESTION_STAGE_DURATION.labels(stage=stage, metric=metric)
+                for elapsed in samples:
+                    histogram.observe(elapsed)
+        label = str(result['participant_id'])
+        if result['duration'] > 0:
+            INGESTION_ROWS_PER_SECOND.labels(participant_id=label).set(result['records'] / result['duration'])
+            INGESTION_BYTES_PER_SECOND.labels(participant_id=label).set(result.get('bytes', 0) / result['duration'])
+        if result.get('lag_days') is not None:
+            INGESTION_LAG_DAYS.labels(participant_id=label).set(result['lag_days'])
+        DATA_POINTS_PROCESSED.inc(result['records'])
+        RECORDS_PROCESSED.labels(data_type='raw_data').inc(result['records'])
+        INGESTION_COUNTER.labels(status='success').inc(result['days'])
+        if result['status'] == 'error':
+            INGESTION_COUNTER.labels(status='error').inc()
+            INGESTION_ERRORS.labels(error_type='general').inc()
+
+    def _report(self, done, result):
+        prefix = f"[{done}/{len(self.participant_ids)}] participant {result['participant_id']}"
+        if result['status'] == 'success':
+            print(f"{prefix}: {result['days']} days, {result['records']} records in {result['duration']:.2f} seconds")
+        else:
+            print(f"{prefix}: {result['status']} after {result['duration']:.2f} seconds - {result['error']}")
+
+    def run(self, days=1):
+        """Ingest up to `days` days for every participant, returns one result per participant"""
+        print(f"Ingesting {len(self.participant_ids)} participants with {self.workers} workers")
+        results = []
+        
+        if self.workers == 1:
+            for done, participant_id in enumerate(self.participant_ids, 1):
+                result = ingest_participant(participant_id, days, self.options)
+                results.append(result)
+                self._report(done, result)
+            return results
+        
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(ingest_participant, participant_id, days, self.options): participant_id
+                for participant_id in self.participant_ids
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'participant_id': futures[future], 'days': 0, 'records': 0, 'metrics': {},
+                              'errors': {}, 'status': 'error', 'error': str(e), 'duration': 0.0}
+                self._record_result(result)
+                results.append(result)
+                self._report(done, result)
+        
+        return results
+
 if __name__ == "__main__":
     os.makedirs(LOG_DIR, exist_ok=True)
     
@@ -271,33 +1122,98 @@ if __name__ == "__main__":
     parser.add_argument('--reset', action='store_true', help="Reset the simulation to start from day 0")
     parser.add_argument('--status', action='store_true', help="Get current simulation status")
     parser.add_argument('--health', action='store_true', help="Perform health check")
+    parser.add_argument('--reconcile-stats', action='store_true',
+                        help="Re-derive participant_metric_stats from raw_data")
+    parser.add_argument('--backfill-coverage', action='store_true',
+                        help="Rebuild daily_coverage and coverage_interval from raw_data for data ingested before they existed")
     parser.add_argument('--days', type=int, default=1, help="Number of days to ingest (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('INGESTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                        help=f"Rows per COPY batch into the staging table (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--metrics', type=str, default=','.join(METRIC_LOADERS),
+                        help=f"Comma separated metrics to ingest (default: {','.join(METRIC_LOADERS)})")
+    parser.add_argument('--participants', type=str, default=None,
+                        help="Comma separated participant ids (default: every participant in the database)")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('INGESTION_WORKERS', 1)),
+                        help="Number of participants ingested in parallel (default: 1)")
+    parser.add_argument('--mode', choices=INGESTION_MODES, default=os.getenv('INGESTION_MODE', 'sync'),
+                        help="sync: one day at a time over psycopg2, async: pipelined read/transform/write over asyncpg")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"Days buffered between async pipeline stages (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--live', action='store_true', default=os.getenv('INGESTION_SOURCE') == 'fitbit',
+                        help="Fetch from the Fitbit Web API with each participant's token instead of the synthetic files, always async")
+    parser.add_argument('--api-url', type=str, default=os.getenv('FITBIT_API_URL', FITBIT_API_URL),
+                        help=f"Web API base URL for --live, e.g. a local stub server (default: {FITBIT_API_URL})")
+    parser.add_argument('--fetch-concurrency', type=int, default=DEFAULT_FETCH_CONCURRENCY,
+                        help=f"Concurrent Web API requests per participant with --live (default: {DEFAULT_FETCH_CONCURRENCY})")
     args = parser.parse_args()
-    ingestion = DataIngestion(synthetic=True)
+    options = {
+        'synthetic': not args.live,
+        'api_url': args.api_url,
+        'fetch_concurrency': args.fetch_concurrency,
+        'mode': args.mode,
+        'queue_size': args.queue_size,
+        'batch_size': args.batch_size,
+        'metrics': [metric.strip() for metric in args.metrics.split(',') if metric.strip()],
+    }
+    ingestion = DataIngestion(**options)
+    
+    if args.health:
+        health = ingestion.health_check()
+        print(f"Health Status: {health}")
+        sys.exit(0 if health['status'] == 'healthy' else 1)
+    
+    if args.participants:
+        participant_ids = [int(pid) for pid in args.participants.split(',') if pid.strip()]
+    else:
+        try:
+            participant_ids = ingestion.get_participant_ids()
+        except Exception as e:
+            print(f"Could not list participants ({str(e)}), using participant 1")
+            participant_ids = [1]
 
     if args.reset:
-        ingestion.reset_simulation()
+        for participant_id in participant_ids:
+            DataIngestion(participant_id=participant_id, serve_metrics=False, **options).reset_simulation()
         print("Simulation reset successfully.")
         sys.exit(0)
     
-    if args.status:
-        status = ingestion.get_simulation_status()
-        print(f"Simulation Status: {status['progress']}")
-        print(f"Next Date to Process: {status['current_date']}")
+    if args.reconcile_stats:
+        for participant_id in participant_ids:
+            DataIngestion(participant_id=participant_id, serve_metrics=False, **options).reconcile_stats()
         sys.exit(0)
     
-    if args.health:
-        health = ingestion.health_check()
-        print(f"Health Status: {health}")
-        sys.exit(0 if health['status'] == 'healthy' else 1)
+    if args.backfill_coverage:
+        for participant_id in participant_ids:
+            DataIngestion(participant_id=participant_id, serve_metrics=False, **options).backfill_coverage()
+        sys.exit(0)
+    
+    if args.status:
+        for participant_id in participant_ids:
+            try:
+                status = DataIngestion(participant_id=participant_id, serve_metrics=False, **options).get_simulation_status()
+            except FileNotFoundError:
+                print(f"Participant {participant_id}: no synthetic data")
+                continue
+            print(f"Participant {participant_id} Simulation Status: {status['progress']}")
+            print(f"Participant {participant_id} Next Date to Process: {status['current_date']}")
+            for metric, progress in status['metrics'].items():
+                print(f"  {metric}: {progress} days processed")
+        sys.exit(0)
     
     try:
-        status = ingestion.get_simulation_status()
-        print(f"Simulation Status: {status['progress']}")
-        print(f"Next Date to Process: {status['current_date']}")
-        
-        ingestion.ingest(days=args.days)
+        scheduler = IngestionScheduler(participant_ids, workers=args.workers, **options)
+        results = scheduler.run(days=args.days)
         
     except Exception as e:
         print(f"Fatal error: {str(e)}")
+        INGESTION_ERRORS.labels(error_type='fatal').inc()
+        export_metrics()
+        sys.exit(1)
+    
+    failed = any(result['status'] == 'error' for result in results)
+    if not failed:
+        INGESTION_LAST_SUCCESS.set_to_current_time()
+    export_metrics()
+    
+    if failed:
         sys.exit(1)
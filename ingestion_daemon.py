@@ -0,0 +1,272 @@
+"""
+Resident ingestion service, replacing the cron-spawned ingestion.py runs.
+
+Every metric is polled on its own interval, a poll ingests that metric for
+every participant through the async pipeline. The asyncpg and psycopg2
+pools, the Fitbit API session and each participant's quota bucket are kept
+across polls, and participant_metric_stats is reconciled weekly as the
+second cron entry did. The metrics endpoint stays up for the life of the
+process. SIGTERM stops reading new days and waits for the days already
+read to be written.
+"""
+import sys
+import os
+import argparse
+import asyncio
+import signal
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from psycopg2.pool import ThreadedConnectionPool
+
+from ingestion import (LOG_DIR, METRIC_LOADERS, INGESTION_LAST_SUCCESS, DEFAULT_BATCH_SIZE, DEFAULT_FETCH_CONCURRENCY,
+                       DEFAULT_QUEUE_SIZE, LIVE_BACKFILL_DAYS, DataIngestion, observe_fitbit_response)
+from utils import Logger, FitbitClient, TokenBucket, FITBIT_API_URL
+
+# Seconds between polls of a metric with --live: intraday series fill up
+# through the day, the ones Fitbit derives from sleep arrive once a night
+LIVE_POLL_INTERVALS = {'hr': 900, 'azm': 900, 'activity': 900, 'br': 3600, 'hrv': 3600, 'spo2': 3600}
+# Synthetic data advances one simulated day per poll, once a day as under cron
+SYNTHETIC_POLL_INTERVAL = 86400
+# Sunday 03:00, when the weekly cron entry ran
+RECONCILE_WEEKDAY = 6
+RECONCILE_HOUR = 3
+DEFAULT_DRAIN_TIMEOUT = 90
+METRICS_PORT = 8001
+
+POLLS = Counter('ingestion_polls_total', 'Scheduled polls of a metric across all participants', ['metric', 'status'])
+POLL_DURATION = Histogram('ingestion_poll_duration_seconds', 'Duration of a scheduled poll of a metric across all participants',
+                          ['metric'], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+NEXT_POLL = Gauge('ingestion_next_poll_timestamp_seconds', 'Unix time of the next scheduled poll of a metric', ['metric'])
+RUNS_IN_FLIGHT = Gauge('ingestion_runs_in_flight', 'Participant runs currently in progress in the ingestion daemon')
+
+
+def parse_intervals(value):
+    """metric=seconds pairs, comma separated"""
+    intervals = {}
+    for pair in filter(None, (item.strip() for item in value.split(','))):
+        metric, _, seconds = pair.partition('=')
+        if metric.strip() not in METRIC_LOADERS:
+            raise ValueError(f"Unknown metric '{metric.strip()}' in poll intervals")
+        intervals[metric.strip()] = float(seconds)
+    return intervals
+
+
+def next_weekly(now, weekday=RECONCILE_WEEKDAY, hour=RECONCILE_HOUR):
+    """The first `weekday` at `hour` o'clock after `now`"""
+    candidate = now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=(weekday - now.weekday()) % 7)
+    if candidate <= now:
+        candidate += timedelta(days=7)
+    return candidate
+
+
+class IngestionDaemon:
+    """Polls each metric for every participant on its own interval until stopped"""
+    def __init__(self, intervals, participant_ids=None, days=1, workers=1, run_at_start=True,
+                 drain_timeout=DEFAULT_DRAIN_TIMEOUT, **options):
+        self.intervals = intervals
+        # None lists the participants again before every poll, so new ones are picked up
+        self.participant_ids = participant_ids
+        self.days = days
+        self.workers = max(1, workers)
+        self.run_at_start = run_at_start
+        self.drain_timeout = drain_timeout
+        self.options = options
+        self.stop_event = None
+        self.pool = None
+        self.conn_pool = None
+        self.client = None
+        self._buckets = {}
+        self._poll_ok = {}
+
+    def _ingestion(self, participant_id, metrics):
+        live = not self.options.get('synthetic', True)
+        if live and participant_id not in self._buckets:
+            self._buckets[participant_id] = TokenBucket()
+        return DataIngestion(participant_id=participant_id, metrics=metrics, serve_metrics=False, mode='async',
+                             pool=self.pool, conn_pool=self.conn_pool, fitbit_client=self.client,
+                             token_bucket=self._buckets.get(participant_id), stop_event=self.stop_event,
+                             **self.options)
+
+    async def _participant_ids(self):
+        if self.participant_ids:
+            return self.participant_ids
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._ingestion(1, None).get_participant_ids)
+
+    async def _wait_until(self, deadline):
+        """Sleep until `deadline`, returns True if the daemon is stopped first"""
+        if self.stop_event.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=max(0.0, deadline - time.time()))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def poll(self, metric):
+        """Ingest one metric for every participant, `workers` at a time, returns whether none failed"""
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def run(participant_id):
+            async with semaphore:
+                if self.stop_event.is_set():
+                    return True
+                RUNS_IN_FLIGHT.inc()
+                try:
+                    stats = await self._ingestion(participant_id, [metric]).ingest_async(days=self.days)
+                    print(f"Participant {participant_id} {metric}: {stats['days']} days, {stats['records']} records")
+                    return True
+                except FileNotFoundError as e:
+                    print(f"Participant {participant_id} {metric}: skipped - {str(e)}")
+                    return True
+                except Exception as e:
+                    print(f"Participant {participant_id} {metric}: failed - {str(e)}")
+                    return False
+                finally:
+                    RUNS_IN_FLIGHT.dec()
+
+        participant_ids = await self._participant_ids()
+        return all(await asyncio.gather(*[run(participant_id) for participant_id in participant_ids]))
+
+    async def schedule(self, metric, interval):
+        """Poll `metric` every `interval` seconds, a poll that overruns is followed by the next one right away"""
+        next_poll = time.time() if self.run_at_start else time.time() + interval
+        while True:
+            NEXT_POLL.labels(metric=metric).set(next_poll)
+            if await self._wait_until(next_poll):
+                return
+            started = time.time()
+            print(f"Polling {metric} at {datetime.now()}")
+            try:
+                with POLL_DURATION.labels(metric=metric).time():
+                    ok = await self.poll(metric)
+            except Exception as e:
+                print(f"Poll of {metric} failed - {str(e)}")
+                ok = False
+            POLLS.labels(metric=metric, status='success' if ok else 'error').inc()
+            self._poll_ok[metric] = ok
+            if all(self._poll_ok.get(name) for name in self.intervals):
+                INGESTION_LAST_SUCCESS.set_to_current_time()
+            next_poll = max(time.time(), started + interval)
+
+    async def reconcile_weekly(self):
+        """Re-derive participant_metric_stats once a week, correcting any drift of the running totals"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if await self._wait_until(next_weekly(datetime.now()).timestamp()):
+                return
+            try:
+                for participant_id in await self._participant_ids():
+                    await loop.run_in_executor(None, self._ingestion(participant_id, None).reconcile_stats)
+            except Exception as e:
+                print(f"Statistics reconciliation failed - {str(e)}")
+
+    def stop(self):
+        if not self.stop_event.is_set():
+            print(f"Stopping at {datetime.now()}, draining in-flight batches for up to {self.drain_timeout} seconds")
+            self.stop_event.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        # Every metric may be polling `workers` participants at once, each run
+        # writing over one asyncpg connection and reading its ledger over one psycopg2 connection
+        concurrency = self.workers * len(self.intervals)
+        template = DataIngestion(serve_metrics=False, **self.options)
+        self.conn_pool = ThreadedConnectionPool(1, concurrency + len(self.intervals) + 1, **template.db_config)
+        self.pool = await template.create_pool(min_size=1, max_size=concurrency)
+        if not template.synthetic:
+            self.client = FitbitClient(template.api_url, concurrency=template.fetch_concurrency * self.workers,
+                                       on_response=observe_fitbit_response)
+
+        try:
+            async with (self.client or nullcontext()):
+                tasks = [asyncio.create_task(self.schedule(metric, interval))
+                         for metric, interval in self.intervals.items()]
+                tasks.append(asyncio.create_task(self.reconcile_weekly()))
+                await self.stop_event.wait()
+
+                done, unfinished = await asyncio.wait(tasks, timeout=self.drain_timeout)
+                for task in unfinished:
+                    task.cancel()
+                await asyncio.gather(*unfinished, return_exceptions=True)
+                if unfinished:
+                    print(f"Drain timed out, {len(unfinished)} schedules cancelled")
+        finally:
+            await self.pool.close()
+            self.conn_pool.closeall()
+        print(f"Ingestion daemon stopped at {datetime.now()}")
+
+
+if __name__ == "__main__":
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    log_file = LOG_DIR / f"daemon_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
+    print(f"Logging to {log_file}")
+
+    sys.stdout = Logger(log_file)
+    sys.stderr = sys.stdout
+
+    parser = argparse.ArgumentParser(description="Long-running ingestion service")
+    parser.add_argument('--metrics', type=str, default=','.join(METRIC_LOADERS),
+                        help=f"Comma separated metrics to poll (default: {','.join(METRIC_LOADERS)})")
+    parser.add_argument('--intervals', type=parse_intervals, default=os.getenv('INGESTION_POLL_INTERVALS', ''),
+                        help="Comma separated metric=seconds poll intervals overriding the defaults "
+                             f"(default: {SYNTHETIC_POLL_INTERVAL} per metric, with --live "
+                             f"{','.join(f'{metric}={seconds}' for metric, seconds in LIVE_POLL_INTERVALS.items())})")
+    parser.add_argument('--days', type=int, default=None,
+                        help=f"Days ingested per metric and poll at most (default: 1, with --live {LIVE_BACKFILL_DAYS})")
+    parser.add_argument('--participants', type=str, default=None,
+                        help="Comma separated participant ids (default: every participant in the database, listed before each poll)")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('INGESTION_WORKERS', 1)),
+                        help="Participants ingested in parallel per metric (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('INGESTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                        help=f"Rows per COPY batch into the staging table (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"Days buffered between async pipeline stages (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--live', action='store_true', default=os.getenv('INGESTION_SOURCE') == 'fitbit',
+                        help="Fetch from the Fitbit Web API with each participant's token instead of the synthetic files")
+    parser.add_argument('--api-url', type=str, default=os.getenv('FITBIT_API_URL', FITBIT_API_URL),
+                        help=f"Web API base URL for --live, e.g. a local stub server (default: {FITBIT_API_URL})")
+    parser.add_argument('--fetch-concurrency', type=int, default=DEFAULT_FETCH_CONCURRENCY,
+                        help=f"Concurrent Web API requests per participant with --live (default: {DEFAULT_FETCH_CONCURRENCY})")
+    parser.add_argument('--skip-initial-poll', action='store_true',
+                        help="Wait a full interval before the first poll of each metric instead of polling at startup")
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help=f"Seconds to finish in-flight batches after SIGTERM (default: {DEFAULT_DRAIN_TIMEOUT})")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help=f"Port of the Prometheus metrics endpoint (default: {METRICS_PORT})")
+    args = parser.parse_args()
+
+    metrics = [metric.strip() for metric in args.metrics.split(',') if metric.strip()]
+    intervals = {metric: LIVE_POLL_INTERVALS.get(metric, SYNTHETIC_POLL_INTERVAL) if args.live else SYNTHETIC_POLL_INTERVAL
+                 for metric in metrics}
+    intervals.update({metric: seconds for metric, seconds in args.intervals.items() if metric in intervals})
+    participant_ids = [int(pid) for pid in args.participants.split(',') if pid.strip()] if args.participants else None
+
+    start_http_server(args.metrics_port)
+    print(f"Prometheus metrics server started on port {args.metrics_port}")
+    print(f"Polling {', '.join(f'{metric} every {seconds:g}s' for metric, seconds in intervals.items())}")
+
+    daemon = IngestionDaemon(
+        intervals,
+        participant_ids=participant_ids,
+        days=args.days or (LIVE_BACKFILL_DAYS if args.live else 1),
+        workers=args.workers,
+        run_at_start=not args.skip_initial_poll,
+        drain_timeout=args.drain_timeout,
+        synthetic=not args.live,
+        api_url=args.api_url,
+        fetch_concurrency=args.fetch_concurrency,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+    )
+    asyncio.run(daemon.run())
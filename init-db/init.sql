@@ -5,6 +5,8 @@ CREATE TABLE IF NOT EXISTS raw_data (
     timestamp TIMESTAMPTZ NOT NULL,
     metric_type TEXT NOT NULL,
     value DOUBLE PRECISION NOT NULL,
+    -- Filled in by the imputation engine rather than measured, a measurement replaces it
+    imputed BOOLEAN NOT NULL DEFAULT FALSE,
     PRIMARY KEY (participant_id, timestamp, metric_type)
 );
 
@@ -30,69 +32,108 @@ CREATE TABLE IF NOT EXISTS heart_rate_zones (
     PRIMARY KEY (participant_id, date, zone_name)
 );
 
-CREATE MATERIALIZED VIEW hr_1m
+-- One rollup hierarchy for every metric type. Sums and counts are kept
+-- instead of averages so each level re-aggregates the one below exactly,
+-- the average of a bucket is sum_value / count_value.
+-- Imputed points are included, only raw_data can tell them apart.
+CREATE MATERIALIZED VIEW metric_1m
 WITH (timescaledb.continuous) AS
 SELECT
   participant_id,
+  metric_type,
   time_bucket('1 minute', timestamp) AS bucket,
-  avg(value) AS avg_hr,
-  min(value) AS min_hr,
-  max(value) AS max_hr
+  sum(value) AS sum_value,
+  count(*) AS count_value,
+  min(value) AS min_value,
+  max(value) AS max_value
 FROM raw_data
-WHERE metric_type = 'heart_rate'
-GROUP BY participant_id, bucket;
+GROUP BY participant_id, metric_type, bucket;
 
-CREATE MATERIALIZED VIEW hr_1h
+CREATE MATERIALIZED VIEW metric_1h
 WITH (timescaledb.continuous) AS
 SELECT
   participant_id,
+  metric_type,
   time_bucket('1 hour', bucket) AS bucket,
-  avg(avg_hr) AS avg_hr,
-  min(min_hr) AS min_hr,
-  max(max_hr) AS max_hr
-FROM hr_1m
-GROUP BY participant_id, time_bucket('1 hour', bucket);
-
-CREATE MATERIALIZED VIEW hr_1d
+  sum(sum_value) AS sum_value,
+  sum(count_value) AS count_value,
+  min(min_value) AS min_value,
+  max(max_value) AS max_value
+FROM metric_1m
+GROUP BY participant_id, metric_type, time_bucket('1 hour', bucket);
+
+CREATE MATERIALIZED VIEW metric_1d
 WITH (timescaledb.continuous) AS
 SELECT
   participant_id,
+  metric_type,
   time_bucket('1 day', bucket) AS bucket,
-  avg(avg_hr) AS avg_hr,
-  min(min_hr) AS min_hr,
-  max(max_hr) AS max_hr
-FROM hr_1h
-GROUP BY participant_id, time_bucket('1 day', bucket);
+  sum(sum_value) AS sum_value,
+  sum(count_value) AS count_value,
+  min(min_value) AS min_value,
+  max(max_value) AS max_value
+FROM metric_1h
+GROUP BY participant_id, metric_type, time_bucket('1 day', bucket);
 
 SELECT add_continuous_aggregate_policy(
-  'hr_1m',
+  'metric_1m',
   start_offset => INTERVAL '1000 days',
   end_offset   => INTERVAL '5 minutes',
   schedule_interval => INTERVAL '5 minutes');
 
 SELECT add_continuous_aggregate_policy(
-  'hr_1h',
+  'metric_1h',
   start_offset => INTERVAL '1000 days',
   end_offset   => INTERVAL '2 hours',
   schedule_interval => INTERVAL '5 minutes');
 
 SELECT add_continuous_aggregate_policy(
-  'hr_1d',
+  'metric_1d',
   start_offset => INTERVAL '1000 days',
   end_offset   => INTERVAL '1 day',
   schedule_interval => INTERVAL '5 minutes');
 
+-- The levels the API can serve, finest first. A query spanning up to
+-- max_span_days is answered from that level, NULL means any span.
+CREATE TABLE IF NOT EXISTS rollup_level (
+    level TEXT PRIMARY KEY,
+    relation TEXT NOT NULL,
+    bucket_width INTERVAL NOT NULL,
+    max_span_days INTEGER,
+    description TEXT NOT NULL
+);
+
+INSERT INTO rollup_level (level, relation, bucket_width, max_span_days, description) VALUES
+  ('raw', 'raw_data',  INTERVAL '1 second', 7,    'Raw data points (<= 7 days)'),
+  ('1m',  'metric_1m', INTERVAL '1 minute', 30,   '1-minute aggregates (8-30 days)'),
+  ('1h',  'metric_1h', INTERVAL '1 hour',   365,  '1-hour aggregates (31-365 days)'),
+  ('1d',  'metric_1d', INTERVAL '1 day',    NULL, '1-day aggregates (> 365 days)')
+ON CONFLICT (level) DO NOTHING;
+
+-- The former heart-rate-only aggregates, kept as views for existing queries
+CREATE VIEW hr_1m AS
+SELECT participant_id, bucket, sum_value / count_value AS avg_hr, min_value AS min_hr, max_value AS max_hr
+FROM metric_1m WHERE metric_type = 'heart_rate';
+
+CREATE VIEW hr_1h AS
+SELECT participant_id, bucket, sum_value / count_value AS avg_hr, min_value AS min_hr, max_value AS max_hr
+FROM metric_1h WHERE metric_type = 'heart_rate';
+
+CREATE VIEW hr_1d AS
+SELECT participant_id, bucket, sum_value / count_value AS avg_hr, min_value AS min_hr, max_value AS max_hr
+FROM metric_1d WHERE metric_type = 'heart_rate';
+
 ALTER TABLE raw_data SET (timescaledb.compress,
                           timescaledb.compress_segmentby = 'participant_id');
 SELECT add_compression_policy('raw_data', INTERVAL '30 days');
 
-ALTER MATERIALIZED VIEW hr_1m SET (timescaledb.compress,
-                                   timescaledb.compress_segmentby = 'participant_id');
-SELECT add_compression_policy('hr_1m', INTERVAL '14 days');
+ALTER MATERIALIZED VIEW metric_1m SET (timescaledb.compress,
+                                       timescaledb.compress_segmentby = 'participant_id, metric_type');
+SELECT add_compression_policy('metric_1m', INTERVAL '14 days');
 
-ALTER MATERIALIZED VIEW hr_1h SET (timescaledb.compress,
-                                   timescaledb.compress_segmentby = 'participant_id');
-SELECT add_compression_policy('hr_1h', INTERVAL '90 days');
+ALTER MATERIALIZED VIEW metric_1h SET (timescaledb.compress,
+                                       timescaledb.compress_segmentby = 'participant_id, metric_type');
+SELECT add_compression_policy('metric_1h', INTERVAL '90 days');
 
 CREATE INDEX raw_data_pid_time_idx
   ON raw_data (participant_id, timestamp DESC);
@@ -106,3 +147,109 @@ CREATE TABLE IF NOT EXISTS participant (
     token TEXT UNIQUE
 );
 
+CREATE TABLE IF NOT EXISTS ingestion_watermark (
+    participant_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    last_date DATE NOT NULL,
+    rows_ingested BIGINT NOT NULL DEFAULT 0,
+    -- Days whose content was written, also when that touched no raw rows
+    -- but only summaries, zones or coverage. Skipped unchanged days don't count
+    revision BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (participant_id, metric)
+);
+
+-- Running totals per participant and series, moved by the same statement
+-- that merges rows into raw_data, so summaries never scan the hypertable.
+-- last_seen is when ingestion last wrote the series. Only measured points
+-- are counted, imputed ones are not.
+CREATE TABLE IF NOT EXISTS participant_metric_stats (
+    participant_id INTEGER NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    first_timestamp TIMESTAMPTZ NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    last_seen TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (participant_id, metric_type)
+);
+
+-- Measured points per participant, series and day, maintained by ingestion
+-- in the same transaction as the rows, so cohort-wide adherence never scans
+-- raw_data. Imputed points are not coverage and are left out here as well as
+-- in coverage_interval
+CREATE TABLE IF NOT EXISTS daily_coverage (
+    participant_id INTEGER NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    date DATE NOT NULL,
+    points INTEGER NOT NULL,
+    first_timestamp TIMESTAMPTZ NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (participant_id, metric_type, date)
+);
+
+CREATE INDEX IF NOT EXISTS daily_coverage_metric_date_idx
+ON daily_coverage (metric_type, date) INCLUDE (participant_id, points);
+
+-- Run-length encoded coverage: one row per run of samples at most a minute
+-- apart, written with daily_coverage. Runs are split at midnight UTC so
+-- re-ingesting a day replaces just that day's rows. Coverage percentages
+-- and gap lists over any range are sums and window functions over a few
+-- rows per day, without touching raw_data.
+CREATE TABLE IF NOT EXISTS coverage_interval (
+    participant_id INTEGER NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    date DATE NOT NULL,
+    start_time TIMESTAMPTZ NOT NULL,
+    end_time TIMESTAMPTZ NOT NULL,
+    points INTEGER NOT NULL,
+    PRIMARY KEY (participant_id, metric_type, date, start_time)
+);
+
+CREATE INDEX IF NOT EXISTS coverage_interval_pid_metric_start_idx
+ON coverage_interval (participant_id, metric_type, start_time) INCLUDE (end_time, points);
+
+-- Readers caching query results LISTEN here, a payload is a participant
+-- whose ledger moved. Every change notifies, readers re-read their version
+-- and only drop entries when it differs
+CREATE OR REPLACE FUNCTION notify_ingestion_watermark() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('ingestion_watermark', OLD.participant_id::text);
+    ELSE
+        PERFORM pg_notify('ingestion_watermark', NEW.participant_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ingestion_watermark_notify
+AFTER INSERT OR UPDATE OR DELETE ON ingestion_watermark
+FOR EACH ROW EXECUTE FUNCTION notify_ingestion_watermark();
+
+CREATE TABLE IF NOT EXISTS ingestion_digest (
+    participant_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    date DATE NOT NULL,
+    digest BYTEA NOT NULL,
+    row_count INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (participant_id, metric, date)
+);
+
+-- Background imputation runs, polled through GET /imputation/jobs/{job_id}
+CREATE TABLE IF NOT EXISTS imputation_job (
+    job_id BIGSERIAL PRIMARY KEY,
+    participant_id INTEGER NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    method VARCHAR(20) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    days_total INTEGER NOT NULL,
+    days_done INTEGER NOT NULL DEFAULT 0,
+    imputed_points BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
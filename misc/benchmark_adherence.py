@@ -0,0 +1,110 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.src.queries import ADHERENCE_SQL
+
+load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env", override=True)
+
+TARGET_MS = 100
+
+# The per-participant queries /adherence used to run, twice per participant
+N_PLUS_ONE_SQL = [
+    "SELECT MAX(timestamp) FROM raw_data WHERE participant_id = %s AND metric_type = 'heart_rate'",
+    "SELECT COUNT(*) FROM raw_data WHERE participant_id = %s AND metric_type = 'heart_rate' "
+    "AND timestamp >= NOW() - INTERVAL '7 days'",
+]
+
+
+def seed(cur, first, last, days):
+    """Benchmark participants with heart rate coverage every day and sleep on two nights out of three"""
+    cur.execute("""
+        INSERT INTO participant (participant_id, name, token)
+        SELECT g, 'Benchmark ' || g, 'benchmark-' || g FROM generate_series(%s, %s) g
+        ON CONFLICT DO NOTHING
+    """, (first, last))
+    cur.execute("""
+        INSERT INTO daily_coverage (participant_id, metric_type, date, points, first_timestamp, last_timestamp)
+        SELECT g, m.metric_type, d::date, m.points - (g %% 5000), d, d + INTERVAL '23:59:59'
+        FROM generate_series(%s, %s) g
+        CROSS JOIN generate_series(CURRENT_DATE - %s + 1, CURRENT_DATE, INTERVAL '1 day') d
+        CROSS JOIN (VALUES ('heart_rate', 86400), ('breathing_rate', 5000)) AS m(metric_type, points)
+        WHERE m.metric_type = 'heart_rate' OR (g + EXTRACT(DOY FROM d)::int) %% 3 <> 0
+        ON CONFLICT DO NOTHING
+    """, (first, last, days))
+    cur.execute("ANALYZE participant")
+    cur.execute("ANALYZE daily_coverage")
+
+
+def cleanup(cur, first, last):
+    cur.execute("DELETE FROM daily_coverage WHERE participant_id BETWEEN %s AND %s", (first, last))
+    cur.execute("DELETE FROM participant WHERE participant_id BETWEEN %s AND %s", (first, last))
+
+
+def time_query(cur, sql, params=None, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        timings.append(time.perf_counter() - start)
+    return timings, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cohort-wide adherence against the per-participant queries it replaced")
+    parser.add_argument('--participants', type=int, default=10000, help="Synthetic participants to add (default: 10000)")
+    parser.add_argument('--first-participant', type=int, default=900000, help="First synthetic participant id (default: 900000)")
+    parser.add_argument('--days', type=int, default=30, help="Days of coverage per participant (default: 30)")
+    parser.add_argument('--sample', type=int, default=50, help="Participants timed with the old per-participant queries (default: 50)")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of the set-based query (default: 5)")
+    parser.add_argument('--keep', action='store_true', help="Keep the synthetic participants afterwards")
+    args = parser.parse_args()
+
+    first, last = args.first_participant, args.first_participant + args.participants - 1
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        port=os.getenv('DB_PORT'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+    )
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        start = time.perf_counter()
+        seed(cur, first, last, args.days)
+        print(f"Seeded {args.participants:,} participants x {args.days} days in {time.perf_counter() - start:.1f}s")
+
+        timings, rows = time_query(cur, ADHERENCE_SQL, repeat=args.repeat)
+        best, median = min(timings) * 1000, statistics.median(timings) * 1000
+        print(f"Set-based adherence: {len(rows):,} participants, best {best:.1f} ms, median {median:.1f} ms")
+
+        cur.execute("SELECT participant_id FROM participant ORDER BY participant_id LIMIT %s", (args.sample,))
+        sample = [row[0] for row in cur.fetchall()]
+        start = time.perf_counter()
+        for participant_id in sample:
+            for sql in N_PLUS_ONE_SQL:
+                cur.execute(sql, (participant_id,))
+                cur.fetchall()
+        per_participant = (time.perf_counter() - start) / len(sample)
+        print(f"Per-participant queries: {per_participant * 1000:.2f} ms per participant, "
+              f"~{per_participant * len(rows):.1f} s for the cohort when run one after another")
+    finally:
+        if not args.keep:
+            cleanup(cur, first, last)
+        cur.close()
+        conn.close()
+
+    if median > TARGET_MS:
+        print(f"FAILED: median {median:.1f} ms is over the {TARGET_MS} ms target")
+        sys.exit(1)
+    print(f"Median under the {TARGET_MS} ms target")
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from pydantic import TypeAdapter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py reads its settings on import, the offline benchmark never connects
+for name in ("DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD"):
+    os.environ.setdefault(name, "0" if name == "DB_PORT" else "benchmark")
+
+from backend.src.export import ARROW_STREAM_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, arrow_ipc, columnar_json, export_columns
+from backend.src.main import DataResponse, page_items
+from backend.src.pagination import encode_cursor
+from backend.src.queries import RELATIONS
+
+REPEAT = 5
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_rows(count, agg_level):
+    """Rows as asyncpg returns them for a page of `count` points"""
+    if agg_level == "raw":
+        return [(1, START + timedelta(seconds=i), "heart_rate", float(60 + i % 90), False) for i in range(count)]
+    return [(1, START + timedelta(minutes=i), 60.0 + i % 90 + 0.25, float(50 + i % 40), float(120 + i % 60))
+            for i in range(count)]
+
+
+def metadata_for(rows, agg_level):
+    return {"aggregation_level": agg_level, "query_span_days": 7, "total_points": len(rows), "participant_ids": [1],
+            "start_date": START.date(), "end_date": (START + timedelta(days=7)).date(), "next_cursor": encode_cursor(rows[-1][1], rows[-1][0])}
+
+
+def model_path(rows, agg_level, adapter=TypeAdapter(DataResponse)):
+    """What FastAPI does for response_model=DataResponse: a dict per row, validate, dump, json.dumps"""
+    payload = {"data": page_items(rows, agg_level), "metadata": metadata_for(rows, agg_level)}
+    return json.dumps(adapter.dump_python(adapter.validate_python(payload), mode="json"), separators=(",", ":")).encode()
+
+
+def columnar_path(rows, agg_level):
+    return columnar_json(export_columns(RELATIONS[agg_level]), rows, metadata_for(rows, agg_level))
+
+
+def arrow_path(rows, agg_level):
+    return arrow_ipc(export_columns(RELATIONS[agg_level]), rows, metadata_for(rows, agg_level))
+
+
+def offline(sizes):
+    paths = [("models (JSON)", model_path), ("columnar JSON", columnar_path), ("Arrow IPC", arrow_path)]
+    for agg_level in ("raw", "1m"):
+        for size in sizes:
+            rows = make_rows(size, agg_level)
+            print(f"\n{agg_level}, {size:,} points per page")
+            baseline = None
+            for name, func in paths:
+                try:
+                    best = min(timeit.repeat(lambda: func(rows, agg_level), number=1, repeat=REPEAT))
+                except RuntimeError as e:
+                    print(f"  {name:<16} skipped: {e}")
+                    continue
+                body = len(func(rows, agg_level))
+                baseline = baseline or (best, body)
+                print(f"  {name:<16} {best * 1000:8.1f} ms  {body / 1024:9.1f} KiB"
+                      f"  ({baseline[0] / best:4.1f}x faster, {baseline[1] / body:4.1f}x smaller)")
+
+
+def live(url, params):
+    """The same page fetched end to end from a running API in each format"""
+    import requests
+
+    for name, accept in [("models (JSON)", "application/json"), ("columnar JSON", COLUMNAR_MEDIA_TYPE),
+                         ("Arrow IPC", ARROW_STREAM_MEDIA_TYPE)]:
+        timings = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            response = requests.get(f"{url}/data", params=params, headers={"Accept": accept})
+            response.raise_for_status()
+            timings.append(time.perf_counter() - start)
+        print(f"  {name:<16} {min(timings) * 1000:8.1f} ms  {len(response.content) / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serialization cost and payload size of the /data formats")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Page sizes to encode offline")
+    parser.add_argument('--url', help="Also time a running API, e.g. http://localhost:8000")
+    parser.add_argument('--start-date', default="2024-01-01", help="Start date for --url (default: 2024-01-01)")
+    parser.add_argument('--end-date', default="2024-01-07", help="End date for --url (default: 2024-01-07)")
+    parser.add_argument('--limit', type=int, default=10000, help="Page size for --url (default: 10000)")
+    args = parser.parse_args()
+
+    offline(args.sizes)
+    if args.url:
+        print(f"\nLive {args.url}, {args.start_date} to {args.end_date}, limit {args.limit}")
+        live(args.url, {"start_date": args.start_date, "end_date": args.end_date, "limit": args.limit})
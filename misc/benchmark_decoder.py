@@ -0,0 +1,66 @@
+import csv
+import io
+import sys
+import os
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import decode_intraday, encode_copy_binary, SyntheticDataReader
+
+DATA_FILE = Path(__file__).parent.parent / "data" / "hr.json"
+DATE_STR = "2024-01-01"
+REPEAT = 5
+
+
+def load_dataset():
+    """First day of data/hr.json if it exists, otherwise a synthetic 1 Hz day"""
+    if DATA_FILE.exists():
+        day = SyntheticDataReader(DATA_FILE).day(0)
+        return day['heart_rate_day'][0]['activities-heart-intraday']['dataset']
+    rng = np.random.default_rng(100)
+    values = rng.integers(50, 180, 86400)
+    return [
+        {"time": f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}", "value": int(v)}
+        for s, v in enumerate(values)
+    ]
+
+
+def per_row_path(dataset):
+    """The original loop: strptime per sample, one CSV row per sample"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for entry in dataset:
+        timestamp = datetime.strptime(f"{DATE_STR} {entry['time']}", "%Y-%m-%d %H:%M:%S")
+        writer.writerow((1, timestamp, 'heart_rate', entry['value']))
+    return buffer.getvalue()
+
+
+def decode_only(dataset):
+    return decode_intraday(dataset, DATE_STR)
+
+
+def columnar_path(dataset):
+    """Vectorized decode straight into a binary COPY payload"""
+    timestamps, values = decode_intraday(dataset, DATE_STR)
+    return encode_copy_binary(1, 'heart_rate', timestamps, values)
+
+
+if __name__ == "__main__":
+    dataset = load_dataset()
+    print(f"Samples per day: {len(dataset)}")
+
+    results = {}
+    for name, func in [("per-row (strptime + csv)", per_row_path),
+                       ("columnar decode", decode_only),
+                       ("columnar decode + binary COPY", columnar_path)]:
+        best = min(timeit.repeat(lambda: func(dataset), number=1, repeat=REPEAT))
+        results[name] = best
+        print(f"{name:<32} {best * 1000:8.1f} ms  {len(dataset) / best:12,.0f} rows/sec")
+
+    baseline = results["per-row (strptime + csv)"]
+    print(f"Speedup (decode + encode vs per-row): {baseline / results['columnar decode + binary COPY']:.1f}x")
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.src.queries import RELATIONS, count_query, series_query, time_range
+
+load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env", override=True)
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]['Plan']))
+    chunks = {node['Relation Name'] for node in nodes if node.get('Relation Name', '').startswith(('_hyper_', 'compress_hyper_'))}
+    indexes = {node['Index Name'] for node in nodes if 'Index Name' in node}
+    return chunks, indexes
+
+
+def hypertable_chunks(cur, relation):
+    """Total chunk count behind a hypertable or a continuous aggregate's materialization"""
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM timescaledb_information.chunks c
+        WHERE c.hypertable_name = COALESCE(
+            (SELECT materialization_hypertable_name FROM timescaledb_information.continuous_aggregates
+             WHERE view_name = %s),
+            %s)
+    """, (relation, relation))
+    return cur.fetchone()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN the backend's time-range queries and check chunk exclusion and index use")
+    parser.add_argument('--participant', type=int, default=1, help="Participant to query (default: 1)")
+    parser.add_argument('--days', type=int, default=1, help="Width of the queried window in days (default: 1)")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        port=os.getenv('DB_PORT'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+    )
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM raw_data WHERE participant_id = %s", (args.participant,))
+    first, last = cur.fetchone()
+    if first is None:
+        print(f"No raw data for participant {args.participant}, ingest some days first")
+        sys.exit(1)
+
+    # A window in the middle of the data, so chunks on both sides must be excluded
+    start_date = (first + (last - first) / 2).date()
+    end_date = start_date + timedelta(days=args.days - 1)
+    start, end = time_range(start_date, end_date)
+    print(f"Participant {args.participant}, {start_date} to {end_date}, data spans {first.date()} to {last.date()}")
+
+    failures = []
+    for level, relation in RELATIONS.items():
+        total = hypertable_chunks(cur, relation.name)
+        checks = [
+            ("series", *series_query(relation, [args.participant], start, end, limit=100, metric="heart_rate")),
+            ("count", *count_query(relation, [args.participant], start, end, metric="heart_rate")),
+        ]
+        for name, sql, params in checks:
+            chunks, indexes = explain(cur, sql, params)
+            print(f"{relation.name:>8} {name:<6}: {len(chunks)}/{total} chunks, indexes: {', '.join(sorted(indexes)) or '-'}")
+            if total > 1 and len(chunks) >= total:
+                failures.append(f"{relation.name} {name}: no chunk exclusion")
+            if level == "raw" and not indexes:
+                failures.append(f"{relation.name} {name}: no index used")
+
+    # The old form, for comparison
+    legacy, _ = explain(cur, "SELECT COUNT(*) FROM raw_data WHERE participant_id = %s "
+                             "AND timestamp::date BETWEEN %s AND %s", (args.participant, start_date, end_date))
+    print(f"raw_data ::date BETWEEN (old form): {len(legacy)}/{hypertable_chunks(cur, 'raw_data')} chunks")
+
+    cur.close()
+    conn.close()
+
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("All queries use chunk exclusion and raw_data queries use an index.")
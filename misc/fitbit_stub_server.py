@@ -0,0 +1,138 @@
+"""
+Local stand-in for the Fitbit Web API, replaying the synthetic data files.
+
+Serves every endpoint registered in ingestion.METRIC_LOADERS, mapping the
+requested date onto a day of data/participants/<id>/<metric>.json (or
+data/ for participant 1) so that the last day of each file is today, and
+enforces an hourly per-token quota with Fitbit's rate limit headers.
+
+    python misc/fitbit_stub_server.py --tokens token-1:1,token-2:2 --quota 150 --fail-rate 0.05
+    python ingestion.py --live --api-url http://localhost:8090 --participants 1,2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import METRIC_LOADERS
+from utils import SyntheticDataReader
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+QUOTA_PERIOD = 3600
+
+
+class FitbitStub(object):
+    def __init__(self, data_dir, tokens, default_participant=None, quota=150, fail_rate=0.0, last_date=None,
+                 quota_period=QUOTA_PERIOD):
+        self.data_dir = Path(data_dir)
+        self.tokens = tokens
+        self.default_participant = default_participant
+        self.quota = quota
+        self.fail_rate = fail_rate
+        self.quota_period = quota_period
+        self.last_date = last_date or date.today()
+        self._readers = {}
+        # token -> (start of its current quota window, requests made in it)
+        self._windows = {}
+
+    def reader(self, participant_id, metric):
+        key = (participant_id, metric)
+        if key not in self._readers:
+            data_dir = self.data_dir / "participants" / str(participant_id)
+            if not data_dir.exists() and participant_id == 1:
+                data_dir = self.data_dir
+            self._readers[key] = SyntheticDataReader(data_dir / METRIC_LOADERS[metric]['file_name'])
+        return self._readers[key]
+
+    def _spend(self, token):
+        """Count a request against the token's hour, returns the rate limit headers and whether it's allowed"""
+        now = time.time()
+        started, used = self._windows.get(token, (now, 0))
+        if now - started >= self.quota_period:
+            started, used = now, 0
+        allowed = used < self.quota
+        used += allowed
+        self._windows[token] = (started, used)
+        reset = int(started + self.quota_period - now) + 1
+        headers = {
+            'Fitbit-Rate-Limit-Limit': str(self.quota),
+            'Fitbit-Rate-Limit-Remaining': str(self.quota - used),
+            'Fitbit-Rate-Limit-Reset': str(reset),
+        }
+        if not allowed:
+            headers['Retry-After'] = str(reset)
+        return headers, allowed
+
+    def handler(self, metric):
+        spec = METRIC_LOADERS[metric]
+
+        async def handle(request):
+            authorization = request.headers.get('Authorization', '')
+            token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+            participant_id = self.tokens.get(token, self.default_participant)
+            if token is None or participant_id is None:
+                return web.json_response({'errors': [{'errorType': 'invalid_token'}]}, status=401)
+
+            headers, allowed = self._spend(token)
+            if not allowed:
+                return web.json_response({'errors': [{'errorType': 'system'}]}, status=429, headers=headers)
+            if random.random() < self.fail_rate:
+                return web.json_response({'errors': [{'errorType': 'system'}]}, status=503, headers=headers)
+
+            try:
+                reader = self.reader(participant_id, metric)
+                index = len(reader) - 1 - (self.last_date - date.fromisoformat(request.match_info['date'])).days
+            except (FileNotFoundError, ValueError):
+                raise web.HTTPNotFound(headers=headers)
+            if not 0 <= index < len(reader):
+                raise web.HTTPNotFound(headers=headers)
+
+            body = reader.read_day(index)
+            if spec['response_key'] is not None:
+                body = b'{"%s": [%s]}' % (spec['response_key'].encode('utf-8'), body)
+            return web.Response(body=body, content_type='application/json', headers=headers)
+
+        return handle
+
+    def app(self):
+        app = web.Application()
+        for metric, spec in METRIC_LOADERS.items():
+            app.router.add_get(spec['endpoint'], self.handler(metric))
+        return app
+
+
+def parse_tokens(value):
+    """token:participant pairs, comma separated"""
+    tokens = {}
+    for pair in filter(None, (item.strip() for item in value.split(','))):
+        token, _, participant_id = pair.rpartition(':')
+        tokens[token] = int(participant_id)
+    return tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the synthetic data files as the Fitbit Web API")
+    parser.add_argument('--port', type=int, default=8090, help="Port to listen on (default: 8090)")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR, help=f"Synthetic data directory (default: {DATA_DIR})")
+    parser.add_argument('--tokens', type=parse_tokens, default={},
+                        help="Comma separated token:participant_id pairs")
+    parser.add_argument('--default-participant', type=int, default=1,
+                        help="Participant served for tokens not in --tokens, 0 to reject them (default: 1)")
+    parser.add_argument('--quota', type=int, default=150, help="Requests per token per hour (default: 150)")
+    parser.add_argument('--quota-period', type=int, default=QUOTA_PERIOD,
+                        help=f"Seconds before a token's quota resets, shorten to test throttling (default: {QUOTA_PERIOD})")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with a 503 (default: 0)")
+    parser.add_argument('--last-date', type=date.fromisoformat, default=None,
+                        help="Date served by the last day of each file (default: today)")
+    args = parser.parse_args()
+
+    stub = FitbitStub(args.data_dir, args.tokens, args.default_participant or None, args.quota, args.fail_rate,
+                      args.last_date, args.quota_period)
+    web.run_app(stub.app(), port=args.port)
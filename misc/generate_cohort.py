@@ -0,0 +1,373 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import COPY_BINARY_HEADER, COPY_BINARY_TRAILER, encode_copy_binary
+
+START_DATE = "2024-01-01"
+SEED = 100
+DATA_DIR = Path(__file__).parent.parent / "data"
+METRICS = ('hr', 'br', 'azm', 'activity', 'hrv', 'spo2')
+FORMATS = ('copy', 'columnar', 'json', 'none')
+
+SECONDS_PER_DAY = 86400
+SLEEP_END = 7 * 3600
+CLOCK = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(SECONDS_PER_DAY)])
+SLEEP_STAGES = ('deepSleepSummary', 'remSleepSummary', 'lightSleepSummary', 'fullSleepSummary')
+
+
+def participant_profile(seed, participant_id):
+    """Traits that stay fixed for a participant across all of their days"""
+    rng = np.random.default_rng([seed, participant_id])
+    age = int(rng.integers(20, 70))
+    return {
+        'age': age,
+        'max_hr': 220 - age,
+        'resting_hr': float(rng.uniform(52, 78)),
+        'activity_level': float(rng.uniform(0.3, 1.5)),
+        'breathing_rate': float(rng.uniform(12, 18)),
+        'rmssd': float(rng.uniform(20, 80)),
+        'spo2': float(rng.uniform(94, 98)),
+    }
+
+
+def _smooth(rng, count, window, scale):
+    """Zero-mean noise with some memory, so consecutive samples don't jump around"""
+    noise = rng.normal(0, scale, count + window)
+    return np.convolve(noise, np.ones(window) / np.sqrt(window), mode='valid')[:count]
+
+
+def generate_day(seed, participant_id, day_index, profile, start_date=START_DATE, metrics=METRICS):
+    """
+    One participant-day of every requested metric as loader-shaped batches
+    ({'series': [(metric_type, timestamps, values)], ...}). The generator
+    is seeded by (seed, participant, day), so output doesn't depend on how
+    the cohort was split across workers.
+    """
+    rng = np.random.default_rng([seed, participant_id, day_index])
+    date = np.datetime64(start_date, 'D') + day_index
+    midnight = date.astype('datetime64[s]')
+    seconds = np.arange(SECONDS_PER_DAY)
+
+    # 1 Hz heart rate: circadian baseline, a few activity bouts and smoothed noise
+    circadian = 6 * np.sin(2 * np.pi * (seconds - 9 * 3600) / SECONDS_PER_DAY)
+    asleep = seconds < SLEEP_END
+    heart_rate = profile['resting_hr'] + 8 + circadian - 10 * asleep
+    for _ in range(rng.poisson(3 * profile['activity_level'])):
+        start = int(rng.integers(SLEEP_END, SECONDS_PER_DAY - 600))
+        length = int(rng.integers(300, 3600))
+        intensity = rng.uniform(0.45, 0.85) * (profile['max_hr'] - profile['resting_hr'])
+        heart_rate[start:start + length] += intensity
+    heart_rate += _smooth(rng, SECONDS_PER_DAY, 60, 2.0)
+    heart_rate = np.clip(np.rint(heart_rate), 40, profile['max_hr'])
+    timestamps = midnight + seconds.astype('timedelta64[s]')
+
+    batches = {}
+    if 'hr' in metrics:
+        zones = []
+        bounds = [30, 0.5 * profile['max_hr'], 0.7 * profile['max_hr'], 0.85 * profile['max_hr'], 220]
+        for name, low, high in zip(('Out of Range', 'Fat Burn', 'Cardio', 'Peak'), bounds, bounds[1:]):
+            in_zone = int(((heart_rate >= low) & (heart_rate < high)).sum())
+            zones.append({'name': name, 'min': int(low), 'max': int(high), 'minutes': in_zone // 60,
+                          'caloriesOut': round(in_zone / 60 * (1 + high / 100), 2)})
+        batches['hr'] = {
+            'series': [('heart_rate', timestamps, heart_rate)],
+            'daily_summary': {
+                'resting_heart_rate': int(np.percentile(heart_rate[asleep], 5)),
+                'dataset_interval': 1,
+                'dataset_type': 'second',
+            },
+            'heart_rate_zones': zones,
+        }
+
+    minute_hr = heart_rate.reshape(-1, 60).mean(axis=1)
+    minutes = midnight + (np.arange(SECONDS_PER_DAY // 60) * 60).astype('timedelta64[s]')
+
+    if 'azm' in metrics:
+        zone_minutes = (minute_hr >= 0.5 * profile['max_hr']).astype(np.float64)
+        zone_minutes += minute_hr >= 0.7 * profile['max_hr']
+        active = zone_minutes > 0
+        batches['azm'] = {'series': [('active_zone_minutes', minutes[active], zone_minutes[active])]}
+
+    if 'activity' in metrics:
+        steps = rng.normal(6000, 1500) * profile['activity_level'] + 40 * (minute_hr > profile['resting_hr'] + 25).sum()
+        batches['activity'] = {'series': [('steps', midnight.reshape(1), np.array([max(0.0, round(steps))]))]}
+
+    if 'br' in metrics:
+        rates = profile['breathing_rate'] + rng.normal(0, 0.8, len(SLEEP_STAGES))
+        metric_types = ('breathing_rate_deep', 'breathing_rate_rem', 'breathing_rate_light', 'breathing_rate')
+        batches['br'] = {'series': [
+            (metric_type, midnight.reshape(1), np.array([round(rate, 1)]))
+            for metric_type, rate in zip(metric_types, rates)
+        ]}
+
+    sleep_minutes = minutes[:SLEEP_END // 60]
+    if 'spo2' in metrics:
+        spo2 = np.clip(profile['spo2'] + _smooth(rng, len(sleep_minutes), 10, 0.4), 85, 100).round(1)
+        batches['spo2'] = {'series': [('spo2', sleep_minutes, spo2)]}
+
+    if 'hrv' in metrics:
+        windows = sleep_minutes[::5]
+        rmssd = np.clip(profile['rmssd'] + _smooth(rng, len(windows), 6, 4), 5, None).round(3)
+        batches['hrv'] = {'series': [
+            ('hrv_rmssd', windows, rmssd),
+            ('hrv_coverage', windows, rng.uniform(0.9, 1.0, len(windows)).round(3)),
+            ('hrv_hf', windows, (rmssd ** 2 * rng.uniform(0.8, 1.2, len(windows))).round(3)),
+            ('hrv_lf', windows, (rmssd ** 2 * rng.uniform(0.6, 1.6, len(windows))).round(3)),
+        ]}
+
+    return batches
+
+
+def to_wearipedia(metric, batch, date_str):
+    """The JSON text of one day in the shape wearipedia exports, as read by ingestion.py"""
+    if metric == 'hr':
+        _, _, values = batch['series'][0]
+        summary = batch['daily_summary']
+        dataset = ','.join(
+            f'{{"time":"{clock}","value":{value}}}'
+            for clock, value in zip(CLOCK.tolist(), values.astype(np.int64).tolist())
+        )
+        activities_heart = json.dumps([{'dateTime': date_str, 'value': {
+            'restingHeartRate': summary['resting_heart_rate'],
+            'heartRateZones': batch['heart_rate_zones'],
+        }}])
+        return (f'{{"heart_rate_day":[{{"activities-heart":{activities_heart},'
+                f'"activities-heart-intraday":{{"dataset":[{dataset}],'
+                f'"datasetInterval":{summary["dataset_interval"]},"datasetType":"{summary["dataset_type"]}"}}}}]}}')
+
+    if metric == 'br':
+        rates = {metric_type: float(values[0]) for metric_type, _, values in batch['series']}
+        stages = dict(zip(SLEEP_STAGES, ('breathing_rate_deep', 'breathing_rate_rem',
+                                         'breathing_rate_light', 'breathing_rate')))
+        day = {'br': [{'value': {stage: {'breathingRate': rates[metric_type]}
+                                 for stage, metric_type in stages.items()}, 'dateTime': date_str}]}
+    elif metric == 'azm':
+        _, timestamps, values = batch['series'][0]
+        day = {'activities-active-zone-minutes-intraday': [{'dateTime': date_str, 'minutes': [
+            {'minute': str(timestamp)[11:], 'value': {'activeZoneMinutes': int(value)}}
+            for timestamp, value in zip(timestamps, values)
+        ]}]}
+    elif metric == 'activity':
+        day = {'dateTime': date_str, 'value': int(batch['series'][0][2][0])}
+    elif metric == 'hrv':
+        timestamps = batch['series'][0][1]
+        fields = {metric_type[len('hrv_'):]: values.tolist() for metric_type, _, values in batch['series']}
+        day = {'hrv': [{'minutes': [
+            {'minute': f'{timestamp}.000', 'value': {field: fields[field][i] for field in fields}}
+            for i, timestamp in enumerate(timestamps.astype(str))
+        ], 'dateTime': date_str}]}
+    elif metric == 'spo2':
+        _, timestamps, values = batch['series'][0]
+        day = {'dateTime': date_str, 'minutes': [
+            {'value': value, 'minute': timestamp}
+            for timestamp, value in zip(timestamps.astype(str), values.tolist())
+        ]}
+    else:
+        raise ValueError(f"Unknown metric '{metric}'")
+    return json.dumps(day)
+
+
+class CohortWriter(object):
+    """
+    Streams one participant's days to disk as they are generated:
+    copy      - one PostgreSQL binary COPY file for raw_data per participant
+    columnar  - per metric_type, raw int64 epoch seconds (.ts) and float64 values (.f8)
+    json      - wearipedia-shaped <metric>.json arrays that ingestion.py can read
+    """
+    def __init__(self, out_dir, participant_id, fmt, metrics):
+        self.participant_id = participant_id
+        self.format = fmt
+        self.metrics = metrics
+        self.bytes_written = 0
+        self._files = {}
+        if fmt == 'copy':
+            out_dir.mkdir(parents=True, exist_ok=True)
+            self._open('copy', out_dir / f"participant_{participant_id}.pgcopy", COPY_BINARY_HEADER)
+        elif fmt in ('columnar', 'json'):
+            self.participant_dir = out_dir / str(participant_id)
+            self.participant_dir.mkdir(parents=True, exist_ok=True)
+
+    def _open(self, key, path, prefix=b''):
+        file = open(path, 'wb')
+        file.write(prefix)
+        self._files[key] = file
+        return file
+
+    def write_day(self, day_index, date_str, batches):
+        if self.format == 'copy':
+            file = self._files['copy']
+            for batch in batches.values():
+                for metric_type, timestamps, values in batch['series']:
+                    file.write(encode_copy_binary(self.participant_id, metric_type, timestamps, values))
+        elif self.format == 'columnar':
+            for batch in batches.values():
+                for metric_type, timestamps, values in batch['series']:
+                    for suffix, column in (('ts', timestamps.astype(np.int64)), ('f8', values.astype(np.float64))):
+                        key = f"{metric_type}.{suffix}"
+                        file = self._files.get(key) or self._open(key, self.participant_dir / key)
+                        column.tofile(file)
+        elif self.format == 'json':
+            for metric, batch in batches.items():
+                file = self._files.get(metric) or self._open(metric, self.participant_dir / f"{metric}.json", b'[')
+                if day_index:
+                    file.write(b',')
+                file.write(to_wearipedia(metric, batch, date_str).encode('utf-8'))
+
+    def close(self):
+        for key, file in self._files.items():
+            if self.format == 'copy':
+                file.write(COPY_BINARY_TRAILER)
+            elif self.format == 'json':
+                file.write(b']')
+            self.bytes_written += file.tell()
+            file.close()
+        self._files = {}
+
+
+class CohortLoader(object):
+    """Writes generated participant-days straight into the database, one transaction per day"""
+    def __init__(self, participant_id, batch_size):
+        import psycopg2
+        from dotenv import load_dotenv
+        from utils import BulkWriter
+
+        load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env", override=True)
+        self.participant_id = participant_id
+        self.conn = psycopg2.connect(
+            host=os.getenv('DB_HOST'),
+            port=os.getenv('DB_PORT'),
+            database=os.getenv('DB_NAME'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+        )
+        self.writer = BulkWriter(self.conn, batch_size=batch_size)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO participant (participant_id, name)
+            VALUES (%s, %s)
+            ON CONFLICT (participant_id) DO NOTHING
+        """, (participant_id, f"Synthetic participant {participant_id}"))
+        self.conn.commit()
+        cursor.close()
+
+    def write_day(self, day_index, date_str, batches):
+        cursor = self.conn.cursor()
+        try:
+            for batch in batches.values():
+                if batch.get('daily_summary'):
+                    self.writer.write_daily_summary(cursor, self.participant_id, date_str, **batch['daily_summary'])
+                self.writer.write_heart_rate_zones(cursor, self.participant_id, date_str,
+                                                   batch.get('heart_rate_zones', []))
+                for metric_type, timestamps, values in batch['series']:
+                    self.writer.stage_columns(cursor, self.participant_id, metric_type, timestamps, values)
+            self.writer.merge_raw_data(cursor)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+
+def generate_participant(participant_id, options):
+    """Generate (and optionally load) every day of one participant, runs in a worker process"""
+    start_time = time.time()
+    profile = participant_profile(options['seed'], participant_id)
+    sinks = []
+    writer = None
+    if options['format'] != 'none':
+        writer = CohortWriter(Path(options['out']), participant_id, options['format'], options['metrics'])
+        sinks.append(writer)
+    if options['load']:
+        sinks.append(CohortLoader(participant_id, options['batch_size']))
+
+    rows = 0
+    try:
+        for day_index in range(options['days']):
+            batches = generate_day(options['seed'], participant_id, day_index, profile,
+                                   options['start_date'], options['metrics'])
+            date_str = str(np.datetime64(options['start_date'], 'D') + day_index)
+            for sink in sinks:
+                sink.write_day(day_index, date_str, batches)
+            rows += sum(len(values) for batch in batches.values() for _, _, values in batch['series'])
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    return {
+        'participant_id': participant_id,
+        'rows': rows,
+        'bytes': writer.bytes_written if writer else 0,
+        'duration': time.time() - start_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic cohort for load testing")
+    parser.add_argument('--participants', type=int, default=10, help="Number of participants (default: 10)")
+    parser.add_argument('--first-participant', type=int, default=1, help="Id of the first participant (default: 1)")
+    parser.add_argument('--days', type=int, default=30, help="Days per participant (default: 30)")
+    parser.add_argument('--start-date', type=str, default=START_DATE, help=f"First day (default: {START_DATE})")
+    parser.add_argument('--seed', type=int, default=SEED, help=f"Random seed (default: {SEED})")
+    parser.add_argument('--metrics', type=str, default=','.join(METRICS),
+                        help=f"Comma separated metrics (default: {','.join(METRICS)})")
+    parser.add_argument('--format', choices=FORMATS, default='copy',
+                        help="copy: binary COPY per participant, columnar: raw .ts/.f8 column files, "
+                             "json: wearipedia-shaped files for ingestion.py, none: only --load (default: copy)")
+    parser.add_argument('--out', type=str, default=None,
+                        help="Output directory (default: data/participants for json, data/cohort otherwise)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+    parser.add_argument('--load', action='store_true', help="Also write the cohort straight into the database")
+    parser.add_argument('--batch-size', type=int, default=50000, help="Rows per COPY batch with --load (default: 50000)")
+    args = parser.parse_args()
+
+    metrics = [metric.strip() for metric in args.metrics.split(',') if metric.strip()]
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        parser.error(f"Unknown metrics: {', '.join(sorted(unknown))}")
+    if args.format == 'none' and not args.load:
+        parser.error("--format none only makes sense together with --load")
+
+    options = {
+        'seed': args.seed,
+        'days': args.days,
+        'start_date': args.start_date,
+        'metrics': metrics,
+        'format': args.format,
+        'out': args.out or str(DATA_DIR / ("participants" if args.format == 'json' else "cohort")),
+        'load': args.load,
+        'batch_size': args.batch_size,
+    }
+    participant_ids = range(args.first_participant, args.first_participant + args.participants)
+    print(f"Generating {args.participants} participants x {args.days} days ({', '.join(metrics)}) "
+          f"with {args.workers} workers into {options['out'] if args.format != 'none' else 'the database'}")
+
+    start_time = time.time()
+    total_rows = 0
+    total_bytes = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=context) as executor:
+        futures = [executor.submit(generate_participant, participant_id, options) for participant_id in participant_ids]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            total_rows += result['rows']
+            total_bytes += result['bytes']
+            print(f"[{done}/{args.participants}] participant {result['participant_id']}: "
+                  f"{result['rows']} rows in {result['duration']:.2f} seconds")
+
+    duration = time.time() - start_time
+    print(f"Generated {total_rows} rows ({total_bytes / 1e6:.1f} MB) in {duration:.2f} seconds "
+          f"({total_rows / duration:.0f} rows/sec)")
@@ -71,8 +71,8 @@ elif [ "$1" == "1" ]; then
         exit 1
     fi
 
-    echo "Running initial ingestion"
-    docker-compose exec -T ingestion python ingestion.py
+    echo "The ingestion daemon polls every metric once at startup"
+    docker-compose logs --tail 20 ingestion
 
     echo "Container status:"
     docker-compose ps
@@ -132,7 +132,7 @@ elif [ "$1" == "2" ] || [ "$1" == "3" ]; then
         exit 1
     fi
 
-    docker-compose exec -T ingestion python ingestion.py --days 2
+    docker-compose exec -T -e PUSHGATEWAY_URL=pushgateway:9091 ingestion python ingestion.py --days 2
 
     echo "Container status:"
     docker-compose ps
@@ -195,7 +195,7 @@ elif [ "$1" == "4" ] || [ "$1" == "5" ]; then
 
     docker-compose exec -T ingestion python users.py
 
-    docker-compose exec -T ingestion python ingestion.py --days 2
+    docker-compose exec -T -e PUSHGATEWAY_URL=pushgateway:9091 ingestion python ingestion.py --days 2
 
     echo "Container status:"
     docker-compose ps
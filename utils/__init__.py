@@ -1 +1,5 @@
-from .logger import *
\ No newline at end of file
+from .logger import *
+from .bulk_writer import *
+from .synthetic_reader import *
+from .decoder import *
+from .fitbit_client import *
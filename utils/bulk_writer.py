@@ -0,0 +1,531 @@
+import csv
+import io
+import struct
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+__all__ = ['BulkWriter', 'AsyncBulkWriter', 'DEFAULT_BATCH_SIZE', 'COPY_BINARY_HEADER', 'COPY_BINARY_TRAILER',
+           'encode_copy_binary', 'encode_copy_payload']
+
+DEFAULT_BATCH_SIZE = 50000
+
+RAW_DATA_COLUMNS = ('participant_id', 'timestamp', 'metric_type', 'value')
+
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('!h', -1)
+
+# staged_seq numbers rows in the order they were copied in, so when a key
+# is staged twice the merges keep the value written last
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS raw_data_staging
+    (LIKE raw_data INCLUDING DEFAULTS, staged_seq BIGINT GENERATED ALWAYS AS IDENTITY)
+    ON COMMIT DELETE ROWS
+"""
+
+MERGE_RAW_DATA_SQL = """
+    INSERT INTO raw_data (participant_id, timestamp, metric_type, value)
+    SELECT DISTINCT ON (participant_id, timestamp, metric_type)
+        participant_id, timestamp, metric_type, value
+    FROM raw_data_staging
+    ORDER BY participant_id, timestamp, metric_type, staged_seq DESC
+    ON CONFLICT (participant_id, timestamp, metric_type) DO UPDATE SET
+        value = EXCLUDED.value,
+        imputed = FALSE
+"""
+
+# Rewrites only the staged rows whose value differs from what is stored
+# or that replace an imputed point, so re-ingesting a mostly unchanged
+# day produces next to no WAL
+MERGE_CHANGED_RAW_DATA_SQL = """
+    INSERT INTO raw_data (participant_id, timestamp, metric_type, value)
+    SELECT s.participant_id, s.timestamp, s.metric_type, s.value
+    FROM (
+        SELECT DISTINCT ON (participant_id, timestamp, metric_type)
+            participant_id, timestamp, metric_type, value
+        FROM raw_data_staging
+        ORDER BY participant_id, timestamp, metric_type, staged_seq DESC
+    ) s
+    LEFT JOIN raw_data r
+        ON r.participant_id = s.participant_id
+        AND r.timestamp = s.timestamp
+        AND r.metric_type = s.metric_type
+    WHERE r.value IS DISTINCT FROM s.value OR r.imputed
+    ON CONFLICT (participant_id, timestamp, metric_type) DO UPDATE SET
+        value = EXCLUDED.value,
+        imputed = FALSE
+"""
+
+# Wraps a merge so participant_metric_stats moves in the same statement.
+# The stats count measured rows only, like reconcile_metric_stats: xmax = 0
+# on a RETURNING row means it was inserted rather than updated, and an
+# update that replaces an imputed point adds a measurement too. `replaced`
+# sees raw_data as it was before the merge, all parts of a statement share
+# one snapshot.
+MERGE_WITH_STATS_SQL = """
+    WITH merged AS (
+        {merge}
+        RETURNING participant_id, metric_type, timestamp, (xmax = 0) AS inserted
+    ), replaced AS (
+        SELECT r.participant_id, r.metric_type, COUNT(*) AS replaced
+        FROM (SELECT DISTINCT participant_id, timestamp, metric_type FROM raw_data_staging) s
+        JOIN raw_data r USING (participant_id, timestamp, metric_type)
+        WHERE r.imputed
+        GROUP BY r.participant_id, r.metric_type
+    ), stats AS (
+        INSERT INTO participant_metric_stats
+            (participant_id, metric_type, row_count, first_timestamp, last_timestamp, last_seen)
+        SELECT m.participant_id, m.metric_type, COUNT(*) FILTER (WHERE m.inserted) + COALESCE(MAX(r.replaced), 0),
+               MIN(m.timestamp), MAX(m.timestamp), NOW()
+        FROM merged m
+        LEFT JOIN replaced r ON r.participant_id = m.participant_id AND r.metric_type = m.metric_type
+        GROUP BY m.participant_id, m.metric_type
+        ON CONFLICT (participant_id, metric_type) DO UPDATE SET
+            row_count = participant_metric_stats.row_count + EXCLUDED.row_count,
+            first_timestamp = LEAST(participant_metric_stats.first_timestamp, EXCLUDED.first_timestamp),
+            last_timestamp = GREATEST(participant_metric_stats.last_timestamp, EXCLUDED.last_timestamp),
+            last_seen = EXCLUDED.last_seen
+    )
+    SELECT COUNT(*) FROM merged
+"""
+
+# Removes the stored measurements of a re-ingested day that are no longer
+# in its payload, run against staging before the merge. row_count follows,
+# first and last timestamps are left to reconcile_metric_stats
+DELETE_MISSING_RAW_DATA_SQL = """
+    WITH removed AS (
+        DELETE FROM raw_data r
+        WHERE r.participant_id = {participant_id} AND r.metric_type = ANY({metric_types})
+        AND r.timestamp >= {start} AND r.timestamp < {end} AND NOT r.imputed
+        AND NOT EXISTS (
+            SELECT 1 FROM raw_data_staging s
+            WHERE s.participant_id = r.participant_id AND s.timestamp = r.timestamp AND s.metric_type = r.metric_type
+        )
+        RETURNING r.participant_id, r.metric_type
+    ), stats AS (
+        UPDATE participant_metric_stats p SET row_count = p.row_count - d.removed
+        FROM (SELECT participant_id, metric_type, COUNT(*) AS removed FROM removed GROUP BY 1, 2) d
+        WHERE p.participant_id = d.participant_id AND p.metric_type = d.metric_type
+    )
+    SELECT COUNT(*) FROM removed
+"""
+
+DAILY_SUMMARY_CONFLICT = """
+    ON CONFLICT (participant_id, date) DO UPDATE SET
+        resting_heart_rate = EXCLUDED.resting_heart_rate,
+        dataset_interval = EXCLUDED.dataset_interval,
+        dataset_type = EXCLUDED.dataset_type
+    WHERE (daily_summaries.resting_heart_rate, daily_summaries.dataset_interval, daily_summaries.dataset_type)
+        IS DISTINCT FROM (EXCLUDED.resting_heart_rate, EXCLUDED.dataset_interval, EXCLUDED.dataset_type)
+"""
+
+DAILY_COVERAGE_CONFLICT = """
+    ON CONFLICT (participant_id, metric_type, date) DO UPDATE SET
+        points = EXCLUDED.points,
+        first_timestamp = EXCLUDED.first_timestamp,
+        last_timestamp = EXCLUDED.last_timestamp,
+        updated_at = NOW()
+    WHERE (daily_coverage.points, daily_coverage.first_timestamp, daily_coverage.last_timestamp)
+        IS DISTINCT FROM (EXCLUDED.points, EXCLUDED.first_timestamp, EXCLUDED.last_timestamp)
+"""
+
+# Samples further apart than this end a run of coverage_interval
+COVERAGE_MAX_SPACING = np.timedelta64(60, 's')
+# A run ends one sample after its last timestamp
+COVERAGE_SAMPLE_WIDTH = np.timedelta64(1, 's')
+
+HEART_RATE_ZONES_CONFLICT = """
+    ON CONFLICT (participant_id, date, zone_name) DO UPDATE SET
+        min_heart_rate = EXCLUDED.min_heart_rate,
+        max_heart_rate = EXCLUDED.max_heart_rate,
+        minutes = EXCLUDED.minutes,
+        calories_out = EXCLUDED.calories_out
+    WHERE (heart_rate_zones.min_heart_rate, heart_rate_zones.max_heart_rate,
+           heart_rate_zones.minutes, heart_rate_zones.calories_out)
+        IS DISTINCT FROM (EXCLUDED.min_heart_rate, EXCLUDED.max_heart_rate,
+                          EXCLUDED.minutes, EXCLUDED.calories_out)
+"""
+
+
+def encode_copy_binary(participant_id, metric_type, timestamps, values):
+    """
+    Encode raw_data rows as PostgreSQL binary COPY tuples (without header
+    and trailer). Every field has a fixed width once the metric name is
+    known, so a whole column batch is one structured array. Timestamps
+    are naive datetime64 values and are written as UTC.
+    """
+    metric = metric_type.encode('utf-8')
+    row_type = np.dtype([
+        ('field_count', '>i2'),
+        ('participant_id_len', '>i4'), ('participant_id', '>i4'),
+        ('timestamp_len', '>i4'), ('timestamp', '>i8'),
+        ('metric_type_len', '>i4'), ('metric_type', f'S{len(metric)}'),
+        ('value_len', '>i4'), ('value', '>f8'),
+    ])
+    rows = np.empty(len(values), dtype=row_type)
+    rows['field_count'] = len(RAW_DATA_COLUMNS)
+    rows['participant_id_len'] = 4
+    rows['participant_id'] = participant_id
+    rows['timestamp_len'] = 8
+    rows['timestamp'] = (timestamps.astype('datetime64[us]') - PG_EPOCH).astype(np.int64)
+    rows['metric_type_len'] = len(metric)
+    rows['metric_type'] = metric
+    rows['value_len'] = 8
+    rows['value'] = values
+    return rows.tobytes()
+
+
+def encode_copy_payload(participant_id, series):
+    """A complete binary COPY stream for a list of (metric_type, timestamps, values) series"""
+    tuples = [
+        encode_copy_binary(participant_id, metric_type, timestamps, values)
+        for metric_type, timestamps, values in series
+    ]
+    return COPY_BINARY_HEADER + b''.join(tuples) + COPY_BINARY_TRAILER
+
+
+def _zone_rows(participant_id, date, zones):
+    return [
+        (participant_id, date, zone['name'], zone['min'], zone['max'],
+         zone['minutes'], zone.get('caloriesOut'))
+        for zone in zones
+    ]
+
+
+def _coverage_rows(participant_id, date, series):
+    """(participant_id, date, metric_type, points, first, last) per metric type with data"""
+    coverage = {}
+    for metric_type, timestamps, values in series:
+        if len(values) == 0:
+            continue
+        points, first, last = len(values), timestamps.min(), timestamps.max()
+        if metric_type in coverage:
+            known_points, known_first, known_last = coverage[metric_type]
+            points, first, last = points + known_points, min(first, known_first), max(last, known_last)
+        coverage[metric_type] = (points, first, last)
+    return [
+        (participant_id, date, metric_type, points, _utc(first), _utc(last))
+        for metric_type, (points, first, last) in coverage.items()
+    ]
+
+
+def _interval_rows(participant_id, date, series):
+    """(participant_id, date, metric_type, start, end, points) per run of samples at most COVERAGE_MAX_SPACING apart"""
+    by_metric = {}
+    for metric_type, timestamps, values in series:
+        if len(values):
+            by_metric.setdefault(metric_type, []).append(timestamps.astype('datetime64[us]'))
+    rows = []
+    for metric_type, parts in by_metric.items():
+        timestamps = np.unique(np.concatenate(parts))
+        breaks = np.flatnonzero(np.diff(timestamps) > COVERAGE_MAX_SPACING)
+        firsts = np.concatenate(([0], breaks + 1))
+        lasts = np.concatenate((breaks, [len(timestamps) - 1]))
+        rows.extend(
+            (participant_id, date, metric_type, _utc(timestamps[first]),
+             _utc(timestamps[last] + COVERAGE_SAMPLE_WIDTH), int(last - first + 1))
+            for first, last in zip(firsts, lasts)
+        )
+    return rows
+
+
+def _day_bounds(day):
+    """[midnight, next midnight) in UTC of a date or YYYY-MM-DD string, as the decoded series are stamped"""
+    start = _utc(np.datetime64(str(day), 'D'))
+    return start, start + timedelta(days=1)
+
+
+def _utc(timestamp):
+    return timestamp.astype('datetime64[us]').astype(datetime).replace(tzinfo=timezone.utc)
+
+
+class BulkWriter(object):
+    """
+    Writes a participant-day in a handful of statements. Intraday samples
+    are streamed into a temporary staging table with COPY FROM STDIN in
+    batches of `batch_size` rows and merged into raw_data with a single
+    set-based upsert. Zones and the daily summary go in one statement each.
+    """
+    def __init__(self, conn, batch_size=DEFAULT_BATCH_SIZE):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be a positive integer")
+        self.conn = conn
+        self.batch_size = batch_size
+        self._staging_ready = False
+
+    def _ensure_staging(self, cursor):
+        """Create the per-connection staging table on first use"""
+        if self._staging_ready:
+            return
+        cursor.execute(CREATE_STAGING_SQL)
+        self._staging_ready = True
+
+    def _copy_buffer(self, cursor, buffer):
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY raw_data_staging ({', '.join(RAW_DATA_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+    def stage_raw_data(self, cursor, rows):
+        """Stream (participant_id, timestamp, metric_type, value) rows into staging, returns row count"""
+        self._ensure_staging(cursor)
+
+        staged = 0
+        pending = 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        for row in rows:
+            writer.writerow(row)
+            pending += 1
+            if pending >= self.batch_size:
+                self._copy_buffer(cursor, buffer)
+                staged += pending
+                pending = 0
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+
+        if pending:
+            self._copy_buffer(cursor, buffer)
+            staged += pending
+
+        return staged
+
+    def stage_columns(self, cursor, participant_id, metric_type, timestamps, values):
+        """Stream decoded timestamp/value arrays into staging with binary COPY, returns row count"""
+        self._ensure_staging(cursor)
+
+        for start in range(0, len(values), self.batch_size):
+            stop = start + self.batch_size
+            buffer = io.BytesIO(encode_copy_payload(
+                participant_id, [(metric_type, timestamps[start:stop], values[start:stop])]
+            ))
+            cursor.copy_expert(
+                f"COPY raw_data_staging ({', '.join(RAW_DATA_COLUMNS)}) FROM STDIN WITH (FORMAT binary)",
+                buffer
+            )
+
+        return len(values)
+
+    def merge_raw_data(self, cursor, only_changed=False):
+        """
+        Upsert everything staged so far into raw_data, returns affected row
+        count. With `only_changed` rows already holding the same value are
+        left untouched, which is what a re-ingest of a loaded day wants.
+        """
+        self._ensure_staging(cursor)
+        merge = MERGE_CHANGED_RAW_DATA_SQL if only_changed else MERGE_RAW_DATA_SQL
+        cursor.execute(MERGE_WITH_STATS_SQL.format(merge=merge))
+        merged = cursor.fetchone()[0]
+        cursor.execute("TRUNCATE raw_data_staging")
+        return merged
+
+    def delete_missing_raw_data(self, cursor, participant_id, date_str, metric_types):
+        """
+        Delete the day's stored rows of `metric_types` that nothing staged
+        replaces, returns the number deleted. Call it before merging a
+        changed re-ingest, so corrections don't leave stale points behind.
+        """
+        self._ensure_staging(cursor)
+        start, end = _day_bounds(date_str)
+        cursor.execute(DELETE_MISSING_RAW_DATA_SQL.format(
+            participant_id='%(participant_id)s', metric_types='%(metric_types)s::varchar[]',
+            start='%(start)s', end='%(end)s'
+        ), {'participant_id': participant_id, 'metric_types': list(metric_types), 'start': start, 'end': end})
+        return cursor.fetchone()[0]
+
+    def write_raw_data(self, cursor, rows):
+        """Stage and merge intraday rows, returns the number of rows merged"""
+        self.stage_raw_data(cursor, rows)
+        return self.merge_raw_data(cursor)
+
+    def write_daily_summary(self, cursor, participant_id, date_str, resting_heart_rate,
+                            dataset_interval, dataset_type):
+        cursor.execute("""
+            INSERT INTO daily_summaries (participant_id, date, resting_heart_rate, dataset_interval, dataset_type)
+            VALUES (%s, %s, %s, %s, %s)
+        """ + DAILY_SUMMARY_CONFLICT, (participant_id, date_str, resting_heart_rate, dataset_interval, dataset_type))
+        return cursor.rowcount
+
+    def write_heart_rate_zones(self, cursor, participant_id, date_str, zones):
+        """Upsert all zones of a day in a single statement, returns row count"""
+        if not zones:
+            return 0
+        rows = _zone_rows(participant_id, date_str, zones)
+        execute_values(cursor, """
+            INSERT INTO heart_rate_zones (participant_id, date, zone_name, min_heart_rate, max_heart_rate, minutes, calories_out)
+            VALUES %s
+        """ + HEART_RATE_ZONES_CONFLICT, rows, page_size=len(rows))
+        return len(rows)
+
+
+    def write_daily_coverage(self, cursor, participant_id, date_str, series, metric_types=()):
+        """
+        Upsert the day's point count and time span per metric type and
+        replace its coverage intervals, returns daily_coverage row count.
+        Any of `metric_types` left without points loses its coverage.
+        """
+        rows = _coverage_rows(participant_id, date_str, series)
+        covered = [row[2] for row in rows]
+        emptied = [metric_type for metric_type in metric_types if metric_type not in covered]
+        if emptied:
+            cursor.execute("""
+                DELETE FROM daily_coverage WHERE participant_id = %s AND date = %s AND metric_type = ANY(%s)
+            """, (participant_id, date_str, emptied))
+        if covered or emptied:
+            cursor.execute("""
+                DELETE FROM coverage_interval WHERE participant_id = %s AND date = %s AND metric_type = ANY(%s)
+            """, (participant_id, date_str, covered + emptied))
+        if not rows:
+            return 0
+        execute_values(cursor, """
+            INSERT INTO daily_coverage (participant_id, date, metric_type, points, first_timestamp, last_timestamp)
+            VALUES %s
+        """ + DAILY_COVERAGE_CONFLICT, rows, page_size=len(rows))
+        intervals = _interval_rows(participant_id, date_str, series)
+        execute_values(cursor, """
+            INSERT INTO coverage_interval (participant_id, date, metric_type, start_time, end_time, points)
+            VALUES %s
+        """, intervals, page_size=len(intervals))
+        return len(rows)
+
+    def reconcile_metric_stats(self, cursor, participant_id):
+        """Re-derive a participant's participant_metric_stats from raw_data, returns metric types found"""
+        cursor.execute("""
+            DELETE FROM participant_metric_stats s
+            WHERE s.participant_id = %s
+            AND NOT EXISTS (
+                SELECT 1 FROM raw_data r
+                WHERE r.participant_id = s.participant_id AND r.metric_type = s.metric_type AND NOT r.imputed
+            )
+        """, (participant_id,))
+        cursor.execute("""
+            INSERT INTO participant_metric_stats
+                (participant_id, metric_type, row_count, first_timestamp, last_timestamp, last_seen)
+            SELECT participant_id, metric_type, COUNT(*), MIN(timestamp), MAX(timestamp), NOW()
+            FROM raw_data
+            WHERE participant_id = %s AND NOT imputed
+            GROUP BY participant_id, metric_type
+            ON CONFLICT (participant_id, metric_type) DO UPDATE SET
+                row_count = EXCLUDED.row_count,
+                first_timestamp = EXCLUDED.first_timestamp,
+                last_timestamp = EXCLUDED.last_timestamp
+        """, (participant_id,))
+        return cursor.rowcount
+
+    def backfill_daily_coverage(self, cursor, participant_id):
+        """Rebuild a participant's coverage and intervals from raw_data, for rows loaded before they were tracked"""
+        cursor.execute("""
+            INSERT INTO daily_coverage (participant_id, date, metric_type, points, first_timestamp, last_timestamp)
+            SELECT participant_id, (timestamp AT TIME ZONE 'UTC')::date, metric_type, COUNT(*), MIN(timestamp), MAX(timestamp)
+            FROM raw_data
+            WHERE participant_id = %s AND NOT imputed
+            GROUP BY 1, 2, 3
+        """ + DAILY_COVERAGE_CONFLICT, (participant_id,))
+        written = cursor.rowcount
+        cursor.execute("DELETE FROM coverage_interval WHERE participant_id = %s", (participant_id,))
+        # Gaps and islands: a sample more than the spacing after the previous one starts a new run
+        cursor.execute("""
+            INSERT INTO coverage_interval (participant_id, date, metric_type, start_time, end_time, points)
+            SELECT participant_id, date, metric_type, MIN(timestamp), MAX(timestamp) + %s, COUNT(*)
+            FROM (
+                SELECT *, COUNT(*) FILTER (WHERE starts_run) OVER (
+                    PARTITION BY metric_type, date ORDER BY timestamp
+                ) AS run
+                FROM (
+                    SELECT participant_id, metric_type, timestamp, (timestamp AT TIME ZONE 'UTC')::date AS date,
+                           COALESCE(timestamp - LAG(timestamp) OVER (
+                               PARTITION BY metric_type, (timestamp AT TIME ZONE 'UTC')::date ORDER BY timestamp
+                           ) > %s, TRUE) AS starts_run
+                    FROM raw_data
+                    WHERE participant_id = %s AND NOT imputed
+                ) samples
+            ) runs
+            GROUP BY participant_id, date, metric_type, run
+        """, (COVERAGE_SAMPLE_WIDTH.item(), COVERAGE_MAX_SPACING.item(), participant_id))
+        return written
+
+
+class AsyncBulkWriter(object):
+    """
+    asyncpg counterpart of BulkWriter. A whole participant-day is sent as
+    one binary COPY into the staging table and merged with the same
+    statements, all on the connection the caller holds a transaction on.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def stage_payload(self, payload):
+        """COPY an encode_copy_payload() stream into staging"""
+        await self.conn.execute(CREATE_STAGING_SQL)
+        await self.conn.copy_to_table(
+            'raw_data_staging', source=io.BytesIO(payload),
+            columns=list(RAW_DATA_COLUMNS), format='binary'
+        )
+
+    async def delete_missing_raw_data(self, participant_id, date, metric_types):
+        """Delete the day's stored rows of `metric_types` that nothing staged replaces, returns the number deleted"""
+        start, end = _day_bounds(date)
+        return await self.conn.fetchval(DELETE_MISSING_RAW_DATA_SQL.format(
+            participant_id='$1', metric_types='$2::varchar[]', start='$3', end='$4'
+        ), participant_id, list(metric_types), start, end)
+
+    async def merge_raw_data(self, only_changed=False):
+        """Upsert staging into raw_data, returns affected row count"""
+        merge = MERGE_CHANGED_RAW_DATA_SQL if only_changed else MERGE_RAW_DATA_SQL
+        merged = await self.conn.fetchval(MERGE_WITH_STATS_SQL.format(merge=merge))
+        await self.conn.execute("TRUNCATE raw_data_staging")
+        return merged
+
+    async def write_daily_summary(self, participant_id, date, resting_heart_rate,
+                                  dataset_interval, dataset_type):
+        await self.conn.execute("""
+            INSERT INTO daily_summaries (participant_id, date, resting_heart_rate, dataset_interval, dataset_type)
+            VALUES ($1, $2, $3, $4, $5)
+        """ + DAILY_SUMMARY_CONFLICT, participant_id, date, resting_heart_rate, dataset_interval, dataset_type)
+
+    async def write_heart_rate_zones(self, participant_id, date, zones):
+        """Upsert all zones of a day in a single statement over unnested arrays, returns row count"""
+        if not zones:
+            return 0
+        rows = _zone_rows(participant_id, date, zones)
+        columns = list(zip(*rows))[2:]
+        await self.conn.execute("""
+            INSERT INTO heart_rate_zones (participant_id, date, zone_name, min_heart_rate, max_heart_rate, minutes, calories_out)
+            SELECT $1, $2, * FROM unnest($3::varchar[], $4::int[], $5::int[], $6::int[], $7::float8[])
+        """ + HEART_RATE_ZONES_CONFLICT, participant_id, date, *[list(column) for column in columns])
+        return len(rows)
+
+    async def write_daily_coverage(self, participant_id, date, series, metric_types=()):
+        """
+        Upsert the day's point count and time span per metric type and
+        replace its coverage intervals, returns daily_coverage row count.
+        Any of `metric_types` left without points loses its coverage.
+        """
+        rows = _coverage_rows(participant_id, date, series)
+        covered = [row[2] for row in rows]
+        emptied = [metric_type for metric_type in metric_types if metric_type not in covered]
+        if emptied:
+            await self.conn.execute("""
+                DELETE FROM daily_coverage WHERE participant_id = $1 AND date = $2 AND metric_type = ANY($3::varchar[])
+            """, participant_id, date, emptied)
+        if covered or emptied:
+            await self.conn.execute("""
+                DELETE FROM coverage_interval WHERE participant_id = $1 AND date = $2 AND metric_type = ANY($3::varchar[])
+            """, participant_id, date, covered + emptied)
+        if not rows:
+            return 0
+        columns = list(zip(*rows))[2:]
+        await self.conn.execute("""
+            INSERT INTO daily_coverage (participant_id, date, metric_type, points, first_timestamp, last_timestamp)
+            SELECT $1, $2, * FROM unnest($3::varchar[], $4::int[], $5::timestamptz[], $6::timestamptz[])
+        """ + DAILY_COVERAGE_CONFLICT, participant_id, date, *[list(column) for column in columns])
+        intervals = list(zip(*_interval_rows(participant_id, date, series)))[2:]
+        await self.conn.execute("""
+            INSERT INTO coverage_interval (participant_id, date, metric_type, start_time, end_time, points)
+            SELECT $1, $2, * FROM unnest($3::varchar[], $4::timestamptz[], $5::timestamptz[], $6::int[])
+        """, participant_id, date, *[list(column) for column in intervals])
+        return len(rows)
@@ -0,0 +1,64 @@
+from operator import itemgetter
+
+import numpy as np
+
+__all__ = ['decode_intraday', 'INTRADAY_DTYPE']
+
+INTRADAY_DTYPE = np.dtype([('time', 'S8'), ('value', 'f8')])
+ISO_INTRADAY_DTYPE = np.dtype([('time', 'U32'), ('value', 'f8')])
+
+CLOCK_LENGTH = len('HH:MM:SS')
+
+
+def _clock_to_timestamps(clock, date):
+    """Turn an S8 array of HH:MM:SS strings into datetime64[s] on `date`"""
+    count = len(clock)
+    chars = np.ascontiguousarray(clock).view(np.uint8).reshape(count, CLOCK_LENGTH)
+    if not ((chars[:, 2] == ord(':')) & (chars[:, 5] == ord(':'))).all():
+        raise ValueError("Intraday times must be formatted as HH:MM:SS")
+
+    digits = chars.astype(np.int32) - ord('0')
+    seconds = (
+        (digits[:, 0] * 10 + digits[:, 1]) * 3600
+        + (digits[:, 3] * 10 + digits[:, 4]) * 60
+        + digits[:, 6] * 10 + digits[:, 7]
+    )
+    return np.datetime64(date, 's') + seconds.astype('timedelta64[s]')
+
+
+def decode_intraday(dataset, date, time_key='time', value_key=None):
+    """
+    Decode an intraday `dataset` ([{'time': 'HH:MM:SS', 'value': v}, ...])
+    recorded on `date` into (datetime64[s] timestamps, float64 values).
+    The entries are walked once, the clock strings are then turned into
+    offsets from midnight with array arithmetic instead of strptime.
+
+    `time_key` names the time field ('minute' for the per-minute payloads,
+    which may also carry full ISO timestamps) and `value_key` picks one
+    field out of dict-valued samples such as HRV or active zone minutes.
+    Samples without that field are dropped rather than stored as 0.
+    """
+    count = len(dataset)
+    if count == 0:
+        return np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float64)
+
+    if value_key is None:
+        getter = itemgetter(time_key, 'value')
+    else:
+        def getter(entry):
+            value = entry['value'].get(value_key)
+            return entry[time_key], np.nan if value is None else value
+
+    if len(dataset[0][time_key]) == CLOCK_LENGTH:
+        records = np.array(list(map(getter, dataset)), dtype=INTRADAY_DTYPE)
+        timestamps = _clock_to_timestamps(records['time'], date)
+    else:
+        records = np.array(list(map(getter, dataset)), dtype=ISO_INTRADAY_DTYPE)
+        timestamps = records['time'].astype('datetime64[s]')
+
+    values = records['value']
+    if value_key is not None:
+        present = ~np.isnan(values)
+        if not present.all():
+            return timestamps[present], values[present]
+    return timestamps, np.ascontiguousarray(values)
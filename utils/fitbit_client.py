@@ -0,0 +1,172 @@
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+__all__ = ['FitbitClient', 'FitbitDayReader', 'TokenBucket', 'FitbitAPIError', 'FitbitAuthError',
+           'FITBIT_API_URL', 'FITBIT_HOURLY_QUOTA']
+
+FITBIT_API_URL = 'https://api.fitbit.com'
+# Requests per user per hour the Web API allows
+FITBIT_HOURLY_QUOTA = 150
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class FitbitAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Fitbit API returned {status}: {message}")
+        self.status = status
+
+
+class FitbitAuthError(FitbitAPIError):
+    """The token was rejected, retrying won't help until the participant re-authorizes"""
+
+
+class TokenBucket(object):
+    """
+    Holds at most `capacity` requests and refills continuously at
+    `capacity` per `period` seconds, so a full hour's quota can be spent
+    in a burst and then paces itself. One bucket per Fitbit user, shared
+    by every request made with that user's token.
+    """
+    def __init__(self, capacity=FITBIT_HOURLY_QUOTA, period=3600.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait for a request's worth of quota, waiters are served in order"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def sync(self, remaining, reset_seconds):
+        """
+        Adopt the server's count from the Fitbit-Rate-Limit headers when it
+        is lower, e.g. after another client spent part of the quota. With
+        nothing remaining the next request waits until the reset.
+        """
+        self._refill()
+        self.tokens = min(self.tokens, float(remaining))
+        if remaining <= 0:
+            self.tokens = min(self.tokens, 1 - reset_seconds * self.rate)
+
+
+class FitbitClient(object):
+    """
+    Async Web API client over one pooled keep-alive session. Requests are
+    paced by the caller's TokenBucket and retried on 429, 5xx and network
+    errors with full-jitter exponential backoff, never sooner than a
+    Retry-After the server sent.
+    """
+    def __init__(self, base_url=FITBIT_API_URL, concurrency=4, max_retries=5, backoff_base=1.0, backoff_cap=60.0,
+                 timeout=30.0, on_response=None):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        # Called with the status of every response, or None for a network error
+        self.on_response = on_response
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    @staticmethod
+    def _sync_quota(bucket, headers):
+        remaining, reset = headers.get('Fitbit-Rate-Limit-Remaining'), headers.get('Fitbit-Rate-Limit-Reset')
+        if remaining is not None and reset is not None:
+            try:
+                bucket.sync(int(remaining), float(reset))
+            except ValueError:
+                pass
+
+    def _observe(self, status):
+        if self.on_response is not None:
+            self.on_response(status)
+
+    async def get(self, path, token, bucket):
+        """Body of a GET on `path`, raises FitbitAPIError once retries are used up"""
+        headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                async with self.session.get(self.base_url + path, headers=headers) as response:
+                    self._observe(response.status)
+                    self._sync_quota(bucket, response.headers)
+                    body = await response.read()
+                    if response.status == 200:
+                        return body
+                    message = body[:200].decode('utf-8', 'replace')
+                    if response.status in (401, 403):
+                        raise FitbitAuthError(response.status, message)
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        raise FitbitAPIError(response.status, message)
+                    delay = self._backoff(attempt, response.headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._observe(None)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            await asyncio.sleep(delay)
+
+
+class FitbitDayReader(object):
+    """
+    One metric's days from the Web API, indexed like SyntheticDataReader
+    from `first_date` on. `endpoint` is a path with a {date} placeholder,
+    and `response_key` names the list whose first element is the day when
+    the API wraps it, so the loaders see the same payload in both modes.
+    """
+    def __init__(self, client, token, bucket, endpoint, first_date, days, response_key=None):
+        self.client = client
+        self.token = token
+        self.bucket = bucket
+        self.endpoint = endpoint
+        self.first_date = first_date
+        self.days = days
+        self.response_key = response_key
+
+    def __len__(self):
+        return self.days
+
+    def date(self, index):
+        return self.first_date.fromordinal(self.first_date.toordinal() + index)
+
+    async def fetch_day(self, index):
+        """Raw JSON bytes of a single day by its 0-based position from first_date"""
+        body = await self.client.get(self.endpoint.format(date=self.date(index).isoformat()), self.token, self.bucket)
+        if self.response_key is None:
+            return body
+        return json.dumps(json.loads(body)[self.response_key][0]).encode('utf-8')
@@ -0,0 +1,137 @@
+import codecs
+import json
+import os
+from pathlib import Path
+
+__all__ = ['SyntheticDataReader']
+
+
+class SyntheticDataReader(object):
+    """
+    Random access over a JSON file holding one top-level array of days.
+    The byte range of every element is found once with an incremental
+    decoder and cached next to the file, after that a day is read by
+    seeking to its offset, so only one day is ever held in memory.
+    """
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(f".{self.path.name}.idx")
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def offsets(self):
+        """List of (start, end) byte offsets, one per top-level element"""
+        if self._offsets is None:
+            stat = os.stat(self.path)
+            self._offsets = self._load_index(stat)
+            if self._offsets is None:
+                self._offsets = self._build_index()
+                self._save_index(stat)
+        return self._offsets
+
+    def read_day(self, index):
+        """Raw JSON bytes of a single day by its 0-based position in the file"""
+        start, end = self.offsets[index]
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            return file.read(end - start)
+
+    def day(self, index):
+        """Decode a single day by its 0-based position in the file"""
+        return json.loads(self.read_day(index))
+
+    def iter_days(self, start=0, stop=None):
+        """Yield days in order from `start` up to (not including) `stop`"""
+        offsets = self.offsets[start:stop]
+        with open(self.path, 'rb') as file:
+            for begin, end in offsets:
+                file.seek(begin)
+                yield json.loads(file.read(end - begin))
+
+    def _load_index(self, stat):
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if index.get('size') != stat.st_size or index.get('mtime_ns') != stat.st_mtime_ns:
+            return None
+        return [tuple(offset) for offset in index['offsets']]
+
+    def _save_index(self, stat):
+        index = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'offsets': self._offsets}
+        try:
+            with open(self.index_path, 'w') as file:
+                json.dump(index, file)
+        except OSError:
+            # A read-only data directory only costs us a re-scan next run
+            pass
+
+    def _build_index(self):
+        """Scan the array once, decoding one element at a time to find its byte range"""
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder('utf-8')()
+        offsets = []
+
+        with open(self.path, 'rb') as file:
+            buffer = ''
+            base = 0
+            eof = False
+            opened = False
+
+            def fill(size):
+                nonlocal buffer, eof
+                chunk = file.read(size)
+                eof = not chunk
+                buffer += utf8.decode(chunk, final=eof)
+
+            def consume(count):
+                nonlocal buffer, base
+                base += len(buffer[:count].encode('utf-8'))
+                buffer = buffer[count:]
+
+            fill(self.CHUNK_SIZE)
+            while True:
+                stripped = len(buffer) - len(buffer.lstrip())
+                consume(stripped)
+                if not buffer:
+                    if eof:
+                        raise json.JSONDecodeError("Unterminated array", '', base)
+                    fill(self.CHUNK_SIZE)
+                    continue
+
+                if not opened:
+                    if buffer[0] != '[':
+                        raise json.JSONDecodeError("Expected a top-level array", buffer, 0)
+                    opened = True
+                    consume(1)
+                    continue
+
+                if buffer[0] == ']':
+                    break
+                if buffer[0] == ',' and offsets:
+                    consume(1)
+                    continue
+
+                try:
+                    _, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill(max(self.CHUNK_SIZE, len(buffer)))
+                    continue
+                if end == len(buffer) and not eof:
+                    # A scalar cut at the chunk edge can look complete
+                    fill(self.CHUNK_SIZE)
+                    continue
+
+                start = base
+                consume(end)
+                offsets.append((start, base))
+
+        return offsets